@@ -1,12 +1,14 @@
 import streamlit as st
-import plotly.express as px
 from datetime import datetime, timedelta
-from utils.overview_helper import (load_data, calculate_open_positions, calculate_portfolio_metrics, get_date_range_label)
-from utils.settings_handler import get_lang
-import calendar
-import plotly.graph_objects as go
+from utils.analytics_worker import current_snapshot
+from utils.overview_helper import get_date_range_label, create_monthly_calendar_view
+from utils.valuation import value_open_positions
+from utils.pricing import PRICING_RATE, price_open_warrants
+from utils.settings_handler import get_lang, init_user
+from utils.profiler import profile_page, section
 
 st.set_page_config(page_title="Derivate Tracker Dashboard", page_icon="📈", layout="wide", initial_sidebar_state="expanded")
+init_user()
 
 T = get_lang()
 
@@ -73,160 +75,31 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def create_monthly_calendar_view(df, year, month):
-    """Creates a real calendar view for a specific month with dark mode"""
-    if df.empty:
-        return None
-
-    # Filter data for the selected month
-    month_start = datetime(year, month, 1)
-    if month == 12:
-        month_end = datetime(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        month_end = datetime(year, month + 1, 1) - timedelta(days=1)
-
-    month_df = df[(df['date'] >= month_start) & (df['date'] <= month_end)]
-
-    # Daily aggregation for the month
-    daily_data = month_df.groupby(month_df['date'].dt.date).agg({
-        'gain': 'sum',
-        'transaction_id': 'count'
-    }).reset_index()
-    daily_data.columns = ['date', 'daily_pnl', 'trade_count']
-
-    # Create dictionary for quick access
-    daily_dict = {}
-    for _, row in daily_data.iterrows():
-        daily_dict[row['date']] = {
-            'pnl': row['daily_pnl'],
-            'trades': row['trade_count']
-        }
-
-    # Create calendar
-    cal = calendar.monthcalendar(year, month)
-    month_name = calendar.month_name[month]
-
-    # Create Plotly Figure with Dark Mode Theme
-    fig = go.Figure()
-
-    # Weekdays Header
-    weekdays = T["weekdays_short"]
-
-    for week_num, week in enumerate(cal):
-        for day_num, day in enumerate(week):
-            if day == 0:
-                continue
-
-            day_date = datetime(year, month, day).date()
-            day_data = daily_dict.get(day_date, {'pnl': 0, 'trades': 0})
-
-            # Determine color based on P&L (dark mode optimized)
-            if day_data['pnl'] > 0:
-                color = 'rgba(76, 175, 80, 0.9)'  # Green
-                text_color = 'white'
-            elif day_data['pnl'] < 0:
-                color = 'rgba(244, 67, 54, 0.9)'  # Red
-                text_color = 'white'
-            else:
-                color = 'rgba(60, 60, 60, 0.8)'  # Dark gray for dark mode
-                text_color = '#E0E0E0'
-
-            # Larger rectangles for better display
-            fig.add_shape(
-                type="rect",
-                x0=day_num * 1.2, y0=-(week_num + 1) * 1.5, x1=day_num * 1.2 + 1.1, y1=-(week_num + 0.1) * 1.5,
-                fillcolor=color,
-                line=dict(color="rgba(255,255,255,0.3)", width=1)
-            )
-
-            # Tag number - larger and better positioned
-            fig.add_annotation(
-                x=day_num * 1.2 + 0.55, y=-(week_num + 0.15) * 1.5,
-                text=f"<b>{day}</b>",
-                showarrow=False,
-                font=dict(size=16, color=text_color),
-                xanchor="center", yanchor="top"
-            )
-
-            # Display P&L and trades (if available) - better positioning
-            if day_data['trades'] > 0:
-                # P&L in larger font
-                fig.add_annotation(
-                    x=day_num * 1.2 + 0.55, y=-(week_num + 0.5) * 1.5,
-                    text=f"<b>€{day_data['pnl']:.0f}</b>",
-                    showarrow=False,
-                    font=dict(size=20, color=text_color),
-                    xanchor="center", yanchor="middle"
-                )
-
-                # Trade Count in smaller font
-                fig.add_annotation(
-                    x=day_num * 1.2 + 0.55, y=-(week_num + 0.8) * 1.5,
-                    text=f"{day_data['trades']} T",
-                    showarrow=False,
-                    font=dict(size=15, color=text_color),
-                    xanchor="center", yanchor="bottom"
-                )
-
-    # Add weekday header - customized positioning
-    for i, weekday in enumerate(weekdays):
-        fig.add_annotation(
-            x=i * 1.2 + 0.55, y=0.4,
-            text=f"<b>{weekday}</b>",
-            showarrow=False,
-            font=dict(size=14, color="#E0E0E0"),
-            xanchor="center", yanchor="bottom"
-        )
-
-    # Configure layout - Dark Mode Theme
-    fig.update_layout(
-        xaxis=dict(
-            range=[-0.2, 8.5],
-            showgrid=False,
-            showticklabels=False,
-            zeroline=False
-        ),
-        yaxis=dict(
-            range=[-(len(cal) + 0.5) * 1.5, 0.6],
-            showgrid=False,
-            showticklabels=False,
-            zeroline=False
-        ),
-        height=760,
-        plot_bgcolor='rgba(30, 30, 30, 1)',  # Dark background
-        paper_bgcolor='rgba(30, 30, 30, 1)',  # Dark paper background
-        showlegend=False,
-        margin=dict(l=20, r=20, t=20, b=20)
-    )
-
-    return fig
-
-
-
 def main():
     # Header
     st.title(T["title_overview_site"])
 
-    # load data
+    # Latest analytics snapshot (rebuilt in the background after writes)
     try:
-        df = load_data()
+        with section("load_data"):
+            snapshot, fresh = current_snapshot()
     except Exception as e:
         st.error(f"{T['error_loading']} {e}")
         st.info(T["db_loading_error"])
         return
 
+    df = snapshot.df
     if df.empty:
         st.warning(T["db_no_data_error"])
         return
 
-    # Calculate portfolio metrics (based on all data)
-    metrics = calculate_portfolio_metrics(df)
-
-    # Calculate open positions
-    open_positions = calculate_open_positions(df)
+    metrics = snapshot.metrics
+    open_positions = snapshot.open_positions
 
     # Key performance indicators with tile design
     st.subheader(T["kpi_subheader"])
+    if not fresh:
+        st.caption(T["analytics_refreshing"])
 
     col1, col2, col3, col4, col5 = st.columns(5)
 
@@ -280,6 +153,29 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
+    # Mark-to-market valuation of the open positions (cached per quote state and snapshot)
+    valuation = None
+    if not open_positions.empty:
+        try:
+            with section("valuation"):
+                valuation = value_open_positions(snapshot)
+        except Exception as e:
+            st.warning(f"{T['valuation_error']} {e}")
+
+    if valuation is not None:
+        totals = valuation.totals
+        st.subheader(T["valuation_subheader"])
+        if totals["quoted"]:
+            unrealised_pct = totals["unrealised"] / totals["cost"] * 100 if totals["cost"] else 0.0
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric(T["market_value"], f"€ {totals['market_value']:,.2f}")
+            col2.metric(T["unrealised_p_l"], f"€ {totals['unrealised']:,.2f}", f"{unrealised_pct:+.2f}%")
+            col3.metric(T["day_change"], f"€ {totals['day_change']:,.2f}")
+            col4.metric(T["exposure"], f"€ {totals['exposure']:,.2f}")
+            st.caption(T["valuation_as_of"].format(**totals))
+        else:
+            st.info(T["valuation_no_quotes"])
+
     # Open positions detail view
     if not open_positions.empty:
         st.subheader(T["open_positions_details"])
@@ -287,9 +183,44 @@ def main():
         open_positions_display = open_positions.copy()
         open_positions_display['total_price'] = open_positions_display['total_price'].apply(lambda x: f"€ {x:,.2f}")
         open_positions_display.columns = T["open_positions_display_columns"]
+        if valuation is not None and valuation.totals["quoted"]:
+            valued = valuation.positions[['wkn', 'price', 'market_value', 'unrealised', 'unrealised_pct', 'day_change']]
+            valued.columns = T["open_positions_valuation_columns"]
+            open_positions_display = open_positions_display.join(valued.round(2))
 
         st.dataframe(open_positions_display, use_container_width=True)
 
+    # Black-Scholes value and Greeks of the open warrant positions
+    try:
+        with section("pricing"):
+            pricing = price_open_warrants()
+    except Exception as e:
+        pricing = None
+        st.warning(f"{T['greeks_error']} {e}")
+
+    if pricing is not None and pricing.totals["positions"]:
+        totals = pricing.totals
+        st.subheader(T["greeks_subheader"])
+        if totals["priced"]:
+            col1, col2, col3, col4, col5 = st.columns(5)
+            col1.metric(T["greeks_value"], f"€ {totals['value']:,.2f}")
+            col2.metric(T["greeks_delta"], f"€ {totals['cash_delta']:,.2f}")
+            col3.metric(T["greeks_gamma"], f"€ {totals['cash_gamma']:,.2f}")
+            col4.metric(T["greeks_vega"], f"€ {totals['vega']:,.2f}")
+            col5.metric(T["greeks_theta"], f"€ {totals['theta']:,.2f}")
+            st.caption(T["greeks_caption"].format(rate=PRICING_RATE, **totals))
+            with st.expander(T["greeks_details"]):
+                warrants = pricing.positions[pricing.positions["value"].notna()]
+                warrants = warrants[['label', 'open_qty', 'spot', 'expiry_date', 'volatility', 'value', 'delta',
+                                     'position_value']].round(4)
+                warrants.columns = T["greeks_display_columns"]
+                st.dataframe(warrants, use_container_width=True, hide_index=True)
+        else:
+            st.info(T["greeks_not_priced"])
+
+    # plotly.express is loaded after the KPIs have been rendered
+    import plotly.express as px
+
     # Profit/loss analysis - ONLY for the line chart
     st.subheader(T["p_l_analysis"])
 
@@ -297,44 +228,47 @@ def main():
     period_translations = T.get("period_translations", {})
     selected_timeframe = st.selectbox(T["period_cumulative_chart"], time_options, key="data_range_label")
 
-    # Filter data based on time frame
+    # Filter data based on time frame (daily P&L rollup of the snapshot)
+    daily_pnl = snapshot.daily_pnl
     if selected_timeframe == T["last_thirty_days"]:
         cutoff_date = datetime.now() - timedelta(days=30)
-        chart_df = df[df['date'] >= cutoff_date]
+        chart_df = daily_pnl[daily_pnl['date'] >= cutoff_date]
         chart_title = T["cumulative_p_l_last_30_days"]
     elif selected_timeframe == T["last_365_days"]:
         cutoff_date = datetime.now() - timedelta(days=365)
-        chart_df = df[df['date'] >= cutoff_date]
+        chart_df = daily_pnl[daily_pnl['date'] >= cutoff_date]
         chart_title = T["cumulative_p_l_last_365_days"]
     else:
-        chart_df = df
+        chart_df = daily_pnl
         chart_title = T["cumulative_p_l_full"]
 
     # Profit/loss chart
     if not chart_df.empty:
-        # Cumulative gain over time
-        df_daily = chart_df.groupby('date')['gain'].sum().cumsum().reset_index()
-
-        # Customized X-axis labeling
-        date_range_label = get_date_range_label(chart_df, selected_timeframe)
-
-        fig_timeline = px.line(
-            df_daily,
-            x='date',
-            y='gain',
-            title=chart_title,
-            labels={'gain': T["cumulative_win"], 'date': f'{T["date"]} ({date_range_label})'}
-        )
-        fig_timeline.update_layout(height=400)
-        fig_timeline.update_traces(line_color='#667eea', line_width=3)
+        # Cumulative gain over time within the selected period
+        with section("timeline_figure"):
+            df_daily = chart_df[['date']].assign(gain=chart_df['gain'].cumsum())
 
-        # Improve X-axis formatting
-        fig_timeline.update_xaxes(
-            title_text=f"{T['date']} ({date_range_label})",
-            tickformat='%d.%m.%Y'
-        )
+            # Customized X-axis labeling
+            date_range_label = get_date_range_label(chart_df, selected_timeframe)
+
+            fig_timeline = px.line(
+                df_daily,
+                x='date',
+                y='gain',
+                title=chart_title,
+                labels={'gain': T["cumulative_win"], 'date': f'{T["date"]} ({date_range_label})'}
+            )
+            fig_timeline.update_layout(height=400)
+            fig_timeline.update_traces(line_color='#667eea', line_width=3)
 
-        st.plotly_chart(fig_timeline, use_container_width=True)
+            # Improve X-axis formatting
+            fig_timeline.update_xaxes(
+                title_text=f"{T['date']} ({date_range_label})",
+                tickformat='%d.%m.%Y'
+            )
+
+        with section("render_charts"):
+            st.plotly_chart(fig_timeline, use_container_width=True)
     else:
         st.info(T["no_data_for_period"])
 
@@ -355,11 +289,16 @@ def main():
     # Year
     with col2:
         # Determine available years from the data
-        available_years = sorted(df['date'].dt.year.unique()) if not df.empty else [current_date.year]
+        available_years = snapshot.years or [current_date.year]
         selected_year = st.selectbox(f"{T['year']}:", available_years, index=len(available_years) - 1, key="selected_year")
 
     # Create calendar
-    calendar_fig = create_monthly_calendar_view(df, selected_year, month_number)
+    month_start = datetime(selected_year, month_number, 1)
+    month_end = datetime(selected_year + 1, 1, 1) if month_number == 12 else datetime(selected_year, month_number + 1, 1)
+    with section("calendar_figure"):
+        month_daily = daily_pnl[(daily_pnl['date'] >= month_start) & (daily_pnl['date'] < month_end)]
+        calendar_fig = create_monthly_calendar_view(month_daily, selected_year, month_number, weekdays=T["weekdays_short"],
+                                                    theme=st.session_state.get("theme_mode", "dark"))
     if calendar_fig:
         st.plotly_chart(calendar_fig, use_container_width=True)
     else:
@@ -371,42 +310,36 @@ def main():
     with col1:
         st.subheader(T["performance_by_basis_product"])
         if not df.empty:
-            basis_performance = df.groupby('basis_product')['gain'].sum().reset_index()
-
-            fig_basis = px.bar(
-                basis_performance,
-                x='basis_product',
-                y='gain',
-                title=T["p_l_by_basis_product"],
-                labels={'gain': T["p_l_euro"], 'basis_product': T["base_value"]},
-                color='gain',
-                color_continuous_scale='RdYlGn'
-            )
-            fig_basis.update_layout(height=400)
+            with section("breakdown_figures"):
+                fig_basis = px.bar(
+                    snapshot.basis_performance,
+                    x='basis_product',
+                    y='gain',
+                    title=T["p_l_by_basis_product"],
+                    labels={'gain': T["p_l_euro"], 'basis_product': T["base_value"]},
+                    color='gain',
+                    color_continuous_scale='RdYlGn'
+                )
+                fig_basis.update_layout(height=400)
             st.plotly_chart(fig_basis, use_container_width=True)
 
     with col2:
         st.subheader(T["performace_by_stragey"])
         if not df.empty:
-            direction_perf = df.groupby('direction').agg({
-                'gain': 'sum',
-                'transaction_id': 'count'
-            }).reset_index()
-            direction_perf.columns = ['direction', 'total_gain', 'trade_count']
-
-            fig_direction = px.bar(
-                direction_perf,
-                x='direction',
-                y='total_gain',
-                title=T["p_l_by_strategy"],
-                labels={
-                    'total_gain': T["total_gain"],
-                    'direction': T["strategy"]
-                },
-                color='total_gain',
-                color_continuous_scale='RdYlGn'
-            )
-            fig_direction.update_layout(height=400)
+            with section("breakdown_figures"):
+                fig_direction = px.bar(
+                    snapshot.direction_performance,
+                    x='direction',
+                    y='total_gain',
+                    title=T["p_l_by_strategy"],
+                    labels={
+                        'total_gain': T["total_gain"],
+                        'direction': T["strategy"]
+                    },
+                    color='total_gain',
+                    color_continuous_scale='RdYlGn'
+                )
+                fig_direction.update_layout(height=400)
             st.plotly_chart(fig_direction, use_container_width=True)
 
     # detailed transaction overview
@@ -418,32 +351,24 @@ def main():
     column_mapping = T["column_mapping"]
     with col1:
         st.subheader(T["top_performer"])
-        top_winners = df.nlargest(5, 'gain')[['date', 'name', 'wkn', 'gain']]
-        top_winners['date'] = top_winners['date'].dt.strftime('%d.%m.%Y')
-        st.dataframe(top_winners.rename(columns=column_mapping), use_container_width=True)
+        st.dataframe(snapshot.top_winners.rename(columns=column_mapping), use_container_width=True)
 
     with col2:
         st.subheader(T["worst_performer"])
-        top_losers = df.nsmallest(5, 'gain')[['date', 'name', 'wkn', 'gain']]
-        top_losers['date'] = top_losers['date'].dt.strftime('%d.%m.%Y')
-        st.dataframe(top_losers.rename(columns=column_mapping), use_container_width=True)
+        st.dataframe(snapshot.top_losers.rename(columns=column_mapping), use_container_width=True)
 
     # all transactions
     st.subheader(T["all_transactions"])
 
-    display_columns = [
-        'date', 'name', 'wkn', 'product_type', 'action', 'qty', 'price', 'total_price', 'gain'
-    ]
-
-    display_df = df[display_columns].copy()
-    display_df['date'] = display_df['date'].dt.strftime('%d.%m.%Y')
-    display_df = display_df.rename(columns=column_mapping)
-    st.dataframe(
-        display_df.sort_values(T["date"], ascending=False),
-        use_container_width=True,
-        height=400
-    )
+    # Prepared by the snapshot, newest first
+    with section("dataframe_render"):
+        st.dataframe(
+            snapshot.transactions.rename(columns=column_mapping),
+            use_container_width=True,
+            height=400
+        )
 
 if __name__=="__main__":
-    main()
+    with profile_page("overview"):
+        main()
 
@@ -0,0 +1,98 @@
+"""
+Throughput of the knock-out barrier monitor.
+
+Builds a synthetic book of Long/Short knock-out barriers spread around the
+start price of every underlying and feeds random-walk price ticks through
+``BarrierBook.tick`` (bisect per tick), through ``monitor`` (tick lines
+including parsing) and, for comparison, through a linear scan over all
+barriers of the underlying. Reported per book size: ticks per second and the
+number of knock-outs. No database is needed.
+
+    python -m benchmarks.bench_barriers
+    python -m benchmarks.bench_barriers --barriers 1000 10000 --ticks 200000
+"""
+import argparse
+import random
+import time
+
+from utils.barrier_monitor import LONG, SHORT, Barrier, BarrierBook, monitor
+
+UNDERLYINGS = 12
+START_PRICE = 100.0
+
+
+def make_barriers(n, seed=1):
+    rng = random.Random(seed)
+    barriers = []
+    for trade_id in range(n):
+        direction = rng.choice((LONG, SHORT))
+        # Longs below, shorts above the start price, 2-40% away
+        distance = START_PRICE * rng.uniform(0.02, 0.4)
+        strike = round(START_PRICE - distance if direction == LONG else START_PRICE + distance, 2)
+        barriers.append(Barrier(trade_id, trade_id, f"KO {trade_id}", f"U{trade_id % UNDERLYINGS:02d}", direction,
+                                strike, 100.0))
+    return barriers
+
+
+def make_ticks(n, seed=1, volatility=0.0005):
+    rng = random.Random(seed)
+    prices = [START_PRICE] * UNDERLYINGS
+    ticks = []
+    for _ in range(n):
+        u = rng.randrange(UNDERLYINGS)
+        prices[u] *= 1 + rng.gauss(0, volatility)
+        ticks.append((f"U{u:02d}", prices[u]))
+    return ticks
+
+
+def run_book(barriers, ticks):
+    book = BarrierBook(barriers)
+    knocked = 0
+    start = time.perf_counter()
+    for underlying, price in ticks:
+        knocked += len(book.tick(underlying, price))
+    return time.perf_counter() - start, knocked
+
+
+def run_monitor(barriers, ticks):
+    lines = [f"{underlying},{price:.4f}\n" for underlying, price in ticks]
+    knocked = []
+    start = time.perf_counter()
+    monitor(lines, knocked.append, book=BarrierBook(barriers))
+    return time.perf_counter() - start, len(knocked)
+
+
+def run_scan(barriers, ticks):
+    alive = {}
+    for barrier in barriers:
+        alive.setdefault(barrier.underlying, []).append(barrier)
+    knocked = 0
+    start = time.perf_counter()
+    for underlying, price in ticks:
+        candidates = alive.get(underlying, [])
+        hit = [b for b in candidates if (price <= b.strike if b.direction == LONG else price >= b.strike)]
+        if hit:
+            knocked += len(hit)
+            alive[underlying] = [b for b in candidates if b not in hit]
+    return time.perf_counter() - start, knocked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--barriers", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--ticks", type=int, default=200_000)
+    parser.add_argument("--scan-ticks", type=int, default=20_000, help="ticks for the (slow) linear scan")
+    args = parser.parse_args()
+
+    ticks = make_ticks(args.ticks)
+    print(f"{'barriers':>8} {'mode':<12} {'ticks/s':>12} {'knock-outs':>11}")
+    for n in args.barriers:
+        barriers = make_barriers(n)
+        for mode, run, mode_ticks in (("bisect", run_book, ticks), ("monitor", run_monitor, ticks),
+                                      ("linear scan", run_scan, ticks[:args.scan_ticks])):
+            seconds, knocked = run(barriers, mode_ticks)
+            print(f"{n:>8,} {mode:<12} {len(mode_ticks) / seconds:>12,.0f} {knocked:>11,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark for the monthly trading calendar.
+
+Compares the single-heatmap renderer (overview_helper.create_monthly_calendar_view)
+with the former implementation that added one shape and up to three annotations
+per day: figure build time and serialized JSON size.
+
+    python -m benchmarks.bench_calendar --rows 100000
+"""
+import argparse
+import calendar
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils.overview_helper import aggregate_daily, create_monthly_calendar_view
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def legacy_calendar_view(df, year, month, weekdays):
+    """Former per-day shape/annotation implementation (1_Overview.py), kept as reference."""
+    if df.empty:
+        return None
+
+    # Filter data for the selected month
+    month_start = datetime(year, month, 1)
+    if month == 12:
+        month_end = datetime(year + 1, 1, 1) - timedelta(days=1)
+    else:
+        month_end = datetime(year, month + 1, 1) - timedelta(days=1)
+
+    month_df = df[(df['date'] >= month_start) & (df['date'] <= month_end)]
+
+    # Daily aggregation for the month
+    daily_data = month_df.groupby(month_df['date'].dt.date).agg({
+        'gain': 'sum',
+        'transaction_id': 'count'
+    }).reset_index()
+    daily_data.columns = ['date', 'daily_pnl', 'trade_count']
+
+    # Create dictionary for quick access
+    daily_dict = {}
+    for _, row in daily_data.iterrows():
+        daily_dict[row['date']] = {
+            'pnl': row['daily_pnl'],
+            'trades': row['trade_count']
+        }
+
+    # Create calendar
+    cal = calendar.monthcalendar(year, month)
+    month_name = calendar.month_name[month]
+
+    # Create Plotly Figure with Dark Mode Theme
+    fig = go.Figure()
+
+    # Weekdays Header
+
+    for week_num, week in enumerate(cal):
+        for day_num, day in enumerate(week):
+            if day == 0:
+                continue
+
+            day_date = datetime(year, month, day).date()
+            day_data = daily_dict.get(day_date, {'pnl': 0, 'trades': 0})
+
+            # Determine color based on P&L (dark mode optimized)
+            if day_data['pnl'] > 0:
+                color = 'rgba(76, 175, 80, 0.9)'  # Green
+                text_color = 'white'
+            elif day_data['pnl'] < 0:
+                color = 'rgba(244, 67, 54, 0.9)'  # Red
+                text_color = 'white'
+            else:
+                color = 'rgba(60, 60, 60, 0.8)'  # Dark gray for dark mode
+                text_color = '#E0E0E0'
+
+            # Larger rectangles for better display
+            fig.add_shape(
+                type="rect",
+                x0=day_num * 1.2, y0=-(week_num + 1) * 1.5, x1=day_num * 1.2 + 1.1, y1=-(week_num + 0.1) * 1.5,
+                fillcolor=color,
+                line=dict(color="rgba(255,255,255,0.3)", width=1)
+            )
+
+            # Tag number - larger and better positioned
+            fig.add_annotation(
+                x=day_num * 1.2 + 0.55, y=-(week_num + 0.15) * 1.5,
+                text=f"<b>{day}</b>",
+                showarrow=False,
+                font=dict(size=16, color=text_color),
+                xanchor="center", yanchor="top"
+            )
+
+            # Display P&L and trades (if available) - better positioning
+            if day_data['trades'] > 0:
+                # P&L in larger font
+                fig.add_annotation(
+                    x=day_num * 1.2 + 0.55, y=-(week_num + 0.5) * 1.5,
+                    text=f"<b>€{day_data['pnl']:.0f}</b>",
+                    showarrow=False,
+                    font=dict(size=20, color=text_color),
+                    xanchor="center", yanchor="middle"
+                )
+
+                # Trade Count in smaller font
+                fig.add_annotation(
+                    x=day_num * 1.2 + 0.55, y=-(week_num + 0.8) * 1.5,
+                    text=f"{day_data['trades']} T",
+                    showarrow=False,
+                    font=dict(size=15, color=text_color),
+                    xanchor="center", yanchor="bottom"
+                )
+
+    # Add weekday header - customized positioning
+    for i, weekday in enumerate(weekdays):
+        fig.add_annotation(
+            x=i * 1.2 + 0.55, y=0.4,
+            text=f"<b>{weekday}</b>",
+            showarrow=False,
+            font=dict(size=14, color="#E0E0E0"),
+            xanchor="center", yanchor="bottom"
+        )
+
+    # Configure layout - Dark Mode Theme
+    fig.update_layout(
+        xaxis=dict(
+            range=[-0.2, 8.5],
+            showgrid=False,
+            showticklabels=False,
+            zeroline=False
+        ),
+        yaxis=dict(
+            range=[-(len(cal) + 0.5) * 1.5, 0.6],
+            showgrid=False,
+            showticklabels=False,
+            zeroline=False
+        ),
+        height=760,
+        plot_bgcolor='rgba(30, 30, 30, 1)',  # Dark background
+        paper_bgcolor='rgba(30, 30, 30, 1)',  # Dark paper background
+        showlegend=False,
+        margin=dict(l=20, r=20, t=20, b=20)
+    )
+
+    return fig
+
+
+
+def main():
+    # Header
+    st.title(T["title_overview_site"])
+
+    # load data
+    try:
+        df = load_data()
+    except Exception as e:
+        st.error(f"{T['error_loading']} {e}")
+
+def make_frame(rows, year, seed=3):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64(f"{year}-01-01")
+    return pd.DataFrame({
+        'transaction_id': np.arange(rows),
+        'date': pd.to_datetime(start + rng.integers(0, 365, rows).astype('timedelta64[D]')),
+        'gain': np.round(rng.normal(0, 150, rows), 2),
+    })
+
+
+def measure(build, repeat):
+    best = float('inf')
+    fig = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = build()
+        best = min(best, time.perf_counter() - start)
+    start = time.perf_counter()
+    size = len(fig.to_json())
+    serialize = time.perf_counter() - start
+    return best, serialize, size, len(fig.layout.shapes) + len(fig.layout.annotations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--year', type=int, default=2024)
+    parser.add_argument('--month', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.year)
+    cases = {
+        'heatmap': lambda: create_monthly_calendar_view(aggregate_daily(df), args.year, args.month, weekdays=WEEKDAYS),
+        'legacy': lambda: legacy_calendar_view(df, args.year, args.month, WEEKDAYS),
+    }
+
+    print(f"{'renderer':<10} {'build':>10} {'to_json':>10} {'json size':>12} {'layout objs':>12}")
+    for name, build in cases.items():
+        build_time, serialize, size, objects = measure(build, args.repeat)
+        print(f"{name:<10} {build_time * 1000:>8.1f}ms {serialize * 1000:>8.1f}ms {size / 1024:>10.1f}KB {objects:>12}")
+
+
+if __name__ == '__main__':
+    main()
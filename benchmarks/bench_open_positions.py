@@ -0,0 +1,87 @@
+"""
+Benchmark for overview_helper.calculate_open_positions.
+
+Compares the vectorized implementation with the former per-group lambda
+aggregation on synthetic transaction frames and checks that both return the
+same result.
+
+    python -m benchmarks.bench_open_positions
+    python -m benchmarks.bench_open_positions --rows 10000 100000 1000000 --legacy-limit 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.overview_helper import calculate_open_positions
+
+
+def legacy_open_positions(df):
+    """Implementation before vectorization, kept as reference."""
+    if df.empty:
+        return pd.DataFrame()
+
+    position_data = df.groupby(['Trade ID', 'name']).agg({
+        'open_qty': lambda x: sum(val if action == 'buy' or action == 'rebuy' else -val for val, action in zip(x, df.loc[x.index, 'action'])),
+        'total_price': lambda x: sum(
+            val if action == 'buy' or action == 'rebuy' else -val for val, action in zip(x, df.loc[x.index, 'action']))
+    })
+    position_data = position_data.reset_index(level='name')
+    return position_data[position_data['open_qty'] > 0]
+
+
+def make_frame(rows, seed=42):
+    """Synthetic overview frame: trades of 1-6 rows, about a third still open."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 7, size=rows)
+    trade_ids = np.repeat(np.arange(len(sizes)), sizes)[:rows]
+    first = np.r_[True, trade_ids[1:] != trade_ids[:-1]]
+    closed = rng.random(trade_ids.max() + 1) < 0.66
+
+    action = np.where(first, 'buy', rng.choice(['rebuy', 'partial sell', 'sell'], size=rows, p=[0.5, 0.2, 0.3]))
+    qty = rng.integers(1, 500, size=rows).astype(float)
+    open_qty = np.where(np.isin(action, ['buy', 'rebuy']), np.where(closed[trade_ids], 0, qty), 0.0)
+    open_qty[action == 'partial sell'] = np.nan
+
+    return pd.DataFrame({
+        'Trade ID': trade_ids,
+        'name': np.char.add('Long@', (trade_ids % 997).astype(str)),
+        'action': action,
+        'open_qty': open_qty,
+        'total_price': np.round(qty * rng.uniform(0.1, 20, size=rows), 2),
+    })
+
+
+def timed(func, df, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-limit', type=int, default=100_000,
+                        help='skip the legacy implementation above this many rows')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'vectorized':>12} {'legacy':>12} {'speedup':>9}")
+    for rows in args.rows:
+        df = make_frame(rows)
+        fast, fast_result = timed(calculate_open_positions, df, args.repeat)
+        if rows <= args.legacy_limit:
+            slow, slow_result = timed(legacy_open_positions, df, 1)
+            pd.testing.assert_frame_equal(fast_result, slow_result)
+            print(f"{rows:>10,} {fast * 1000:>10.1f}ms {slow * 1000:>10.1f}ms {slow / fast:>8.1f}x")
+        else:
+            print(f"{rows:>10,} {fast * 1000:>10.1f}ms {'skipped':>12} {'-':>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Speed of the vectorized warrant pricing.
+
+Times ``black_scholes`` (value and Greeks), ``implied_volatility`` (solving
+the volatilities back from the computed prices) and ``price_positions`` (the
+full valuation of open warrant positions from quotes) on synthetic books of
+calls and puts. Reports the median of several runs, the share of solved
+volatilities and whether SciPy's normal CDF was used. No database is needed.
+
+    python -m benchmarks.bench_pricing
+    python -m benchmarks.bench_pricing --warrants 1000 5000 50000 --repeat 7
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.pricing import black_scholes, has_scipy, implied_volatility, price_positions
+
+RATE = 0.02
+UNDERLYINGS = 12
+
+
+def make_book(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return {
+        "spot": rng.uniform(50, 150, n),
+        "strike": rng.uniform(50, 150, n),
+        "years": rng.uniform(0.02, 2.0, n),
+        "volatility": rng.uniform(0.1, 0.8, n),
+        "is_call": rng.random(n) < 0.5,
+        "ratio": rng.choice([1.0, 0.1, 0.01], n),
+    }
+
+
+def make_positions(book, seed=1):
+    """Positions, quotes and spots frames as ``load_warrant_positions`` and the quote sources return them."""
+    rng = np.random.default_rng(seed)
+    n = len(book["spot"])
+    underlying = np.array([f"U{i:02d}" for i in range(UNDERLYINGS)])[rng.integers(0, UNDERLYINGS, n)]
+    spots = pd.Series(book["spot"]).groupby(underlying).first()
+    today = date.today()
+    expiry = [(today + timedelta(days=int(days))).isoformat() for days in book["years"] * 365]
+    positions = pd.DataFrame({
+        "trade_id": np.arange(n), "label": [f"W{i}" for i in range(n)], "open_qty": rng.integers(100, 5000, n),
+        "price_paid": 1000.0, "wkn": [f"W{i:06d}" for i in range(n)], "basis_product": underlying,
+        "direction": np.where(book["is_call"], "Call", "Put"), "strike": book["strike"], "expiry_date": expiry,
+        "ratio": book["ratio"],
+    })
+    spot = spots.reindex(underlying).to_numpy()
+    market = black_scholes(spot, book["strike"], book["years"], RATE, book["volatility"], book["is_call"])["value"]
+    quotes = pd.DataFrame({"wkn": positions["wkn"], "ts": "2024-12-31T17:30:00", "price": market * book["ratio"],
+                           "previous_close": np.nan})
+    spot_quotes = pd.DataFrame({"underlying": spots.index, "ts": "2024-12-31T17:30:00", "price": spots.to_numpy(),
+                                "previous_close": np.nan})
+    return positions, quotes, spot_quotes
+
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--warrants", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"normal CDF: {'scipy.special.ndtr' if has_scipy() else 'NumPy approximation'}")
+    print(f"{'warrants':>8} {'black_scholes':>14} {'implied vol':>12} {'solved':>7} {'price_positions':>16}")
+    for n in args.warrants:
+        book = make_book(n)
+        args_bs = (book["spot"], book["strike"], book["years"], RATE, book["volatility"], book["is_call"])
+        bs_seconds, greeks = timed(lambda: black_scholes(*args_bs), args.repeat)
+        iv_seconds, iv = timed(lambda: implied_volatility(greeks["value"], book["spot"], book["strike"], book["years"],
+                                                          RATE, book["is_call"]), args.repeat)
+        positions, quotes, spot_quotes = make_positions(book)
+        pp_seconds, _ = timed(lambda: price_positions(positions, quotes, spot_quotes, rate=RATE), args.repeat)
+        print(f"{n:>8,} {bs_seconds * 1000:>12.2f}ms {iv_seconds * 1000:>10.2f}ms {np.mean(~np.isnan(iv)):>7.1%} "
+              f"{pp_seconds * 1000:>14.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
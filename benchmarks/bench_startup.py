@@ -0,0 +1,99 @@
+"""
+Cold-start benchmark: time to first render per page.
+
+Every page is rendered in a fresh interpreter (``python -X importtime``) with
+streamlit's AppTest, so the measurement includes all imports the page pulls in
+on its first run. Reported per page: the first (cold) and second (warm) render,
+the import time spent during the first render and the slowest imports.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --pages 1_Overview.py pages/3_Tables.py --top 8 --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["1_Overview.py", "pages/2_Transactions.py", "pages/3_Tables.py", "pages/4_Master Data.py",
+         "pages/5_Settings.py"]
+MARKER = "@@render-start@@"
+
+# Runs inside the fresh interpreter; stderr carries the -X importtime lines
+_RUNNER = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+at = AppTest.from_file({page!r}, default_timeout=120).run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+second = time.perf_counter() - start
+print(json.dumps({{"first": first, "second": second, "exceptions": [e.value for e in at.exception]}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Top-level imports after the marker as (module, cumulative seconds)."""
+    lines = stderr.split(MARKER, 1)[-1].splitlines()
+    imports = []
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Nested imports are indented below their parent
+        if name.startswith("  "):
+            continue
+        imports.append((name.strip(), int(cumulative) / 1e6))
+    return imports
+
+
+def measure_page(page, database):
+    env = dict(os.environ, DATABASE_PATH=database)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", _RUNNER.format(marker=MARKER, page=page)],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{page}: {result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(result.stderr)
+    timings["import_total"] = sum(seconds for _, seconds in imports)
+    timings["imports"] = sorted(imports, key=lambda x: x[1], reverse=True)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", nargs="+", default=PAGES)
+    parser.add_argument("--database", help="default: the generated 1k benchmark database")
+    parser.add_argument("--top", type=int, default=5, help="number of slowest imports to show per page")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    database = args.database
+    if database is None:
+        from benchmarks.datagen import database_for
+        database = database_for("1k")
+
+    results = {}
+    print(f"{'page':<26} {'first':>9} {'warm':>9} {'imports':>9}  slowest imports")
+    for page in args.pages:
+        r = measure_page(page, os.path.abspath(database))
+        results[page] = {k: v for k, v in r.items() if k != "imports"}
+        results[page]["slowest_imports"] = r["imports"][:args.top]
+        slowest = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in r["imports"][:args.top])
+        print(f"{page:<26} {r['first'] * 1000:>7.0f}ms {r['second'] * 1000:>7.0f}ms "
+              f"{r['import_total'] * 1000:>7.0f}ms  {slowest}")
+        if r["exceptions"]:
+            print(f"{'':<26} exceptions: {r['exceptions']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmark suite for the analytics hot paths on synthetic histories.
+
+Builds (or reuses) the generated databases of benchmarks.datagen and times
+load_data (cold, from the frame snapshot and cached), calculate_open_positions,
+calculate_portfolio_metrics, the monthly calendar, the overview analytics
+snapshot, the valuation of the open positions, get_product_choices and
+calc_partial_sell_tax (cold and cached lots). Results are written as JSON; with
+``--baseline`` every case is compared against a stored result and the run
+fails if a case got slower than the threshold.
+
+    python -m benchmarks.bench_suite --sizes 1k 100k --output benchmarks/data/current.json
+    python -m benchmarks.bench_suite --sizes 1k 100k --baseline benchmarks/data/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import date, datetime
+
+from benchmarks.datagen import SIZES, database_for
+
+
+def _switch_database(path):
+    from utils.db_helper import reset_db_path
+    from utils.overview_helper import invalidate_data_cache
+    from utils.fifo import LOT_BOOK
+    from utils.settings_store import invalidate_settings
+    from utils.frame_snapshot import drop_snapshot
+
+    os.environ["DATABASE_PATH"] = path
+    reset_db_path()
+    invalidate_data_cache()
+    LOT_BOOK.invalidate()
+    invalidate_settings()
+    drop_snapshot(remove_files=False)
+
+
+def _partial_sell_target(conn):
+    """Open trade with the most open lots: (trade_id, qty to sell)."""
+    row = conn.execute("""
+        SELECT trade_id, SUM(open_qty), COUNT(*) AS lots
+        FROM transactions
+        WHERE action_id IN (1,3) AND open_qty > 0
+        GROUP BY trade_id
+        ORDER BY lots DESC, trade_id
+        LIMIT 1
+    """).fetchone()
+    return row[0], max(1, int(row[1] * 0.8))
+
+
+def build_cases():
+    """Benchmark cases as (name, setup, run); setup returns the argument of run."""
+    from utils.db_helper import get_db, get_product_choices
+    from utils.overview_helper import (load_data, invalidate_data_cache, load_daily_pnl, calculate_open_positions,
+                                       calculate_portfolio_metrics, create_monthly_calendar_view)
+    from utils.fifo import LOT_BOOK
+    from utils.sell_helper import calc_partial_sell_tax
+    from utils.analytics_worker import build_snapshot
+    from utils.frame_snapshot import drop_snapshot
+    from utils.valuation import value_positions
+
+    def calendar(month):
+        start, end = month
+        return create_monthly_calendar_view(load_daily_pnl(start=start, end=end), start.year, start.month)
+
+    def last_month(_):
+        last = date.fromisoformat(get_db().execute("SELECT MAX(date) FROM daily_pnl").fetchone()[0])
+        start = last.replace(day=1)
+        end = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+        return start, end
+
+    def partial_sell(target):
+        trade_id, qty = target
+        return calc_partial_sell_tax(trade_id, qty, 2.5, 1.0)
+
+    def cold_lots(_):
+        LOT_BOOK.invalidate()
+        return _partial_sell_target(get_db())
+
+    def quoted_positions(_):
+        # Synthetic quote for every WKN of the history (the generated databases have no quotes)
+        import numpy as np
+        import pandas as pd
+        snapshot = build_snapshot()
+        wkns = snapshot.df['wkn'].dropna().unique()
+        rng = np.random.default_rng(1)
+        prices = rng.uniform(0.1, 20.0, len(wkns))
+        quotes = pd.DataFrame({"wkn": wkns, "ts": "2024-12-31T17:30:00", "price": prices,
+                               "previous_close": prices * rng.uniform(0.9, 1.1, len(wkns))})
+        return snapshot.open_positions, snapshot.df, quotes
+
+    def cold_cache(_):
+        invalidate_data_cache()
+        drop_snapshot()
+
+    def mapped_cache(_):
+        # As after a restart: the frame comes from the snapshot files
+        invalidate_data_cache()
+        drop_snapshot(remove_files=False)
+
+    return [
+        ("load_data_cold", cold_cache, lambda _: load_data()),
+        ("load_data_mapped", mapped_cache, lambda _: load_data()),
+        ("load_data_cached", None, lambda _: load_data()),
+        ("calculate_open_positions", lambda _: load_data(), calculate_open_positions),
+        ("calculate_portfolio_metrics", lambda _: load_data(), calculate_portfolio_metrics),
+        ("monthly_calendar", last_month, calendar),
+        ("analytics_snapshot", lambda _: load_data(), lambda _: build_snapshot()),
+        ("value_positions", quoted_positions, lambda arg: value_positions(*arg)),
+        ("get_product_choices", None, lambda _: get_product_choices()),
+        ("calc_partial_sell_tax_cold", cold_lots, partial_sell),
+        ("calc_partial_sell_tax_cached", lambda _: _partial_sell_target(get_db()), partial_sell),
+    ]
+
+
+def run_case(setup, run, repeat):
+    timings = []
+    for _ in range(repeat):
+        arg = setup(None) if setup else None
+        start = time.perf_counter()
+        run(arg)
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat}
+
+
+def run_suite(sizes, repeat, seed=1):
+    results = {}
+    for size in sizes:
+        _switch_database(database_for(size, seed))
+        results[size] = {}
+        for name, setup, run in build_cases():
+            # Cold cases run fewer times on the large histories
+            n = max(1, repeat // 3) if size == "1m" and name.endswith("_cold") else repeat
+            results[size][name] = run_case(setup, run, n)
+            print(f"{size:>5} {name:<30} {results[size][name]['median'] * 1000:>10.2f}ms")
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold, min_delta):
+    """Cases slower than ``baseline * (1 + threshold)`` and by at least ``min_delta`` seconds."""
+    regressions = []
+    print(f"\n{'size':>5} {'case':<30} {'baseline':>11} {'current':>11} {'change':>8}")
+    for size, cases in current["results"].items():
+        for name, result in cases.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            ratio = result["median"] / base["median"] if base["median"] else float("inf")
+            regressed = ratio > 1 + threshold and result["median"] - base["median"] > min_delta
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{size:>5} {name:<30} {base['median'] * 1000:>9.2f}ms {result['median'] * 1000:>9.2f}ms "
+                  f"{(ratio - 1) * 100:>+7.1f}%{flag}")
+            if regressed:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["1k", "100k"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against a stored JSON result")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown (default: 0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.002,
+                        help="ignore slowdowns below this many seconds (default: 0.002)")
+    args = parser.parse_args()
+
+    current = run_suite(args.sizes, args.repeat, args.seed)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark for the vectorized tax replay (utils.tax_replay.replay_gains).
+
+Checks the result against a sequential reference loop and times the replay of
+synthetic realised gains spread over several tax years.
+
+    python -m benchmarks.bench_tax_replay --rows 10000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.tax_replay import replay_gains
+
+
+def reference_replay(gains, years, tax_rate, annual_allowance, loss_carryforward=0.0):
+    """Sequential replay with the rules of sell_helper.calc_sell_tax."""
+    taxes = []
+    allowance = annual_allowance
+    previous_year = None
+    for gain, year in zip(gains, years):
+        if previous_year is not None and year != previous_year:
+            allowance = annual_allowance
+        previous_year = year
+        if gain > 0:
+            used_loss = min(loss_carryforward, gain)
+            taxable = gain - used_loss
+            loss_carryforward -= used_loss
+            used_allowance = min(allowance, taxable)
+            taxable -= used_allowance
+            allowance -= used_allowance
+            taxes.append(round(taxable * tax_rate, 2))
+        else:
+            taxes.append(0.0)
+            loss_carryforward += abs(gain)
+    return np.array(taxes), loss_carryforward, allowance
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--reference-limit', type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    print(f"{'rows':>10} {'vectorized':>12} {'reference':>12}")
+    for rows in args.rows:
+        gains = np.round(rng.normal(40, 600, rows), 2)
+        years = np.sort(rng.integers(2000, 2026, rows))
+
+        start = time.perf_counter()
+        result = replay_gains(gains, years, 0.26375, 1000.0)
+        fast = time.perf_counter() - start
+
+        if rows <= args.reference_limit:
+            start = time.perf_counter()
+            taxes, loss, allowance = reference_replay(gains, years, 0.26375, 1000.0)
+            slow = time.perf_counter() - start
+            assert np.abs(result['tax'] - taxes).max() < 0.011
+            assert abs(result['loss_carryforward'][-1] - loss) < 0.01
+            assert abs(result['tax_allowance'][-1] - allowance) < 0.01
+            print(f"{rows:>10,} {fast * 1000:>10.1f}ms {slow * 1000:>10.1f}ms")
+        else:
+            print(f"{rows:>10,} {fast * 1000:>10.1f}ms {'skipped':>12}")
+
+
+if __name__ == '__main__':
+    main()
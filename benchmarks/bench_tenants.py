@@ -0,0 +1,78 @@
+"""
+Write throughput with several users in one process.
+
+Every thread books buy transactions through ``new_transaction`` (insert,
+positions and daily P&L refresh, commit), either all as the same user - one
+database file, one writer lock - or each as its own user with its own file
+below ``DATABASE_TENANT_DIR``. The databases are created in a temporary
+directory.
+
+    python -m benchmarks.bench_tenants
+    python -m benchmarks.bench_tenants --threads 1 2 4 8 --writes 500
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+# Unique trade ids across all threads (next() on a count is atomic)
+_trade_ids = itertools.count(1)
+
+
+def _book(user_id, writes, barrier, product_strike):
+    from utils.buy_helper import get_or_create_product_id
+    from utils.db_helper import new_transaction, use_user
+
+    with use_user(user_id):
+        product_id = get_or_create_product_id(1, 1, 1, product_strike, 1, f"BT{product_strike}", None, None)
+        barrier.wait()
+        for i in range(writes):
+            qty = 10 + i % 90
+            new_transaction(trade_id=next(_trade_ids), date=(date(2024, 1, 2) + timedelta(days=i % 250)).isoformat(),
+                            product_id=product_id, price=1.5, qty=qty, fee=1.0, tax=0.0, total_price=1.5 * qty + 1.0,
+                            price_correct=1.0, action_id=1, open_qty=qty, gain=0.0)
+
+
+def run(threads, writes, separate):
+    """Books ``writes`` transactions per thread; returns the elapsed seconds."""
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=_book, args=(f"bench{n}" if separate else "default", writes, barrier, 100 + n))
+               for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writes", type=int, default=300, help="transactions per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_PATH"] = os.path.join(directory, "default.db")
+        os.environ["DATABASE_TENANT_DIR"] = os.path.join(directory, "users")
+        import init_db
+        from utils.db_helper import reset_db_path
+        init_db.create_tables()
+        init_db.fill_tables()
+        reset_db_path()
+
+        print(f"{'threads':>7} {'one database':>16} {'one per user':>16} {'speed-up':>9}")
+        for threads in args.threads:
+            total = threads * args.writes
+            shared = total / run(threads, args.writes, separate=False)
+            separate = total / run(threads, args.writes, separate=True)
+            print(f"{threads:>7} {shared:>12,.0f} tx/s {separate:>12,.0f} tx/s {separate / shared:>8.2f}x")
+        reset_db_path()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Concurrency stress test of the sell bookings.
+
+Several writer threads book partial sells of their own positions into one
+database, either as one unit of work per save (``utils.booking``) or the way
+the transactions page used to save them: insert, lot updates and tax state
+each in their own transaction and commit. Reported per writer count: saves
+per second, mean and p95 latency of a save and the number of failed saves.
+The database is created in a temporary directory.
+
+    python -m benchmarks.bench_writes
+    python -m benchmarks.bench_writes --writers 1 4 16 --saves 200
+"""
+import argparse
+import itertools
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+LOT_QTY = 1_000_000
+
+# Every position and every save gets its own id / trading day, so the ledger
+# refreshes cost the same in every run (next() on a count is atomic)
+_positions = itertools.count()
+_days = itertools.count()
+
+
+def _next_day():
+    return date(2024, 1, 1) + timedelta(days=next(_days))
+
+
+def _setup_positions(writers):
+    """A new product and open position of three lots per writer; returns [(trade_id, product_id), ...]."""
+    from utils.buy_helper import get_or_create_product_id
+    from utils.db_helper import new_transaction
+
+    positions = []
+    for _ in range(writers):
+        n = next(_positions)
+        product_id = get_or_create_product_id(1, 1, 1, 1000 + n, 1, f"BW{n}", None, None)
+        trade_id = 10_000 + n
+        for lot in range(3):
+            new_transaction(trade_id=trade_id, date=date(2023, 1, 2 + lot), product_id=product_id, price=1.0,
+                            qty=LOT_QTY, fee=1.0, tax=0.0, total_price=LOT_QTY + 1.0, price_correct=1,
+                            action_id=1 if lot == 0 else 3, open_qty=LOT_QTY, gain=0.0)
+        positions.append((trade_id, product_id))
+    return positions
+
+
+def _save_separately(trade_id, product_id):
+    from utils.db_helper import new_transaction
+    from utils.fifo import LOT_BOOK
+    from utils.settings_store import update_tax_state
+
+    new_transaction(trade_id=trade_id, date=_next_day(), product_id=product_id, price=1.2, qty=1, fee=0.0,
+                    tax=0.0, total_price=1.2, price_correct=1, action_id=4, open_qty=None, gain=0.2)
+    LOT_BOOK.consume(trade_id, 1)
+    update_tax_state(0.0, 1000.0)
+
+
+def _save_unit_of_work(trade_id, product_id):
+    from utils.booking import book_partial_sell
+
+    book_partial_sell(trade_id=trade_id, date=_next_day(), product_id=product_id, price=1.2, qty=1, fee=0.0,
+                      total_price=1.2, price_correct=1, gain=0.2)
+
+
+def run(save, positions, saves):
+    """Every writer performs ``saves`` saves; returns (seconds, latencies, failures)."""
+    barrier = threading.Barrier(len(positions) + 1)
+    latencies = []
+    failures = []
+
+    def writer(trade_id, product_id):
+        barrier.wait()
+        for _ in range(saves):
+            start = time.perf_counter()
+            try:
+                save(trade_id, product_id)
+            except Exception as e:
+                failures.append(e)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=writer, args=position) for position in positions]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--saves", type=int, default=200, help="saves per writer")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_PATH"] = os.path.join(directory, "writes.db")
+        import init_db
+        from utils.db_helper import reset_db_path
+        init_db.create_tables()
+        init_db.fill_tables()
+        reset_db_path()
+
+        print(f"{'writers':>7} {'mode':<14} {'saves/s':>9} {'mean':>9} {'p95':>9} {'failed':>7}")
+        for writers in args.writers:
+            for mode, save in (("separate", _save_separately), ("unit of work", _save_unit_of_work)):
+                seconds, latencies, failures = run(save, _setup_positions(writers), args.saves)
+                p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else float("nan")
+                print(f"{writers:>7} {mode:<14} {len(latencies) / seconds:>9,.0f} "
+                      f"{statistics.fmean(latencies) * 1000:>7.2f}ms {p95 * 1000:>7.2f}ms {len(failures):>7}")
+        reset_db_path()
+
+
+if __name__ == "__main__":
+    main()
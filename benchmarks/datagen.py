@@ -0,0 +1,140 @@
+"""
+Deterministic synthetic trade histories for the benchmarks.
+
+``generate_rows`` yields broker-statement rows (the CSV format of
+utils.importer) for a history across many underlyings: buys, rebuys, partial
+sells, sells, knock-outs and redemptions with consistent open quantities.
+``build_database`` creates a fresh database at a path and imports the rows, the
+result is reused as long as the file exists.
+
+    python -m benchmarks.datagen --rows 100000 --output benchmarks/data/100k.db
+"""
+import argparse
+import io
+import itertools
+import os
+import random
+from datetime import date, timedelta
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+COLUMNS = ["date", "action", "underlying", "product_type", "direction", "strike", "currency", "qty", "price", "fee",
+           "total_price", "wkn", "name"]
+
+# (underlying, currency, index level) - strikes are drawn around the level
+UNDERLYINGS = [
+    ("DAX", "Pkt.", 18000), ("S&P500", "Pkt.", 5000), ("Nasdaq", "Pkt.", 17000), ("Nvidia", "$", 900),
+    ("Apple", "$", 190), ("Amazon", "$", 180), ("Meta", "$", 480), ("Coinbase", "$", 220),
+    ("Rheinmetall AG", "€", 500), ("Renk Group", "€", 25), ("Hensoldt AG", "€", 35), ("Thyssenkrupp AG", "€", 5),
+] + [(f"Underlying {i:03d}", "€", 50 + 7 * i) for i in range(48)]
+
+PRODUCTS = [("Knock-Out", ("Long", "Short"), 0.6), ("Warrant", ("Call", "Put"), 0.25), ("Factor", ("Long", "Short"), 0.15)]
+
+
+def generate_rows(rows, seed=1, start=date(2018, 1, 2)):
+    """Yields ``rows`` statement rows as lists in COLUMNS order, in date order."""
+    rnd = random.Random(seed)
+    open_keys = []
+    open_qty = {}
+    day = start
+    per_day = max(1, rows // 2000)
+
+    for i in range(rows):
+        if i and i % per_day == 0:
+            day += timedelta(days=1 if day.weekday() < 4 else 3)
+
+        action = None
+        if open_keys and rnd.random() < 0.55:
+            index = rnd.randrange(len(open_keys))
+            key = open_keys[index]
+            roll = rnd.random()
+            if roll < 0.30:
+                action, qty = "rebuy", rnd.randint(10, 500)
+                open_qty[key] += qty
+            elif roll < 0.55 and open_qty[key] > 1:
+                action, qty = "partial sell", rnd.randint(1, open_qty[key] - 1)
+                open_qty[key] -= qty
+            else:
+                action = "sell" if roll < 0.85 else "knock-out" if roll < 0.95 else "redemption"
+                remaining = open_qty.pop(key)
+                qty = remaining if action == "sell" else 0
+                open_keys[index] = open_keys[-1]
+                open_keys.pop()
+        if action is None:
+            underlying, currency, level = rnd.choice(UNDERLYINGS)
+            product_type, directions, _ = rnd.choices(PRODUCTS, weights=[p[2] for p in PRODUCTS])[0]
+            strike = float(round(level * rnd.uniform(0.7, 1.3), -1 if level > 1000 else 0) or 1)
+            key = (underlying, product_type, rnd.choice(directions), strike, currency)
+            action, qty = ("rebuy" if key in open_qty else "buy"), rnd.randint(10, 1000)
+            if key not in open_qty:
+                open_keys.append(key)
+                open_qty[key] = 0
+            open_qty[key] += qty
+
+        price = round(rnd.lognormvariate(0, 0.8), 2)
+        fee = rnd.choice((0.0, 1.0, 4.9))
+        total_price = round(rnd.uniform(0, 400), 2) if action == "redemption" else ""
+        underlying, product_type, direction, strike, currency = key
+        yield [day.isoformat(), action, underlying, product_type, direction, strike, currency, qty,
+               price, fee, total_price, f"BM{i:07d}", f"{product_type} {underlying}"]
+
+
+class _RowStream(io.TextIOBase):
+    """Text stream (header + generated rows) for utils.importer.import_csv."""
+
+    def __init__(self, rows):
+        self._lines = itertools.chain([",".join(COLUMNS) + "\n"],
+                                      (",".join(str(v) for v in row) + "\n" for row in rows))
+
+    def readline(self, size=-1):
+        return next(self._lines, "")
+
+    def __iter__(self):
+        return self._lines
+
+    def readable(self):
+        return True
+
+
+def build_database(path, rows, seed=1, force=False):
+    """Creates (or reuses) a benchmark database with ``rows`` generated transactions."""
+    if os.path.exists(path) and not force:
+        return path
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    from utils.db_helper import reset_db_path
+
+    os.environ["DATABASE_PATH"] = path
+    reset_db_path()
+    import init_db
+    from utils.importer import import_csv
+
+    init_db.create_tables()
+    init_db.fill_tables()
+    init_db.migrate_database()
+
+    result = import_csv(_RowStream(generate_rows(rows, seed)), batch_size=20_000)
+    print(f"Generated {result['rows']:,} transactions in {result['seconds']:.1f}s -> {path}")
+    return path
+
+
+def database_for(size, seed=1, force=False):
+    """Path of the cached benchmark database for a size name (1k, 100k, 1m)."""
+    rows = SIZES[size]
+    return build_database(os.path.join(DATA_DIR, f"history_{size}_s{seed}.db"), rows, seed, force)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+    build_database(args.output, args.rows, args.seed, force=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 import sqlite3
 import os
+from datetime import datetime
 
-def get_db():
-    """Datenbankverbindung herstellen"""
-    db_path = os.environ.get('DATABASE_PATH', './data/options_tracker.db')
+from utils.migrations import migrate, get_schema_version, merge_duplicate_products, LATEST_VERSION
+from utils.ledger import rebuild_positions, rebuild_daily_pnl
+
+def get_db(db_path=None):
+    """Datenbankverbindung herstellen (Standard: DATABASE_PATH)"""
+    db_path = db_path or os.environ.get('DATABASE_PATH', './data/options_tracker.db')
     
     # Stelle sicher, dass das Verzeichnis existiert
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
@@ -25,9 +29,9 @@ def get_db():
             else:
                 raise e
 
-def create_tables():
+def create_tables(db_path=None):
     """Alle Tabellen erstellen"""
-    conn = get_db()
+    conn = get_db(db_path)
     
     try:
         # Basis Products Tabelle
@@ -143,9 +147,9 @@ def create_tables():
     finally:
         conn.close()
 
-def fill_tables():
+def fill_tables(db_path=None):
     """Basisdaten in die Tabellen einfügen"""
-    conn = get_db()
+    conn = get_db(db_path)
     
     try:
         # Basis Products einfügen
@@ -203,8 +207,9 @@ def fill_tables():
 
         # Default Settings einfügen
         conn.execute("""
-            INSERT OR IGNORE INTO settings VALUES 
-            ('default', 'en', 0.0, 'DD.MM.YYYY', 0.0, 0.0, 'Dark')
+            INSERT OR IGNORE INTO settings
+                (user_id, language_code, tax_rate, date_format, tax_allowance, loss_carryforward, theme_mode)
+            VALUES ('default', 'en', 0.0, 'DD.MM.YYYY', 0.0, 0.0, 'Dark')
         """)
 
         conn.commit()
@@ -216,9 +221,9 @@ def fill_tables():
     finally:
         conn.close()
 
-def check_database():
+def check_database(db_path=None):
     """Überprüfe, ob die Datenbank korrekt initialisiert wurde"""
-    conn = get_db()
+    conn = get_db(db_path)
     
     tables = [
         'basis_products', 'product_types', 'directions', 
@@ -239,17 +244,23 @@ def check_database():
     
     conn.close()
 
-def reset_database():
+def reset_database(db_path=None):
     """Datenbank komplett zurücksetzen (alle Tabellen löschen)"""
-    conn = get_db()
+    conn = get_db(db_path)
     
     tables = [
-        'transactions', 'products', 'settings', 'actions', 
-        'strike_currencies', 'directions', 'product_types', 'basis_products'
+        'quotes', 'daily_pnl', 'tax_checkpoints', 'positions', 'transactions', 'products', 'settings', 'actions', 
+        'strike_currencies', 'directions', 'product_types', 'basis_products',
+        'transaction_changes', 'data_version', 'schema_version'
     ]
     
+    views = ['v_transaction_list', 'v_transactions', 'v_products']
+    
     print("⚠️  Datenbank wird zurückgesetzt...")
     
+    for view in views:
+        conn.execute(f"DROP VIEW IF EXISTS {view}")
+    
     for table in tables:
         try:
             conn.execute(f"DROP TABLE IF EXISTS {table}")
@@ -261,18 +272,86 @@ def reset_database():
     conn.close()
     print("✅ Datenbank erfolgreich zurückgesetzt")
 
-def init_database():
+def migrate_database(db_path=None):
+    """Ausstehende Schema-Migrationen anwenden (Indizes etc.)"""
+    conn = get_db(db_path)
+
+    try:
+        print(f"🔧 Schema-Version: {get_schema_version(conn)} (aktuell: {LATEST_VERSION})")
+        applied = migrate(conn, verbose=True)
+        if applied:
+            print(f"✅ {len(applied)} Migration(en) angewendet, Schema-Version {get_schema_version(conn)}")
+        else:
+            print("✅ Schema ist aktuell")
+    except sqlite3.Error as e:
+        print(f"❌ Fehler bei der Migration: {e}")
+        raise e
+    finally:
+        conn.close()
+
+def merge_duplicates(db_path=None):
+    """Doppelte Produkte zusammenführen (Voraussetzung für Migration 001); vorher wird ein Backup geschrieben"""
+    db_path = db_path or os.environ.get('DATABASE_PATH', './data/options_tracker.db')
+    conn = get_db(db_path)
+
+    try:
+        root, ext = os.path.splitext(db_path)
+        backup_path = f"{root}.before_merge_{datetime.now():%Y%m%d_%H%M%S}{ext or '.db'}"
+        backup = sqlite3.connect(backup_path)
+        with backup:
+            conn.backup(backup)
+        backup.close()
+        print(f"💾 Backup erstellt: {backup_path}")
+
+        conn.execute("BEGIN IMMEDIATE")
+        merges = merge_duplicate_products(conn)
+        conn.commit()
+        for dup_id, keep_id, moved in merges:
+            print(f"  - Produkt {dup_id} in Produkt {keep_id} zusammengeführt ({moved} Transaktionen)")
+        print(f"✅ {len(merges)} doppelte(s) Produkt(e) zusammengeführt")
+    except sqlite3.Error as e:
+        print(f"❌ Fehler beim Zusammenführen: {e}")
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+    migrate_database(db_path)
+    return merges
+
+def rebuild_ledgers(db_path=None):
+    """Abgeleitete Ledger-Tabellen (offene Positionen, Tages-P&L) aus den Transaktionen neu berechnen"""
+    conn = get_db(db_path)
+
+    try:
+        migrate(conn)
+        open_positions = rebuild_positions(conn)
+        days = rebuild_daily_pnl(conn)
+        conn.commit()
+        print(f"✅ Positions-Ledger neu aufgebaut: {open_positions} offene Positionen")
+        print(f"✅ Tages-P&L neu aufgebaut: {days} Handelstage")
+    except sqlite3.Error as e:
+        print(f"❌ Fehler beim Neuaufbau der Ledger: {e}")
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def init_database(db_path=None):
     """Komplette Datenbankinitialisierung"""
     print("🚀 Starte Datenbankinitialisierung...")
     
     # Tabellen erstellen
-    create_tables()
+    create_tables(db_path)
     
     # Basisdaten einfügen
-    fill_tables()
+    fill_tables(db_path)
+
+    # Schema-Migrationen anwenden
+    migrate_database(db_path)
     
     # Status überprüfen
-    check_database()
+    check_database(db_path)
     
     print("\n✅ Datenbankinitialisierung abgeschlossen!")
 
@@ -287,11 +366,20 @@ if __name__ == "__main__":
             check_database()
         elif sys.argv[1] == "fill":
             fill_tables()
+        elif sys.argv[1] == "migrate":
+            migrate_database()
+        elif sys.argv[1] == "rebuild":
+            rebuild_ledgers()
+        elif sys.argv[1] == "merge-duplicates":
+            merge_duplicates()
         else:
             print("Verfügbare Befehle:")
             print("  python init_db.py        - Normale Initialisierung")
             print("  python init_db.py reset  - Datenbank zurücksetzen und neu initialisieren")
             print("  python init_db.py check  - Datenbankstatus überprüfen")
             print("  python init_db.py fill   - Nur Basisdaten einfügen")
+            print("  python init_db.py migrate - Schema-Migrationen anwenden")
+            print("  python init_db.py rebuild - Ledger-Tabellen aus den Transaktionen neu aufbauen")
+            print("  python init_db.py merge-duplicates - Doppelte Produkte zusammenführen (mit Backup)")
     else:
         init_database()
@@ -6,6 +6,14 @@ translations = {
     "partial_sell_tab": "Teilverkauf",
     "redemption_tab": "Tilgung",
     "knockout_tab": "Knock-Out-Verlust",
+    "import_tab": "Import",
+    "import_site": "📂 Depotauszug importieren",
+    "import_upload": "CSV-Datei",
+    "import_format_help": "Spalten: date, action, underlying, product_type, direction, strike, currency, qty, price, fee (optional: total_price, tax, gain, wkn, name, expiry_date). Aktionen: buy, rebuy, sell, partial sell, redemption, knock-out. Mit ; getrennte Dateien verwenden das Dezimalkomma (1.000,50), mit , getrennte den Dezimalpunkt (1000.50).",
+    "import_skip_errors": "Ungültige Zeilen überspringen",
+    "import_button": "Import starten",
+    "import_error": "Import abgebrochen",
+    "import_success": "{rows:,} Zeilen in {seconds:.2f}s importiert ({rows_per_second:,.0f} Zeilen/s), {skipped:,} übersprungen, {products_created:,} neue Produkte.",
     "save_purchase": "Kauf speichern",
     "recent_transactions": "📄 Letzte Transaktionen",
     "purchase_site": "💼 Einkauf",
@@ -38,6 +46,7 @@ translations = {
     "save_redemption": "Tilgung speichern",
     "save_ko": "KO speichern",
     "expiry_date": "Fälligkeit",
+    "ratio": "Bezugsverhältnis",
     "name_col": "Name",
     "action_col": "Aktion",
     "open_qty_col": "Offene Menge",
@@ -56,6 +65,21 @@ translations = {
         "Name", "Stückpreis", "Menge", "Steuer", "Gesamtpreis", "Aktion", "Offene Menge", "Datum"
     ],
     "error_loading": "Fehler beim Laden der Daten:",
+    "filter_underlying": "Basiswert",
+    "filter_date_from": "Von",
+    "filter_date_to": "Bis",
+    "sort_newest_first": "Neueste zuerst",
+    "page_first": "⏮",
+    "page_prev": "◀",
+    "page_next": "▶",
+    "page_last": "⏭",
+    "page_info": "Seite {page} von {pages} · {total:,} Transaktionen",
+    "export_title": "⬇️ Export",
+    "export_format": "Format",
+    "export_prepare": "Export vorbereiten",
+    "export_download": "Herunterladen ({rows:,} Transaktionen)",
+    "export_error": "Export fehlgeschlagen:",
+    "export_too_large": "{rows:,} Transaktionen sind mehr, als der Download anbietet ({max_rows:,}). Exportieren Sie sie mit `python -m utils.exporter transactions{suffix}`.",
 
     "title_options_site": "💾 Stammdaten verwalten",
     "tabs_master": [
@@ -86,6 +110,7 @@ translations = {
     "date_section_settings_site": "Datumsformat",
     "save_settings": "Einstellungen speichern",
     "settings_saved": "Einstellungen erfolgreich gespeichert",
+    "settings_conflict": "Die Einstellungen wurden in einer anderen Sitzung oder durch eine Buchung geändert. Die aktuellen Werte wurden geladen, bitte prüfen und erneut speichern.",
     "tax_rate_settings_site": "💸Steuersatz (z.B. 0,26 für 26%)",
     "choose_date_format": "📅 Datumsformat wählen",
     "default_tax_caption": "Aktueller Steuersatz: ",
@@ -96,6 +121,7 @@ translations = {
     "db_loading_error": "Stellen Sie sicher, dass die Datenbank existiert und Daten enthält.",
     "db_no_data_error":"Keine Daten in der Datenbank gefunden.",
     "kpi_subheader": "📊 Wesentliche Leistungsindikatoren",
+    "analytics_refreshing": "⏳ Neue Transaktionen werden verarbeitet, die Kennzahlen werden in Kürze aktualisiert.",
     "total_trading_volume":"Gesamtes Handelsvolumen",
     "sum_of_all_transactions": "Summe aller Transaktionen",
     "total_p_l": "Gesamtgewinn/-verlust",
@@ -107,6 +133,26 @@ translations = {
     "open_positions":"Offene Positionen",
     "open_positions_details": "📊 Offene Positionen Details",
     "open_positions_display_columns": ['Produktname', 'Menge', 'Gesamtwert'],
+    "open_positions_valuation_columns": ['WKN', 'Kurs', 'Marktwert', 'Unrealisierte G/V', 'Unrealisiert %', 'Tagesveränderung'],
+    "valuation_subheader": "💹 Marktbewertung",
+    "market_value": "Marktwert",
+    "unrealised_p_l": "Unrealisierte Gewinne/Verluste",
+    "day_change": "Tagesveränderung",
+    "exposure": "Exposure",
+    "valuation_as_of": "Kurse vom {as_of} · {quoted} von {positions} offenen Positionen bewertet",
+    "valuation_no_quotes": "Noch keine Kurse für die offenen Positionen – laden mit python -m utils.valuation load <Datei>.",
+    "valuation_error": "Kurse konnten nicht gelesen werden:",
+    "greeks_subheader": "🧮 Portfolio-Greeks (Optionsscheine)",
+    "greeks_value": "Theoretischer Wert",
+    "greeks_delta": "Delta (je +1 %)",
+    "greeks_gamma": "Gamma (je +1 %)",
+    "greeks_vega": "Vega (je Vola-Punkt)",
+    "greeks_theta": "Theta (je Tag)",
+    "greeks_caption": "{priced} von {positions} Optionsschein-Positionen bewertet, {implied} mit impliziter Volatilität · Black-Scholes, r = {rate:.2%}",
+    "greeks_not_priced": "Für die Bewertung brauchen Optionsscheine ein Fälligkeitsdatum und einen Kurs des Basiswerts (unter seinem Namen).",
+    "greeks_details": "Optionsschein-Positionen",
+    "greeks_display_columns": ['Produktname', 'Menge', 'Basiswert', 'Fälligkeit', 'Volatilität', 'Wert', 'Delta', 'Positionswert'],
+    "greeks_error": "Optionsscheine konnten nicht bewertet werden:",
     "p_l_analysis":"📈 Gewinn/Verlust Analyse",
     "time_display_options": ["Letzte 30 Tage", "Letzte 365 Tage", "Gesamt"],
     "period_translations":{"Last 30 Days": "Letzte 30 Tage", "Last 365 Days":"Letzte 365 Tage", "All time": "Gesamt"},
@@ -148,5 +194,28 @@ translations = {
     "top_performer": "🏆 Top Gewinner",
     "worst_performer":"📉 Top Verlierer",
     "all_transactions":"📊 Alle Transaktionen",
-    "weekdays_short":['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So']
+    "weekdays_short":['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So'],
+    "title_diagnostics_site": "🩺 Diagnose",
+    "diagnostics_disabled": "Die Diagnoseseite ist deaktiviert. Zum Aktivieren DIAGNOSTICS_ENABLED=1 setzen.",
+    "diagnostics_pool": "Verbindungspool",
+    "diagnostics_queries": "Abfragestatistik",
+    "diagnostics_queries_disabled": "Die Abfragestatistik ist deaktiviert (DATABASE_QUERY_STATS=0).",
+    "diagnostics_no_queries": "Noch keine Abfragen erfasst.",
+    "diagnostics_reset": "Statistik zurücksetzen",
+    "diagnostics_slow_queries": "Langsame Abfragen (≥ {ms:.0f} ms)",
+    "diagnostics_no_slow_queries": "Keine langsamen Abfragen erfasst.",
+    "diagnostics_page_profiles": "Seitenprofile",
+    "diagnostics_no_profiles": "Noch keine profilierten Durchläufe. Profiling mit PROFILE_PAGES=1 oder dem Query-Parameter ?profile=1 aktivieren (cProfile-Dumps mit PROFILE_PAGES=cprofile werden nach {dir} geschrieben).",
+    "diagnostics_rerun_time": "Laufzeit pro Durchlauf (ms)",
+    "diagnostics_peak_memory": "Speicherspitze (MB)",
+    "diagnostics_section_time": "Mittlere Zeit pro Abschnitt (ms)",
+    "diagnostics_reset_profiles": "Profile zurücksetzen",
+    "diagnostics_analytics": "Analytics-Worker",
+    "diagnostics_frame_snapshot": "Snapshot des Transaktions-Frames: {full} vollständige Aufbauten, {incremental} inkrementelle Aktualisierungen ({rows_merged} Zeilen übernommen), {mapped} von der Festplatte geladen",
+    "tenant_login_required": "Bitte melde dich an, um dein Portfolio zu öffnen.",
+    "tenant_login": "Anmelden",
+    "tenant_logout": "Abmelden",
+    "tenant_unknown_user": "Der Benutzer konnte nicht ermittelt werden (Header {header}). Bitte wende dich an den Administrator.",
+    "tenant_invalid_user": "Der Benutzername {user} kann nicht für ein Portfolio verwendet werden.",
+    "tenant_signed_in": "👤 {user}",
 }
@@ -6,6 +6,14 @@ translations = {
     "partial_sell_tab": "Partial Sell",
     "redemption_tab": "Redemption",
     "knockout_tab": "Knock-Out loss",
+    "import_tab": "Import",
+    "import_site": "📂 Import Broker Statement",
+    "import_upload": "CSV file",
+    "import_format_help": "Columns: date, action, underlying, product_type, direction, strike, currency, qty, price, fee (optional: total_price, tax, gain, wkn, name, expiry_date). Actions: buy, rebuy, sell, partial sell, redemption, knock-out. Files separated by ; use a decimal comma (1.000,50), files separated by , a decimal point (1000.50).",
+    "import_skip_errors": "Skip invalid rows",
+    "import_button": "Start Import",
+    "import_error": "Import aborted",
+    "import_success": "{rows:,} rows imported in {seconds:.2f}s ({rows_per_second:,.0f} rows/s), {skipped:,} skipped, {products_created:,} new products.",
     "save_purchase": "Save Purchase",
     "recent_transactions": "📄 Recent Transactions",
     "purchase_site": "💼 New Purchase",
@@ -38,6 +46,7 @@ translations = {
     "save_redemption": "Save Redemption",
     "save_ko": "Save KO",
     "expiry_date": "Expiry Date",
+    "ratio": "Ratio",
     "name_col": "Name",
     "action_col": "Action",
     "open_qty_col": "Open Quantity",
@@ -56,6 +65,21 @@ translations = {
         "Name", "Price", "Quantity", "Tax", "Total Price", "Action", "Open Quantity", "Transaction Date"
     ],
     "error_loading": "Error loading data:",
+    "filter_underlying": "Base value",
+    "filter_date_from": "From",
+    "filter_date_to": "To",
+    "sort_newest_first": "Newest first",
+    "page_first": "⏮",
+    "page_prev": "◀",
+    "page_next": "▶",
+    "page_last": "⏭",
+    "page_info": "Page {page} of {pages} · {total:,} transactions",
+    "export_title": "⬇️ Export",
+    "export_format": "Format",
+    "export_prepare": "Prepare export",
+    "export_download": "Download ({rows:,} transactions)",
+    "export_error": "Export failed:",
+    "export_too_large": "{rows:,} transactions are more than the download offers ({max_rows:,}). Export them with `python -m utils.exporter transactions{suffix}`.",
     "title_options_site": "💾 Manage Master Data",
     "tabs_master": [
         "Base value",
@@ -79,6 +103,7 @@ translations = {
     "date_section_settings_site": "Date format",
     "save_settings": "Save settings",
     "settings_saved": "Settings saved successfully",
+    "settings_conflict": "The settings were changed in another session or by a booking. The current values have been loaded, please check them and save again.",
     "tax_rate_settings_site": "💸Tax rate (e.g. 0.26 for 26%)",
     "choose_date_format": "📅 Choose date format",
     "default_tax_caption": "Current tax rate: ",
@@ -89,6 +114,7 @@ translations = {
     "db_loading_error": "Make sure that the database exists and contains data.",
     "db_no_data_error":"No data found in the database.",
     "kpi_subheader": "📊 Key performance indicators",
+    "analytics_refreshing": "⏳ New transactions are being processed, the figures will update shortly.",
     "total_trading_volume":"Total trading volume",
     "sum_of_all_transactions": "Sum of all transactions",
     "total_p_l": "Total profit/loss",
@@ -100,6 +126,26 @@ translations = {
     "open_positions":"Open positions",
     "open_positions_details": "📊 Open positions Details",
     "open_positions_display_columns": ['Product name', 'quantity', 'total value'],
+    "open_positions_valuation_columns": ['WKN', 'price', 'market value', 'unrealized P&L', 'unrealized %', 'day change'],
+    "valuation_subheader": "💹 Mark-to-market",
+    "market_value": "Market value",
+    "unrealised_p_l": "Unrealized P&L",
+    "day_change": "Day change",
+    "exposure": "Exposure",
+    "valuation_as_of": "Quotes as of {as_of} · {quoted} of {positions} open positions quoted",
+    "valuation_no_quotes": "No quotes for the open positions yet – load them with python -m utils.valuation load <file>.",
+    "valuation_error": "Quotes could not be read:",
+    "greeks_subheader": "🧮 Portfolio Greeks (warrants)",
+    "greeks_value": "Theoretical value",
+    "greeks_delta": "Delta (per +1%)",
+    "greeks_gamma": "Gamma (per +1%)",
+    "greeks_vega": "Vega (per vol point)",
+    "greeks_theta": "Theta (per day)",
+    "greeks_caption": "{priced} of {positions} warrant positions priced, {implied} with implied volatility · Black-Scholes, r = {rate:.2%}",
+    "greeks_not_priced": "Warrant positions need an expiry date and a quote of the underlying (quoted under its name) to be priced.",
+    "greeks_details": "Warrant positions",
+    "greeks_display_columns": ['Product name', 'quantity', 'underlying', 'expiry date', 'volatility', 'value', 'delta', 'position value'],
+    "greeks_error": "Warrants could not be priced:",
     "p_l_analysis":"📈 Profit/loss analysis",
     "time_display_options": ["Last 30 days", "Last 365 days", "Total"],
     "period_translations":{"Last 30 Days": "Letzte 30 Tage", "Last 365 Days":"Letzte 365 Tage", "Total": "Gesamt"},
@@ -141,6 +187,28 @@ translations = {
     "top_performer": "🏆 Top winners",
     "worst_performer":"📉 Top losers",
     "all_transactions":"📊 All transactions",
-    "weekdays_short":['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    "weekdays_short":['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+    "title_diagnostics_site": "🩺 Diagnostics",
+    "diagnostics_disabled": "The diagnostics page is disabled. Set DIAGNOSTICS_ENABLED=1 to enable it.",
+    "diagnostics_pool": "Connection Pool",
+    "diagnostics_queries": "Query Statistics",
+    "diagnostics_queries_disabled": "Query statistics are disabled (DATABASE_QUERY_STATS=0).",
+    "diagnostics_no_queries": "No queries recorded yet.",
+    "diagnostics_reset": "Reset statistics",
+    "diagnostics_slow_queries": "Slow Queries (≥ {ms:.0f} ms)",
+    "diagnostics_no_slow_queries": "No slow queries recorded.",
+    "diagnostics_page_profiles": "Page Profiles",
+    "diagnostics_no_profiles": "No profiled reruns yet. Enable profiling with PROFILE_PAGES=1 or the query parameter ?profile=1 (cProfile dumps with PROFILE_PAGES=cprofile are written to {dir}).",
+    "diagnostics_rerun_time": "Rerun wall time (ms)",
+    "diagnostics_peak_memory": "Peak traced memory (MB)",
+    "diagnostics_section_time": "Mean time per section (ms)",
+    "diagnostics_reset_profiles": "Reset profiles",
+    "diagnostics_analytics": "Analytics Worker",
+    "diagnostics_frame_snapshot": "Transaction frame snapshot: {full} full builds, {incremental} incremental updates ({rows_merged} rows merged), {mapped} loaded from disk",
+    "tenant_login_required": "Please sign in to open your portfolio.",
+    "tenant_login": "Sign in",
+    "tenant_logout": "Sign out",
+    "tenant_unknown_user": "The user could not be determined (header {header}). Please contact the administrator.",
+    "tenant_invalid_user": "The user name {user} cannot be used for a portfolio.",
+    "tenant_signed_in": "👤 {user}",
 }
-
@@ -1,32 +1,38 @@
+import io
 import streamlit as st
-import pandas as pd
 from datetime import date
 
 
-from utils.db_helper import (get_options, new_transaction, get_product_choices, update_open_qty, get_db,
-                             update_loss_carryforward, update_tax_allowance)
+from utils.db_helper import get_options, new_transaction, get_product_choices, get_db
 from utils.buy_helper import get_direction_id, get_or_create_product_id, get_or_create_trade_id
-from utils.sell_helper import calc_sell_tax, calc_partial_sell_tax
-from utils.settings_handler import get_lang, load_settings
+from utils.sell_helper import calc_close_tax, calc_sell_tax, calc_partial_sell_tax
+from utils.booking import book_sell, book_partial_sell, book_redemption, book_knockout
+from utils.settings_handler import get_lang, get_settings, init_user
+from utils.importer import import_csv, ImportRowError
+from utils.profiler import begin, end, section
 
 st.set_page_config(page_title="OptionsTracker – Transactions", layout="wide", page_icon="📥")
+begin("transactions")
+init_user()
 
-if "tax_rate" not in st.session_state or "date_format" not in st.session_state:
-    settings = load_settings()
-    for key, value in settings.items():
-        st.session_state[key] = value
+settings = get_settings()
+# UI preferences of the session start from the stored settings
+for key in ("language_code", "date_format", "theme_mode"):
+    if key not in st.session_state:
+        st.session_state[key] = getattr(settings, key)
 
 T = get_lang()
-tax_rate = st.session_state["tax_rate"]
+tax_rate = settings.tax_rate
 date_format = st.session_state["date_format"]
 
 st.title(T["title"])
 
 
-basis_options = get_options("SELECT id, name FROM basis_products")
-type_options = get_options("SELECT id, name FROM product_types")
-direction_options = get_options("SELECT id, name FROM directions")
-currency_options = get_options("SELECT id, symbol FROM strike_currencies")
+with section("master_data"):
+    basis_options = get_options("SELECT id, name FROM basis_products")
+    type_options = get_options("SELECT id, name FROM product_types")
+    direction_options = get_options("SELECT id, name FROM directions")
+    currency_options = get_options("SELECT id, symbol FROM strike_currencies")
 
 # Actions
 tabs = st.tabs([
@@ -35,7 +41,8 @@ tabs = st.tabs([
     T["sell_tab"],
     T["partial_sell_tab"],
     T["redemption_tab"],
-    T["knockout_tab"]
+    T["knockout_tab"],
+    T["import_tab"]
 ])
 
 
@@ -78,14 +85,16 @@ with tabs[0]:
     with col8:
         if product_type[1].lower() == "warrant":
             expiry_date = st.date_input(T["expiry_date"], format=date_format, key="buy_expiry_date")
+            ratio = st.number_input(T["ratio"], min_value=0.0001, value=1.0, format="%.4f", key="buy_ratio")
         else:
             expiry_date = None
+            ratio = None
 
     if st.button(T["save_purchase"]):
         direction = get_direction_id(strategy)
         product_id = get_or_create_product_id(basis_id=basis_asset[0], product_type_id=product_type[0],
                                               direction_id=direction, strike=strike, strike_currency_id=currency[0],
-                                              wkn=wkn, name=name, expiry_date=expiry_date)
+                                              wkn=wkn, name=name, expiry_date=expiry_date, ratio=ratio)
         new_transaction(trade_id=get_or_create_trade_id(product_id), date=txn_date, product_id=product_id, price=price, qty=qty,
                         fee=fee, tax=0.0, total_price=total_price, price_correct=price_correct, action_id=1,
                         open_qty=qty, gain=0)
@@ -159,7 +168,8 @@ with tabs[2]:
             price_correct = 0 if total_price != ((price * qty) - fee - tax) else 1
             st.caption(f"{T['total_price']}: {price_paid}")
         with col5:
-            tax = st.number_input(T["tax"], value=tax, key="sell_tax")
+            # Preview only: the tax is computed from the stored tax state when the sale is booked
+            st.number_input(T["tax"], value=tax, key="sell_tax", disabled=True)
             col6,col7,col8= st.columns(3)
             with col6:
                 st.caption(f"{T['loss_carryforward_settings_site']}: {loss_carryforward}")
@@ -171,11 +181,8 @@ with tabs[2]:
 
 
         if st.button(T["save_sale"]):
-            new_transaction(trade_id=trade_id, date=txn_date, product_id=product_id, price=price, qty=open_qty, fee=fee,
-                    tax=tax, total_price=total_price, price_correct=price_correct, action_id=2, open_qty=0, gain=round(gain,2))
-            update_open_qty(trade_id, open_qty=0)
-            update_loss_carryforward(loss_carryforward)
-            update_tax_allowance(tax_allowance)
+            book_sell(trade_id=trade_id, date=txn_date, product_id=product_id, price=price, qty=open_qty, fee=fee,
+                      total_price=total_price + tax, price_correct=price_correct, gain=round(gain + tax, 2))
             st.rerun()
 
 # Parital Sell action
@@ -206,6 +213,7 @@ with tabs[3]:
         total_price = temp_calc["total_price"]
         tax = temp_calc["tax"]
         gain = temp_calc["gain"]
+        gross_gain = temp_calc["gross_gain"]
         price_correct = temp_calc["price_correct"]
         loss_carryforward = temp_calc["loss_carryforward"]
         tax_allowance = temp_calc["tax_allowance"]
@@ -214,7 +222,7 @@ with tabs[3]:
             total_price = st.number_input(T["total_price_tax"], value=total_price, key="partial_total_sell_price")
             st.caption(f"{T['total_price']}: {price_paid}")
         with col5:
-            tax = st.number_input(T["tax"], value=tax, key="partial_sell_tax")
+            st.number_input(T["tax"], value=tax, key="partial_sell_tax", disabled=True)
             col6,col7,col8= st.columns(3)
             with col6:
                 st.caption(f"{T['loss_carryforward_settings_site']}: {loss_carryforward}")
@@ -226,19 +234,9 @@ with tabs[3]:
 
 
         if st.button(T["save_partial_sale"]):
-            new_transaction(trade_id=trade_id, date=txn_date, product_id=product_id, price=price, qty=qty, fee=fee,
-                    tax=tax, total_price=total_price, price_correct=price_correct, action_id=4, open_qty=None, gain=round(gain,2))
-
-            conn = get_db()
-            for txn_id, used_qty in temp[1]:
-                res = conn.execute("SELECT open_qty FROM transactions WHERE id = ?", (txn_id,)).fetchone()
-                if res is not None:
-                    current_qty = res[0]
-                    new_qty = max(current_qty - used_qty, 0)
-                    conn.execute("UPDATE transactions SET open_qty = ? WHERE id = ?", (new_qty, txn_id))
-            update_loss_carryforward(loss_carryforward)
-            update_tax_allowance(tax_allowance)
-            conn.commit()
+            book_partial_sell(trade_id=trade_id, date=txn_date, product_id=product_id, price=price, qty=qty, fee=fee,
+                              total_price=total_price + tax, price_correct=price_correct,
+                              gain=round(gross_gain + total_price - temp_calc["total_price"], 2))
             st.rerun()
 
 
@@ -261,16 +259,16 @@ with tabs[4]:
         total_price = st.number_input(T["total_price"],key="redemption_price", step=1.0)
         st.caption(f"{T['total_price']}: {price_paid}")
 
-        gain = st.number_input(T["estimated_gain_loss"], value=total_price - price_paid, disabled=True, key="redemption_gain")
+        gross_gain = total_price - price_paid
+        tax = calc_close_tax(gross_gain)
+        st.caption(f"{T['tax']}: {tax}")
+        st.number_input(T["estimated_gain_loss"], value=gross_gain - tax, disabled=True, key="redemption_gain")
 
         txn_date = st.date_input(T["transaction_date"], value=date.today(), key="redemption_date", format=date_format)
 
         if st.button(T["save_redemption"]):
-            new_transaction(trade_id=trade_id, date=txn_date, product_id=product_id, price=0, qty=0, fee=0,
-                            tax=0, total_price=total_price, price_correct=1, action_id=5, open_qty=None,
-                            gain=round(gain, 2))
-            update_open_qty(trade_id=trade_id, open_qty=0)
-            update_loss_carryforward(gain)
+            book_redemption(trade_id=trade_id, date=txn_date, product_id=product_id, total_price=total_price,
+                            gain=round(gross_gain, 2))
             st.rerun()
 
 
@@ -290,52 +288,64 @@ with tabs[5]:
         price_paid = selected_id[4]
         st.caption(f"{T['total_price']}: {price_paid}")
 
+        # A knock-out realises a loss, so the gain before and after tax are the same
         gain = st.number_input(T["estimated_gain_loss"], value=-price_paid, disabled=True, key="ko_gain")
 
         txn_date = st.date_input(T["transaction_date"], value=date.today(), key="ko_date", format=date_format)
 
         if st.button(T["save_ko"]):
-            new_transaction(trade_id=trade_id, date=txn_date, product_id=product_id, price=0, qty=0, fee=0,
-                            tax=0, total_price=0, price_correct=1, action_id=6, open_qty=None,
-                            gain=round(gain, 2))
-            update_open_qty(trade_id=trade_id, open_qty=0)
-            update_loss_carryforward(gain)
+            book_knockout(trade_id=trade_id, date=txn_date, product_id=product_id, gain=round(gain, 2))
             st.rerun()
 
 
+# Broker statement import
+with tabs[6]:
+    st.subheader(T["import_site"])
+    st.caption(T["import_format_help"])
+    uploaded = st.file_uploader(T["import_upload"], type=["csv"], key="import_file")
+    skip_errors = st.checkbox(T["import_skip_errors"], key="import_skip_errors")
+
+    if uploaded is not None and st.button(T["import_button"]):
+        progress = st.empty()
+        try:
+            result = import_csv(io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline=""),
+                                skip_errors=skip_errors,
+                                progress=lambda rows: progress.caption(f"{rows:,} ..."))
+        except ImportRowError as e:
+            st.error(f"{T['import_error']}: {e}")
+        else:
+            progress.empty()
+            st.success(T["import_success"].format(**result))
+            for error in result["errors"][:50]:
+                st.warning(error)
+
+
 st.divider()
 
 # Show last transactions
 st.subheader(T["recent_transactions"])
 conn = get_db()
 query = """
-    SELECT d.name || '@' || CAST(p.strike AS TEXT) || sc.symbol || ' ' || bp.name,
-           t.price,
-           t.qty,
-           t.tax,
-           t.total_price,
-           a.name,
-           t.open_qty,
-           t.date
-    FROM transactions t
-    JOIN products p ON t.product_id = p.id
-    JOIN directions d ON p.direction_id = d.id
-    JOIN basis_products bp ON p.basis_product_id = bp.id
-    JOIN strike_currencies sc ON p.strike_currency_id = sc.id
-    JOIN actions a ON t.action_id = a.id
-    ORDER BY t.id DESC
+    SELECT label, price, qty, tax, total_price, action, open_qty, date
+    FROM v_transaction_list
+    ORDER BY transaction_id DESC
     LIMIT 10
 """
 column_names = [T["name_col"], T["price_per_unit"], T["quantity"], T["tax"], T["total_price"],
                 T["action_col"], T["open_qty_col"], T["transaction_date"]]
 
 try:
-    rows = conn.execute(query).fetchall()
-    df = pd.DataFrame(rows, columns=column_names)
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    with section("recent_transactions"):
+        # pandas is loaded after the forms have been rendered
+        import pandas as pd
+        rows = conn.execute(query).fetchall()
+        df = pd.DataFrame(rows, columns=column_names)
+        if "Date" in df.columns:
+            df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
 except Exception as e:
     st.error(f"Error loading data: {e}")
-    df = pd.DataFrame()
+    df = []
 
 st.dataframe(df, use_container_width=True)
+
+end()
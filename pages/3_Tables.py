@@ -1,10 +1,16 @@
+import os
+import tempfile
 import streamlit as st
-import pandas as pd
 
-from utils.db_helper import get_db
-from utils.settings_handler import get_lang
+from utils.db_helper import get_db, get_options
+from utils.exporter import DOWNLOAD_MAX_ROWS, FORMATS, ExportTooLarge, available_formats, export_transactions
+from utils.pagination import TransactionFilter, fetch_page, count_transactions, last_page_size
+from utils.profiler import begin, end, section
+from utils.settings_handler import get_lang, init_user
 
 st.set_page_config(page_title="OptionsTracker – Tables", layout="wide", page_icon="📋")
+begin("tables")
+init_user()
 
 T = get_lang()
 
@@ -19,52 +25,151 @@ with col1:
 with col2:
     limit = st.selectbox(T["rows"], [10, 25, 50, 100], index=1)
 
-column_names = []
+
+def _reset_pager():
+    st.session_state["tx_cursor"] = ("first", None)
+    st.session_state["tx_page_index"] = 0
+    st.session_state.pop("tx_shown", None)
+
+
+def _flip(mode, key, delta):
+    # The shown page is kept to fall back to if the flip finds no rows
+    st.session_state["tx_shown"] = (st.session_state["tx_cursor"], st.session_state["tx_page_index"])
+    st.session_state["tx_cursor"] = (mode, key)
+    st.session_state["tx_page_index"] = delta
+
+
 if tab == T["products_table"]:
     st.subheader(T["products_table"])
     query = """
-        SELECT bp.name,
-               pt.name,
-               d.name,
-               CAST(p.strike AS TEXT) || sc.symbol,
-               p.wkn,
-               p.expiry_date
-        FROM products p
-        JOIN basis_products bp ON p.basis_product_id = bp.id
-        JOIN product_types pt ON p.product_type_id = pt.id
-        JOIN directions d ON p.direction_id = d.id
-        JOIN strike_currencies sc ON p.strike_currency_id = sc.id
+        SELECT basis_product,
+               product_type,
+               direction,
+               CAST(strike AS TEXT) || strike_currency,
+               wkn,
+               expiry_date
+        FROM v_products
         LIMIT ?
     """
     column_names = T["table_columns_products"]
+
+    # pandas is loaded after the selection widgets have been rendered
+    import pandas as pd
+
+    try:
+        rows = conn.execute(query, (limit,)).fetchall()
+        df = pd.DataFrame(rows, columns=column_names)
+    except Exception as e:
+        st.error(f"{T['error_loading']} {e}")
+        df = pd.DataFrame()
+
+    st.dataframe(df, use_container_width=True)
 else:
     st.subheader(T["transactions_table"])
-    query = """
-        SELECT d.name || '@' || CAST(p.strike AS TEXT) || sc.symbol || ' ' || bp.name,
-               t.price,
-               t.qty,
-               t.tax,
-               t.total_price,
-               a.name,
-               t.open_qty,
-               t.date
-        FROM transactions t
-        JOIN products p ON t.product_id = p.id
-        JOIN directions d ON p.direction_id = d.id
-        JOIN basis_products bp ON p.basis_product_id = bp.id
-        JOIN strike_currencies sc ON p.strike_currency_id = sc.id
-        JOIN actions a ON t.action_id = a.id
-        LIMIT ?
-    """
-    column_names = T["table_columns_transactions"]
-
-try:
-    rows = conn.execute(query, (limit,)).fetchall()
-    df = pd.DataFrame(rows, columns=column_names)
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-except Exception as e:
-    st.error(f"{T['error_loading']} {e}")
-    df = pd.DataFrame()
-
-st.dataframe(df, use_container_width=True)
+    basis_options = get_options("SELECT id, name FROM basis_products ORDER BY name")
+    type_options = get_options("SELECT id, name FROM product_types")
+    action_options = get_options("SELECT id, name FROM actions")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        basis_ids = st.multiselect(T["filter_underlying"], basis_options, format_func=lambda x: x[1])
+    with col2:
+        type_ids = st.multiselect(T["product_type"], type_options, format_func=lambda x: x[1])
+    with col3:
+        action_ids = st.multiselect(T["action_col"], action_options, format_func=lambda x: x[1])
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        date_from = st.date_input(T["filter_date_from"], value=None)
+    with col2:
+        date_to = st.date_input(T["filter_date_to"], value=None)
+    with col3:
+        descending = st.toggle(T["sort_newest_first"], value=True)
+
+    flt = TransactionFilter([x[0] for x in basis_ids], [x[0] for x in type_ids], [x[0] for x in action_ids],
+                            date_from, date_to)
+
+    # A new filter, sort order or page size starts again at the first page
+    signature = (flt.key(), descending, limit)
+    if st.session_state.get("tx_signature") != signature:
+        st.session_state["tx_signature"] = signature
+        _reset_pager()
+
+    import pandas as pd
+
+    def _fetch(total):
+        mode, key = st.session_state["tx_cursor"]
+        # The last page starts at a page boundary, so it holds the remainder of the rows
+        size = last_page_size(total, limit) if mode == "last" else limit
+        return fetch_page(flt, size, descending, after=key if mode == "after" else None,
+                          before=key if mode == "before" else None, last=mode == "last")
+
+    try:
+        with section("count"):
+            total = count_transactions(flt)
+        with section("page_fetch"):
+            rows, first_key, last_key = _fetch(total)
+        # Flipping past either end (e.g. rows deleted meanwhile) keeps the current page
+        if not rows and "tx_shown" in st.session_state:
+            st.session_state["tx_cursor"], st.session_state["tx_page_index"] = st.session_state.pop("tx_shown")
+            rows, first_key, last_key = _fetch(total)
+        if not rows and st.session_state["tx_cursor"][0] != "first":
+            _reset_pager()
+            rows, first_key, last_key = _fetch(total)
+        df = pd.DataFrame([row[2:] + row[1:2] for row in rows], columns=T["table_columns_transactions"])
+        df[T["table_columns_transactions"][-1]] = pd.to_datetime(df[T["table_columns_transactions"][-1]],
+                                                                 errors="coerce")
+    except Exception as e:
+        st.error(f"{T['error_loading']} {e}")
+        total, rows, first_key, last_key = 0, [], None, None
+        df = pd.DataFrame()
+
+    with section("dataframe_render"):
+        st.dataframe(df, use_container_width=True)
+
+    pages = max(1, -(-total // limit))
+    mode = st.session_state["tx_cursor"][0]
+    page_index = st.session_state["tx_page_index"]
+    page_index = pages - 1 if mode == "last" else min(max(page_index, 0), pages - 1)
+    st.session_state["tx_page_index"] = page_index
+
+    col1, col2, col3, col4, col5 = st.columns([1, 1, 3, 1, 1])
+    with col1:
+        st.button(T["page_first"], on_click=_reset_pager, disabled=page_index == 0)
+    with col2:
+        st.button(T["page_prev"], on_click=_flip, args=("before", first_key, page_index - 1),
+                  disabled=page_index == 0 or first_key is None)
+    with col3:
+        st.caption(T["page_info"].format(page=page_index + 1, pages=pages, total=total))
+    with col4:
+        st.button(T["page_next"], on_click=_flip, args=("after", last_key, page_index + 1),
+                  disabled=page_index >= pages - 1 or last_key is None)
+    with col5:
+        st.button(T["page_last"], on_click=_flip, args=("last", None, pages - 1), disabled=page_index >= pages - 1)
+
+# Export
+st.subheader(T["export_title"])
+col1, col2 = st.columns([3, 1])
+with col1:
+    export_format = st.selectbox(T["export_format"], available_formats(), format_func=str.upper)
+with col2:
+    st.write("")
+    prepare = st.button(T["export_prepare"])
+
+if prepare:
+    mime, suffix = FORMATS[export_format]
+    # The export is streamed to a temporary file; the download button keeps the file in memory
+    # while it is offered, so larger histories are left to the command line exporter
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"transactions{suffix}")
+        try:
+            rows = export_transactions(path, export_format, max_rows=DOWNLOAD_MAX_ROWS)
+        except ExportTooLarge as e:
+            st.warning(T["export_too_large"].format(rows=e.rows, max_rows=e.max_rows, suffix=suffix))
+        except Exception as e:
+            st.error(f"{T['export_error']} {e}")
+        else:
+            with open(path, "rb") as f:
+                st.download_button(T["export_download"].format(rows=rows), f, file_name=f"transactions{suffix}",
+                                   mime=mime)
+
+end()
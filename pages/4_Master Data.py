@@ -1,9 +1,12 @@
 import streamlit as st
 
-from utils.db_helper import get_db
-from utils.settings_handler import get_lang
+from utils.db_helper import get_db, mark_data_changed
+from utils.settings_handler import get_lang, init_user
+from utils.profiler import begin, end
 
 st.set_page_config(page_title="OptionsTracker – Master Data", layout="wide", page_icon="💾")
+begin("master_data")
+init_user()
 
 T = get_lang()
 
@@ -21,6 +24,7 @@ with tabs[0]:
         if new_basis.strip():
             conn.execute("INSERT INTO basis_products (name) VALUES (?)", (new_basis.strip(),))
             conn.commit()
+            mark_data_changed()
             st.success(f"'{new_basis}'{T['added_successfully']}")
         else:
             st.warning(T["input_warning"])
@@ -48,9 +52,12 @@ with tabs[3]:
         if new_currency.strip():
             conn.execute("INSERT INTO strike_currencies (symbol) VALUES (?)", (new_currency.strip(),))
             conn.commit()
+            mark_data_changed()
             st.success(f"'{new_currency}'{T['added_successfully']}")
         else:
             st.warning(T["input_warning"])
 
     rows = conn.execute("SELECT symbol FROM strike_currencies ORDER BY id").fetchall()
     st.table(rows)
+
+end()
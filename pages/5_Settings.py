@@ -1,19 +1,27 @@
 import streamlit as st
 
 import utils.settings_handler as sh
-from utils.settings_handler import get_lang, init_settings_db, load_settings, save_settings
+from utils.settings_handler import get_lang, init_settings_db, get_settings, save_settings, init_user, SettingsConflict
+from utils.profiler import begin, end
 
 st.set_page_config(page_title="OptionsTracker – Settings", layout="wide", page_icon="📥")
+begin("settings")
+init_user()
 
 init_settings_db()
-stored = load_settings()
-for key, value in stored.items():
+settings = get_settings()
+if "settings_version" not in st.session_state:
+    # Version of the stored row the form values are based on
+    st.session_state.settings_version = settings.version
+for key, value in settings.as_dict().items():
     if key not in st.session_state:
         st.session_state[key] = value
 
 T = get_lang()
 
 st.title(T["title_settings_site"])
+if st.session_state.pop("settings_conflict", False):
+    st.warning(T["settings_conflict"])
 
 # ----- language -----
 st.subheader(T["language_section_settings_site"])
@@ -76,12 +84,22 @@ st.session_state.date_format = date_formats[new_date_label]
 
 
 if st.button(T["save_settings"]):
-    save_settings({
-        "language_code": st.session_state.language_code,
-        "tax_rate": st.session_state.tax_rate,
-        "date_format": st.session_state.date_format,
-        "tax_allowance": st.session_state.tax_allowance,
-        "loss_carryforward": st.session_state.loss_carryforward,
-        "theme_mode":st.session_state.theme_mode
-    })
+    try:
+        saved = save_settings({
+            "language_code": st.session_state.language_code,
+            "tax_rate": st.session_state.tax_rate,
+            "date_format": st.session_state.date_format,
+            "tax_allowance": st.session_state.tax_allowance,
+            "loss_carryforward": st.session_state.loss_carryforward,
+            "theme_mode":st.session_state.theme_mode
+        }, expected_version=st.session_state.settings_version)
+    except SettingsConflict:
+        # Changed in another session: reload the stored values instead of overwriting them
+        for key in tuple(settings.as_dict()) + ("settings_version",):
+            st.session_state.pop(key, None)
+        st.session_state.settings_conflict = True
+    else:
+        st.session_state.settings_version = saved.version
     st.rerun()
+
+end()
@@ -0,0 +1,112 @@
+import os
+from datetime import datetime
+
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+
+from utils.db_helper import get_pool_stats
+from utils.analytics_worker import get_analytics_stats
+from utils.frame_snapshot import get_snapshot_stats
+from utils.query_stats import ENABLED, SLOW_QUERY_MS, get_query_stats, get_slow_queries, reset_query_stats
+from utils.profiler import PROFILE_DIR, get_page_profiles, reset_page_profiles
+from utils.settings_handler import get_lang, init_user
+
+st.set_page_config(page_title="OptionsTracker – Diagnostics", layout="wide", page_icon="🩺")
+init_user()
+
+T = get_lang()
+
+st.title(T["title_diagnostics_site"])
+
+# Only available when explicitly enabled for this deployment
+if os.environ.get("DIAGNOSTICS_ENABLED", "0") not in ("1", "true", "True"):
+    st.info(T["diagnostics_disabled"])
+    st.stop()
+
+# ----- connection pool -----
+st.subheader(T["diagnostics_pool"])
+pool = get_pool_stats()
+cols = st.columns(6)
+for col, key in zip(cols, ["databases", "open", "in_use", "idle", "opened", "reused"]):
+    col.metric(key, pool[key])
+
+# ----- analytics worker -----
+st.subheader(T["diagnostics_analytics"])
+analytics = get_analytics_stats()
+cols = st.columns(5)
+cols[0].metric("builds", analytics["builds"])
+cols[1].metric("notifications", analytics["notifications"])
+cols[2].metric("failures", analytics["failures"])
+cols[3].metric("last build", f"{analytics['last_seconds'] * 1000:.0f} ms" if analytics["last_seconds"] else "–")
+cols[4].metric("snapshot",
+               f"{datetime.fromtimestamp(analytics['created']):%H:%M:%S}" if analytics["created"] else "–")
+st.caption(T["diagnostics_frame_snapshot"].format(**get_snapshot_stats()))
+
+# ----- query statistics -----
+st.subheader(T["diagnostics_queries"])
+if not ENABLED:
+    st.info(T["diagnostics_queries_disabled"])
+else:
+    stats = pd.DataFrame(get_query_stats())
+    if stats.empty:
+        st.info(T["diagnostics_no_queries"])
+    else:
+        st.dataframe(stats[["count", "total_ms", "mean_ms", "p95_ms", "max_ms", "rows", "sql"]].round(3),
+                     use_container_width=True, hide_index=True)
+    if st.button(T["diagnostics_reset"]):
+        reset_query_stats()
+        st.rerun()
+
+# ----- slow queries -----
+st.subheader(T["diagnostics_slow_queries"].format(ms=SLOW_QUERY_MS))
+slow = get_slow_queries()
+if not slow:
+    st.info(T["diagnostics_no_slow_queries"])
+for entry in reversed(slow):
+    label = f"{datetime.fromtimestamp(entry['time']):%H:%M:%S} · {entry['ms']:.1f} ms · {entry['rows']:,} rows"
+    with st.expander(label):
+        st.code(entry["sql"], language="sql")
+        if entry["plan"]:
+            st.code(entry["plan"], language="text")
+
+# ----- page profiles -----
+st.subheader(T["diagnostics_page_profiles"])
+profiles = get_page_profiles()
+if not profiles:
+    st.info(T["diagnostics_no_profiles"].format(dir=PROFILE_DIR))
+else:
+    runs = pd.DataFrame([{"page": page, **{k: v for k, v in run.items() if k != "sections"}}
+                         for page, page_runs in profiles.items() for run in page_runs])
+    summary = runs.groupby("page").agg(
+        runs=("wall_ms", "size"),
+        mean_ms=("wall_ms", "mean"),
+        p95_ms=("wall_ms", lambda x: x.quantile(0.95)),
+        max_ms=("wall_ms", "max"),
+        p95_peak_mb=("peak_mb", lambda x: x.quantile(0.95)),
+    ).round(2)
+    st.dataframe(summary, use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fig_wall = px.histogram(runs, x="wall_ms", color="page", nbins=40, barmode="overlay",
+                                title=T["diagnostics_rerun_time"])
+        st.plotly_chart(fig_wall, use_container_width=True)
+    with col2:
+        fig_peak = px.histogram(runs, x="peak_mb", color="page", nbins=40, barmode="overlay",
+                                title=T["diagnostics_peak_memory"])
+        st.plotly_chart(fig_peak, use_container_width=True)
+
+    sections = pd.DataFrame([{"page": page, "section": name, "ms": ms}
+                             for page, page_runs in profiles.items() for run in page_runs
+                             for name, ms in run["sections"].items()])
+    if not sections.empty:
+        section_summary = sections.groupby(["page", "section"])["ms"].agg(
+            mean="mean", p95=lambda x: x.quantile(0.95)).reset_index()
+        fig_sections = px.bar(section_summary, x="mean", y="section", color="page", orientation="h",
+                              hover_data=["p95"], title=T["diagnostics_section_time"])
+        st.plotly_chart(fig_sections, use_container_width=True)
+
+    if st.button(T["diagnostics_reset_profiles"]):
+        reset_page_profiles()
+        st.rerun()
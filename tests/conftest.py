@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import init_db  # noqa: E402
+from utils.db_helper import get_db, reset_db_path  # noqa: E402
+from utils.fifo import LOT_BOOK  # noqa: E402
+from utils.settings_store import invalidate_settings  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Fresh database with tables, master data and migrations as the default user's DATABASE_PATH."""
+    path = str(tmp_path / "options_tracker.db")
+    init_db.create_tables(path)
+    init_db.fill_tables(path)
+    monkeypatch.setenv("DATABASE_PATH", path)
+    reset_db_path()
+    LOT_BOOK.invalidate()
+    invalidate_settings()
+    yield get_db()
+    reset_db_path()
@@ -0,0 +1,115 @@
+import io
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from utils import analytics_worker
+from utils.analytics_worker import Analytics, current_snapshot
+from utils.db_helper import get_db_path
+from utils.frame_snapshot import drop_snapshot
+from utils.importer import import_csv
+from utils.overview_helper import invalidate_data_cache
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+@pytest.fixture
+def analytics(db, monkeypatch):
+    import_csv(io.StringIO(HEADER + "\n2024-01-02,buy,DAX,Knock-Out,Long,18000,€,10,2,1\n"))
+    invalidate_data_cache()
+    drop_snapshot()
+    analytics = Analytics().start()
+    monkeypatch.setattr(analytics_worker, "ANALYTICS", analytics)
+    yield analytics
+    analytics.shutdown()
+    invalidate_data_cache()
+    drop_snapshot()
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def sell(rows="2024-01-03,sell,DAX,Knock-Out,Long,18000,€,10,3,1\n"):
+    import_csv(io.StringIO(HEADER + "\n" + rows))
+
+
+def test_first_snapshot_is_built_in_the_calling_thread(analytics):
+    snapshot, current = current_snapshot()
+
+    assert current
+    assert len(snapshot.df) == 1
+    assert list(snapshot.open_positions["open_qty"]) == [10]
+    assert analytics.stats()["builds"] == 1
+
+
+def test_write_rebuilds_the_snapshot_in_the_background(analytics):
+    first, _ = current_snapshot()
+
+    sell()
+    wait_for(lambda: analytics.worker().snapshot is not first)
+
+    snapshot, current = current_snapshot()
+    assert current
+    assert snapshot.version > first.version
+    assert sorted(snapshot.df["action"]) == ["buy", "sell"]
+    assert snapshot.open_positions.empty
+
+
+def test_write_of_another_process_is_noticed(analytics):
+    first, _ = current_snapshot()
+
+    other = sqlite3.connect(get_db_path())
+    other.execute("UPDATE transactions SET price = 2.5")
+    other.commit()
+    other.close()
+
+    stale, current = current_snapshot()
+    assert stale is first and not current
+    wait_for(lambda: current_snapshot()[1])
+    assert current_snapshot()[0].df["price"].tolist() == [2.5]
+
+
+def test_notifications_during_a_build_queue_one_more(analytics, monkeypatch):
+    worker = analytics.worker()
+    worker.ensure()
+    started, release = threading.Event(), threading.Event()
+    build = analytics_worker.build_snapshot
+    builds = []
+
+    def slow_build():
+        builds.append(1)
+        started.set()
+        release.wait(10)
+        return build()
+
+    monkeypatch.setattr(analytics_worker, "build_snapshot", slow_build)
+    worker.notify()
+    assert started.wait(10)
+    for _ in range(5):
+        worker.notify()
+    release.set()
+
+    wait_for(lambda: not worker.stats()["queued"] and worker.stats()["builds"] == 3)
+    analytics.shutdown()
+    assert len(builds) == 2
+    assert worker.stats()["notifications"] == 6
+
+
+def test_failed_build_keeps_the_last_snapshot(analytics, monkeypatch):
+    worker = analytics.worker()
+    first = worker.ensure()
+
+    def fail():
+        raise RuntimeError("build failed")
+
+    monkeypatch.setattr(analytics_worker, "build_snapshot", fail)
+    worker.notify()
+
+    wait_for(lambda: worker.stats()["failures"] == 1)
+    assert worker.snapshot is first
@@ -0,0 +1,77 @@
+import pytest
+
+from utils.barrier_monitor import LONG, SHORT, Barrier, BarrierBook, monitor, parse_tick
+
+
+def barrier(trade_id, direction, strike, underlying="DAX"):
+    return Barrier(trade_id, trade_id, f"{underlying} {direction} {strike}", underlying, direction, strike, 100.0)
+
+
+@pytest.fixture
+def book():
+    return BarrierBook([
+        barrier(1, LONG, 18000.0),
+        barrier(2, LONG, 17500.0),
+        barrier(3, SHORT, 19000.0),
+        barrier(4, SHORT, 19500.0),
+        barrier(5, LONG, 150.0, underlying="Nvidia"),
+    ])
+
+
+def ids(barriers):
+    return sorted(b.trade_id for b in barriers)
+
+
+def test_tick_between_barriers_knocks_nothing(book):
+    assert book.tick("DAX", 18500.0) == []
+    assert len(book) == 5
+
+
+def test_long_is_knocked_out_at_and_below_its_barrier(book):
+    assert book.tick("DAX", 18000.01) == []
+    assert ids(book.tick("DAX", 18000.0)) == [1]
+    assert ids(book.tick("DAX", 17000.0)) == [2]
+    assert book.tick("DAX", 16000.0) == []
+
+
+def test_short_is_knocked_out_at_and_above_its_barrier(book):
+    assert book.tick("DAX", 18999.99) == []
+    assert ids(book.tick("DAX", 19000.0)) == [3]
+    assert ids(book.tick("DAX", 20000.0)) == [4]
+    assert book.tick("DAX", 21000.0) == []
+
+
+def test_gap_knocks_out_every_crossed_barrier(book):
+    assert ids(book.tick("DAX", 17000.0)) == [1, 2]
+    assert ids(book.tick("DAX", 25000.0)) == [3, 4]
+    assert len(book) == 1
+
+
+def test_tick_only_touches_its_underlying(book):
+    assert book.tick("Apple", 0.0) == []
+    assert ids(book.tick(" nvidia ", 150.0)) == [5]
+    assert len(book) == 4
+
+
+def test_parse_tick_formats():
+    assert parse_tick("DAX;18.234,56;2024-05-01T09:00") == ("DAX", 18234.56, "2024-05-01T09:00")
+    assert parse_tick("DAX,18234.5") == ("DAX", 18234.5, None)
+    assert parse_tick('{"underlying": "DAX", "price": "18000"}') == ("DAX", 18000.0, None)
+    assert parse_tick("# comment") is None
+    with pytest.raises(ValueError):
+        parse_tick("DAX")
+
+
+def test_monitor_reports_failed_knockout_and_goes_on(book):
+    errors, booked = [], []
+
+    def on_knockout(suggestion):
+        if suggestion["trade_id"] == 1:
+            raise RuntimeError("booking failed")
+        booked.append(suggestion["trade_id"])
+
+    ticks = monitor(["DAX;17999", "garbage", "DAX;17000"], on_knockout, book=book, on_error=errors.append)
+
+    assert ticks == 2
+    assert booked == [2]
+    assert [type(e) for e in errors] == [RuntimeError, ValueError]
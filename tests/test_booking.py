@@ -0,0 +1,85 @@
+import io
+from datetime import date
+
+import pytest
+
+from utils import booking
+from utils.booking import book_partial_sell, book_redemption, book_sell
+from utils.importer import import_csv
+from utils.settings_store import get_settings, save_settings
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+@pytest.fixture
+def trade(db):
+    """One open DAX trade with lots of 10 @ 2.10 and 10 @ 3.10 (incl. fees); returns (trade_id, product_id)."""
+    import_csv(io.StringIO(HEADER + "\n"
+                           "2024-01-02,buy,DAX,Knock-Out,Long,18000,€,10,2,1\n"
+                           "2024-01-03,rebuy,DAX,Knock-Out,Long,18000,€,10,3,1\n"))
+    save_settings({"tax_rate": 0.25, "tax_allowance": 10.0, "loss_carryforward": 5.0})
+    return tuple(db.execute("SELECT trade_id, product_id FROM transactions").fetchone())
+
+
+def snapshot(db):
+    return [[tuple(row) for row in db.execute(sql)] for sql in (
+        "SELECT * FROM transactions ORDER BY id",
+        "SELECT * FROM positions ORDER BY trade_id",
+        "SELECT * FROM daily_pnl ORDER BY date",
+        "SELECT tax_allowance, loss_carryforward, version FROM settings",
+    )]
+
+
+def test_sell_taxes_the_gain_with_the_stored_state(db, trade):
+    trade_id, product_id = trade
+    # A preview from cached settings is stale once another session booked a gain
+    get_settings()
+    db.execute("UPDATE settings SET tax_allowance = 0, loss_carryforward = 0")
+    db.commit()
+
+    book_sell(trade_id, date(2024, 1, 5), product_id, 4.0, 20, 1.0, total_price=79.0, price_correct=1, gain=27.0)
+
+    row = db.execute("SELECT tax, total_price, gain FROM transactions WHERE action_id = 2").fetchone()
+    assert tuple(row) == (6.75, 72.25, 20.25)
+    assert db.execute("SELECT open_qty FROM positions WHERE trade_id = ?", (trade_id,)).fetchone() is None
+
+
+def test_partial_sells_use_up_carryforward_and_allowance(db, trade):
+    trade_id, product_id = trade
+
+    book_partial_sell(trade_id, date(2024, 1, 5), product_id, 3.0, 10, 0.0, total_price=30.0, price_correct=1,
+                      gain=9.0)
+    book_partial_sell(trade_id, date(2024, 1, 6), product_id, 5.0, 10, 0.0, total_price=50.0, price_correct=1,
+                      gain=19.0)
+
+    taxes = [row[0] for row in db.execute("SELECT tax FROM transactions WHERE action_id = 4 ORDER BY id")]
+    # 9 = 5 carryforward + 4 allowance; of 19 the remaining 6 allowance are free
+    assert taxes == [0.0, 3.25]
+    settings = get_settings()
+    assert (settings.tax_allowance, settings.loss_carryforward) == (0.0, 0.0)
+
+
+def test_redemption_loss_adds_to_the_carryforward(db, trade):
+    trade_id, product_id = trade
+
+    book_redemption(trade_id, date(2024, 1, 5), product_id, total_price=40.0, gain=-12.0)
+
+    assert tuple(db.execute("SELECT tax, gain FROM transactions WHERE action_id = 5").fetchone()) == (0.0, -12.0)
+    assert get_settings().loss_carryforward == 17.0
+
+
+@pytest.mark.parametrize("book, partial", [(book_sell, False), (book_partial_sell, True)])
+def test_failed_booking_persists_nothing(db, trade, monkeypatch, book, partial):
+    trade_id, product_id = trade
+    before = snapshot(db)
+
+    def fail(conn, *days):
+        raise RuntimeError("ledger failed")
+
+    monkeypatch.setattr(booking, "refresh_daily_pnl", fail)
+    with pytest.raises(RuntimeError, match="ledger failed"):
+        book(trade_id, date(2024, 1, 5), product_id, 5.0, 10 if partial else 20, 1.0, total_price=49.0,
+             price_correct=1, gain=20.0)
+
+    assert snapshot(db) == before
+    assert get_settings().tax_allowance == 10.0
@@ -0,0 +1,76 @@
+import csv
+import io
+
+import pytest
+
+from utils.exporter import TRANSACTION_COLUMNS, ExportTooLarge, export_transactions
+from utils.importer import import_csv
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+@pytest.fixture
+def history(db):
+    import_csv(io.StringIO(HEADER + "\n"
+                           "2024-01-02,buy,DAX,Knock-Out,Long,18000,€,10,2,1\n"
+                           "2024-01-03,buy,Nvidia,Warrant,Call,150,$,5,1.5,1\n"
+                           "2024-01-04,sell,DAX,Knock-Out,Long,18000,€,10,3,1\n"))
+    return db
+
+
+def test_csv_export_streams_every_row_in_date_order(history, tmp_path):
+    path = tmp_path / "transactions.csv"
+
+    assert export_transactions(str(path), chunk_size=2) == 3
+
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == TRANSACTION_COLUMNS
+    assert [(row["date"], row["underlying"], row["action"], row["qty"]) for row in rows] == [
+        ("2024-01-02", "DAX", "buy", "10"), ("2024-01-03", "Nvidia", "buy", "5"), ("2024-01-04", "DAX", "sell", "10"),
+    ]
+    assert (rows[1]["direction"], rows[1]["currency"], rows[1]["strike"]) == ("Call", "$", "150.0")
+    assert float(rows[2]["gain"]) == pytest.approx(29 - 21)
+
+
+def test_excel_export_has_transactions_and_products(history, tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    path = tmp_path / "history.xlsx"
+
+    assert export_transactions(str(path), chunk_size=2) == 3
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    assert workbook.sheetnames == ["Transactions", "Products"]
+    transactions = list(workbook["Transactions"].values)
+    assert list(transactions[0]) == TRANSACTION_COLUMNS
+    assert [row[11] for row in transactions[1:]] == ["buy", "buy", "sell"]
+    assert len(list(workbook["Products"].values)) == 3
+
+
+def test_parquet_export_keeps_the_column_types(history, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "history.parquet"
+
+    assert export_transactions(str(path), chunk_size=2) == 3
+
+    table = pq.read_table(path)
+    assert table.column_names == TRANSACTION_COLUMNS
+    assert table.column("qty").to_pylist() == [10, 5, 10]
+    assert table.column("strike").to_pylist() == [18000.0, 150.0, 18000.0]
+    assert table.column("expiry_date").null_count == 3
+
+
+def test_row_limit_is_checked_before_writing(history, tmp_path):
+    path = tmp_path / "transactions.csv"
+
+    with pytest.raises(ExportTooLarge) as error:
+        export_transactions(str(path), max_rows=2)
+
+    assert (error.value.rows, error.value.max_rows) == (3, 2)
+    assert not path.exists()
+    assert export_transactions(str(path), max_rows=3) == 3
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported export format"):
+        export_transactions(str(tmp_path / "transactions.txt"))
@@ -0,0 +1,44 @@
+import io
+
+import pytest
+
+from utils.db_helper import write_transaction
+from utils.fifo import LOT_BOOK
+from utils.importer import import_csv
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+@pytest.fixture
+def trade(db):
+    """One open DAX trade with lots of 10 @ 2.10 and 10 @ 3.10 (incl. fees); returns its trade id."""
+    import_csv(io.StringIO(HEADER + "\n"
+                           "2024-01-02,buy,DAX,Knock-Out,Long,18000,€,10,2,1\n"
+                           "2024-01-03,rebuy,DAX,Knock-Out,Long,18000,€,10,3,1\n"))
+    return db.execute("SELECT trade_id FROM positions").fetchone()[0]
+
+
+def test_fifo_preview_takes_oldest_lots_first(trade):
+    preview = LOT_BOOK.preview(trade, 15, 4.0, 1.0)
+
+    assert preview["cost"] == pytest.approx(21 + 31 / 2)
+    assert preview["gross_gain"] == pytest.approx(59 - 36.5)
+    assert [used for _, used in preview["used_transactions"]] == [10, 5]
+
+
+def test_fifo_consume_updates_lots_and_position(db, trade):
+    used = LOT_BOOK.consume(trade, 15)
+
+    assert [qty for _, qty in used] == [10, 5]
+    assert [lot[2] for lot in LOT_BOOK.open_lots(trade)] == [5]
+    assert db.execute("SELECT open_qty FROM positions WHERE trade_id = ?", (trade,)).fetchone()[0] == 5
+
+
+def test_fifo_consume_joins_and_rolls_back_with_caller(db, trade):
+    with pytest.raises(RuntimeError):
+        with write_transaction(db) as conn:
+            LOT_BOOK.consume(trade, 15, conn=conn)
+            raise RuntimeError("booking failed")
+
+    assert [lot[2] for lot in LOT_BOOK.open_lots(trade)] == [10, 10]
+    assert db.execute("SELECT open_qty FROM positions WHERE trade_id = ?", (trade,)).fetchone()[0] == 20
@@ -0,0 +1,103 @@
+import io
+
+import pandas as pd
+import pytest
+
+from utils import frame_snapshot
+from utils.frame_snapshot import drop_snapshot, load_frame, open_snapshot, snapshot_dir
+from utils.importer import import_csv
+from utils.overview_helper import _query_data
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee,wkn"
+SORT = ["date", "transaction_id"]
+
+
+@pytest.fixture
+def frames(db, monkeypatch):
+    """Loads the transaction frame through the snapshot, starting without one."""
+    monkeypatch.setattr(frame_snapshot, "ENABLED", True)
+    drop_snapshot()
+    yield lambda: load_frame(_query_data, "transaction_id", SORT)
+    drop_snapshot()
+
+
+def import_rows(*rows):
+    import_csv(io.StringIO("\n".join((HEADER,) + rows) + "\n"))
+
+
+def buys(start, count):
+    return [f"2024-01-{day % 28 + 1:02d},buy,DAX,Knock-Out,Long,{100 + day},€,1,2,0,{'' if day % 2 else f'W{day}'}"
+            for day in range(start, start + count)]
+
+
+def assert_like_query(df):
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), _query_data(), check_dtype=False)
+
+
+def published_parts():
+    return len(open_snapshot(snapshot_dir()).parts)
+
+
+def test_snapshot_round_trip_with_deltas_and_compaction(db, frames, monkeypatch):
+    monkeypatch.setattr(frame_snapshot, "COMPACT_FRACTION", 0.5)
+    import_rows(*buys(0, 20))
+    assert_like_query(frames())
+    assert published_parts() == 1
+
+    # Insert and update: written as delta parts on top of the base part
+    import_rows(*buys(20, 3))
+    db.execute("UPDATE transactions SET price = 9.5, fee = NULL WHERE id = 2")
+    db.commit()
+    assert_like_query(frames())
+    assert published_parts() == 2
+    stats = frame_snapshot.get_snapshot_stats()
+
+    # A fresh process maps the base and the delta and combines them
+    drop_snapshot(remove_files=False)
+    assert_like_query(frames())
+    assert frame_snapshot.get_snapshot_stats()["mapped"] == stats["mapped"] + 1
+
+    # Deletes move the rewrite counter: a new base part replaces the chain
+    db.execute("DELETE FROM transactions WHERE id IN (3, 21)")
+    db.commit()
+    assert_like_query(frames())
+    assert published_parts() == 1
+
+    # Deltas beyond COMPACT_FRACTION of the base are compacted into one part
+    import_rows(*buys(30, 5))
+    assert_like_query(frames())
+    assert published_parts() == 2
+    import_rows(*buys(40, 10))
+    assert_like_query(frames())
+    assert published_parts() == 1
+
+
+def test_missing_text_stays_missing(db, frames):
+    import_rows(*buys(0, 4))
+    db.execute("UPDATE products SET wkn = NULL WHERE wkn = ''")
+    db.commit()
+
+    frames()
+    drop_snapshot(remove_files=False)
+    df = frames()
+
+    assert df["wkn"].isna().sum() == 2
+    assert not df["wkn"].isin(["None", "nan", "<NA>"]).any()
+    assert df["expiry_date"].isna().all()
+    assert_like_query(df)
+
+
+def test_text_columns_keep_missing_values_and_types(tmp_path):
+    df = pd.DataFrame({
+        "mixed": pd.Series(["a", None, 5, float("nan")], dtype=object),
+        "empty": pd.Series([None] * 4, dtype=object),
+        "text": pd.array(["x", pd.NA, "y", "x"], dtype="string"),
+    })
+
+    columns = frame_snapshot._write_columns(df, str(tmp_path))
+    restored = frame_snapshot._read_columns(str(tmp_path), columns)
+
+    assert restored["mixed"].tolist() == ["a", None, 5, None]
+    assert restored["empty"].isna().all()
+    assert restored["text"].isna().tolist() == [False, True, False, False]
+    assert restored["text"].dtype == df["text"].dtype
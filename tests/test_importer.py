@@ -0,0 +1,131 @@
+import io
+import sqlite3
+
+import pytest
+
+from utils.db_helper import get_db_path
+from utils.importer import ImportRowError, import_csv
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+def csv_stream(*rows):
+    return io.StringIO("\n".join((HEADER,) + rows) + "\n")
+
+
+def buys(count, underlying="ZZTEST"):
+    return [f"2024-01-{i % 28 + 1:02d},buy,{underlying}{i},Knock-Out,Long,{100 + i},€,10,1.5,1"
+            for i in range(count)]
+
+
+def insert_trade(conn, trade_id):
+    conn.execute("INSERT INTO products (basis_product_id, product_type_id, direction_id, strike, strike_currency_id)"
+                 " VALUES (1, 1, 1, 50, 1)")
+    product_id = conn.execute("SELECT MAX(id) FROM products").fetchone()[0]
+    conn.execute("INSERT INTO transactions (trade_id, date, product_id, price, qty, total_price, action_id, open_qty)"
+                 " VALUES (?, '2023-12-01', ?, 1, 1, 1, 1, 1)", (trade_id, product_id))
+    conn.commit()
+
+
+def test_import_allocates_ids_after_existing_rows(db):
+    insert_trade(db, 41)
+    last_txn = db.execute("SELECT MAX(id) FROM transactions").fetchone()[0]
+    last_product = db.execute("SELECT MAX(id) FROM products").fetchone()[0]
+
+    result = import_csv(csv_stream(*buys(25)), batch_size=10)
+
+    assert result["rows"] == 25
+    assert result["products_created"] == 25
+    rows = db.execute("SELECT id, trade_id, product_id FROM transactions WHERE id > ? ORDER BY id",
+                      (last_txn,)).fetchall()
+    assert [row[0] for row in rows] == list(range(last_txn + 1, last_txn + 26))
+    assert [row[1] for row in rows] == list(range(42, 67))
+    assert [row[2] for row in rows] == list(range(last_product + 1, last_product + 26))
+
+
+def test_rebuy_and_sell_reuse_the_open_trade(db):
+    result = import_csv(csv_stream(
+        "2024-01-02,buy,DAX,Knock-Out,Long,18000,€,10,2,1",
+        "2024-01-03,rebuy,DAX,Knock-Out,Long,18000,€,10,3,1",
+        "2024-01-04,partial sell,DAX,Knock-Out,Long,18000,€,15,4,1",
+        "2024-01-05,sell,DAX,Knock-Out,Long,18000,€,5,5,1",
+        "2024-01-06,buy,DAX,Knock-Out,Long,18000,€,1,1,0",
+    ))
+
+    assert result["rows"] == 5
+    rows = db.execute("SELECT trade_id, open_qty, gain FROM transactions ORDER BY id").fetchall()
+    assert [row[0] for row in rows] == [0, 0, 0, 0, 1]
+    # FIFO: the partial sell takes the first lot and half of the second
+    assert rows[2][2] == pytest.approx(15 * 4 - 1 - (21 + 31 / 2))
+    assert [row[1] for row in rows[:2]] == [0, 0]
+    assert [tuple(row) for row in db.execute("SELECT trade_id, open_qty FROM positions")] == [(1, 1.0)]
+
+
+def test_import_blocks_other_writers_until_commit(db):
+    path = get_db_path()
+    other = sqlite3.connect(path, timeout=0.1)
+    attempts = []
+
+    def progress(imported):
+        try:
+            other.execute("INSERT INTO basis_products (name) VALUES (?)", (f"other {imported}",))
+            other.commit()
+            attempts.append("inserted")
+        except sqlite3.OperationalError:
+            attempts.append("blocked")
+
+    import_csv(csv_stream(*buys(30)), batch_size=10, progress=progress)
+
+    assert attempts and set(attempts) == {"blocked"}
+    other.execute("INSERT INTO basis_products (name) VALUES ('after import')")
+    other.commit()
+    other.close()
+
+
+def test_failed_import_leaves_nothing_behind(db):
+    before = db.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    products = db.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    with pytest.raises(ImportRowError, match="Line 32"):
+        import_csv(csv_stream(*buys(30), "2024-02-01,sell,NOPE,Knock-Out,Long,1,€,1,1,1"), batch_size=10)
+
+    assert db.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == before
+    assert db.execute("SELECT COUNT(*) FROM products").fetchone()[0] == products
+    assert db.execute("SELECT COUNT(*) FROM basis_products WHERE name LIKE 'ZZTEST%'").fetchone()[0] == 0
+
+
+def test_skip_errors_reports_invalid_rows(db):
+    result = import_csv(csv_stream("2024-01-02,buy,DAX,Knock-Out,Long,18000,€,10,2,1",
+                                   "2024-01-03,buy,DAX,Knock-Out,Sideways,18000,€,10,2,1",
+                                   "not a date,buy,DAX,Knock-Out,Long,18000,€,10,2,1"),
+                        skip_errors=True)
+
+    assert result["rows"] == 1
+    assert result["skipped"] == 2
+    assert result["errors"][0].startswith("Line 3: unknown direction")
+
+
+GERMAN_HEADER = "date;action;underlying;product_type;direction;strike;currency;qty;price;fee"
+
+
+@pytest.mark.parametrize("qty, expected", [("1.000", 1000.0), ("12.500", 12500.0), ("1.000,0", 1000.0), ("7", 7.0)])
+def test_semicolon_files_use_decimal_comma(db, qty, expected):
+    import_csv(io.StringIO(f"{GERMAN_HEADER}\n02.01.2024;buy;DAX;Knock-Out;Long;18.000,5;€;{qty};1,25;1\n"))
+
+    row = db.execute("SELECT qty, price, total_price FROM transactions").fetchone()
+    assert tuple(row) == (expected, 1.25, expected * 1.25 + 1)
+    assert db.execute("SELECT strike FROM products").fetchone()[0] == 18000.5
+
+
+def test_comma_files_use_decimal_point(db):
+    import_csv(csv_stream('2024-01-02,buy,DAX,Knock-Out,Long,"18,000.5",€,1.5,12.500,0'))
+
+    assert tuple(db.execute("SELECT qty, price FROM transactions").fetchone()) == (1.5, 12.5)
+    assert db.execute("SELECT strike FROM products").fetchone()[0] == 18000.5
+
+
+def test_number_format_can_be_forced(db):
+    import_csv(io.StringIO(f"{GERMAN_HEADER}\n02.01.2024;buy;DAX;Knock-Out;Long;18000;€;12.5;1.25;0\n"),
+               decimal_comma=False)
+
+    assert tuple(db.execute("SELECT qty, price FROM transactions").fetchone()) == (12.5, 1.25)
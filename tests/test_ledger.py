@@ -0,0 +1,105 @@
+from datetime import date
+
+import pytest
+
+from utils.booking import book_partial_sell, book_sell
+from utils.db_helper import new_transaction, update_open_qty, write_transaction
+from utils.fifo import LOT_BOOK
+from utils.ledger import get_open_positions, rebuild_daily_pnl, rebuild_positions, refresh_daily_pnl
+
+BUY, REBUY = 1, 3
+
+
+@pytest.fixture
+def products(db):
+    """Two DAX knock-outs; returns their product ids."""
+    db.executemany("INSERT INTO products (basis_product_id, product_type_id, direction_id, strike, strike_currency_id)"
+                   " VALUES (3, 1, ?, ?, 1)", [(1, 18000), (2, 20000)])
+    db.commit()
+    return [row[0] for row in db.execute("SELECT id FROM products ORDER BY id")]
+
+
+def buy(trade_id, product_id, day, qty, price, action_id=BUY):
+    new_transaction(trade_id=trade_id, date=day, product_id=product_id, price=price, qty=qty, fee=1.0, tax=0.0,
+                    total_price=qty * price + 1.0, price_correct=1, action_id=action_id, open_qty=qty, gain=0)
+
+
+def table(db, sql):
+    return [tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in db.execute(sql)]
+
+
+def assert_matches_rebuild(db, sql, rebuild):
+    incremental = table(db, sql)
+    rebuild(db)
+    db.commit()
+    assert table(db, sql) == incremental
+    return incremental
+
+
+def assert_positions_match_rebuild(db):
+    return assert_matches_rebuild(db, "SELECT * FROM positions ORDER BY trade_id", rebuild_positions)
+
+
+def assert_daily_pnl_matches_rebuild(db):
+    return assert_matches_rebuild(db, "SELECT * FROM daily_pnl ORDER BY date", rebuild_daily_pnl)
+
+
+def test_positions_follow_buys_sells_and_corrections(db, products):
+    long_id, short_id = products
+
+    buy(0, long_id, "2024-01-02", 10, 2.0)
+    buy(1, short_id, "2024-01-02", 5, 4.0)
+    buy(0, long_id, "2024-01-03", 10, 3.0, action_id=REBUY)
+    assert assert_positions_match_rebuild(db) == [
+        (0, long_id, "Long@18000.0€ DAX", 20, 52.0), (1, short_id, "Short@20000.0€ DAX", 5, 21.0),
+    ]
+
+    book_partial_sell(0, date(2024, 1, 4), long_id, 4.0, 15, 1.0, total_price=59.0, price_correct=1, gain=22.5)
+    assert assert_positions_match_rebuild(db)[0][3] == 5
+
+    update_open_qty(1, 3)
+    assert assert_positions_match_rebuild(db)[1][3] == 3
+
+    book_sell(1, date(2024, 1, 5), short_id, 5.0, 3, 1.0, total_price=14.0, price_correct=1, gain=-7.0)
+    assert [position[0] for position in get_open_positions(db)] == [0]
+    assert_positions_match_rebuild(db)
+
+
+def test_consumed_lots_close_the_position(db, products):
+    buy(0, products[0], "2024-01-02", 10, 2.0)
+
+    LOT_BOOK.consume(0, 10)
+
+    assert get_open_positions(db) == []
+    assert assert_positions_match_rebuild(db) == []
+
+
+def test_daily_pnl_follows_bookings_in_any_date_order(db, products):
+    long_id, short_id = products
+    buy(0, long_id, "2024-01-02", 10, 2.0)
+    buy(1, short_id, "2024-01-03", 10, 2.0)
+    book_sell(0, date(2024, 1, 5), long_id, 3.0, 10, 1.0, total_price=29.0, price_correct=1, gain=8.0)
+    assert assert_daily_pnl_matches_rebuild(db) == [
+        ("2024-01-02", 0.0, 1, 1.0, 0.0, 0.0),
+        ("2024-01-03", 0.0, 1, 1.0, 0.0, 0.0),
+        ("2024-01-05", 8.0, 1, 1.0, 0.0, 8.0),
+    ]
+
+    # A backdated booking moves the cumulative gain of every later day
+    book_partial_sell(1, date(2024, 1, 4), short_id, 1.0, 5, 1.0, total_price=4.0, price_correct=1, gain=-7.0)
+    assert [row[5] for row in assert_daily_pnl_matches_rebuild(db)] == [0.0, 0.0, -7.0, 1.0]
+
+    # Several bookings on one day add up
+    buy(2, long_id, "2024-01-05", 1, 1.0)
+    assert assert_daily_pnl_matches_rebuild(db)[-1] == ("2024-01-05", 8.0, 2, 2.0, 0.0, 1.0)
+
+
+def test_daily_pnl_drops_days_without_transactions(db, products):
+    buy(0, products[0], "2024-01-02", 10, 2.0)
+    buy(1, products[1], "2024-01-03", 10, 2.0)
+
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM transactions WHERE trade_id = 0")
+        refresh_daily_pnl(conn, "2024-01-02")
+
+    assert [row[0] for row in assert_daily_pnl_matches_rebuild(db)] == ["2024-01-03"]
@@ -0,0 +1,62 @@
+import glob
+import sqlite3
+
+import pytest
+
+import init_db
+from utils.migrations import LATEST_VERSION, DuplicateProductsError, get_schema_version, migrate
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """Database created before the migrations, with product 3 a duplicate of product 1."""
+    path = str(tmp_path / "legacy.db")
+    init_db.create_tables(path)
+    init_db.fill_tables(path)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO products (id, basis_product_id, product_type_id, direction_id, strike,"
+                     " strike_currency_id) VALUES (?, 3, 1, 1, ?, 1)", [(1, 18000), (2, 19000), (3, 18000)])
+    conn.executemany("INSERT INTO transactions (trade_id, date, product_id, price, qty, total_price, action_id,"
+                     " open_qty) VALUES (?, '2024-01-02', ?, 2, 10, 21, 1, 10)", [(0, 1), (1, 2), (2, 3)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_migrate_applies_every_step_once(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    conn.execute("DELETE FROM transactions WHERE product_id = 3")
+    conn.execute("DELETE FROM products WHERE id = 3")
+    conn.commit()
+
+    assert migrate(conn) == list(range(1, LATEST_VERSION + 1))
+    assert migrate(conn) == []
+    assert get_schema_version(conn) == LATEST_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0] == 2
+
+
+def test_duplicate_products_stop_the_migration(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+
+    with pytest.raises(DuplicateProductsError, match=r"3 \(= 1\).*merge-duplicates") as error:
+        migrate(conn)
+
+    assert error.value.duplicates == [(3, 1)]
+    assert get_schema_version(conn) == 0
+    assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 3
+    assert [row[0] for row in conn.execute("SELECT product_id FROM transactions ORDER BY id")] == [1, 2, 3]
+
+
+def test_merge_duplicates_backs_up_merges_and_migrates(legacy_db, tmp_path):
+    assert init_db.merge_duplicates(legacy_db) == [(3, 1, 1)]
+
+    conn = sqlite3.connect(legacy_db)
+    assert get_schema_version(conn) == LATEST_VERSION
+    assert [row[0] for row in conn.execute("SELECT id FROM products ORDER BY id")] == [1, 2]
+    assert [row[0] for row in conn.execute("SELECT product_id FROM transactions ORDER BY id")] == [1, 2, 1]
+
+    backups = glob.glob(str(tmp_path / "legacy.before_merge_*.db"))
+    assert len(backups) == 1
+    backup = sqlite3.connect(backups[0])
+    assert backup.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 3
+    assert get_schema_version(backup) == 0
@@ -0,0 +1,69 @@
+import io
+import sqlite3
+
+import pytest
+
+from utils.db_helper import get_data_version, get_db_path, new_transaction
+from utils.frame_snapshot import drop_snapshot
+from utils.importer import import_csv
+from utils.overview_helper import get_data_cache_stats, invalidate_data_cache, load_data
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+@pytest.fixture
+def overview(db):
+    import_csv(io.StringIO(HEADER + "\n2024-01-02,buy,DAX,Knock-Out,Long,18000,€,10,2,1\n"))
+    invalidate_data_cache()
+    drop_snapshot()
+    yield db
+    invalidate_data_cache()
+    drop_snapshot()
+
+
+def test_reruns_without_writes_are_served_from_the_cache(overview):
+    version = get_data_version()
+    first = load_data()
+    hits = get_data_cache_stats()["hits"]
+
+    second = load_data()
+
+    assert get_data_version() == version
+    assert get_data_cache_stats()["hits"] == hits + 1
+    assert second["transaction_id"].tolist() == first["transaction_id"].tolist()
+
+
+def test_own_write_invalidates_the_cache(overview):
+    load_data()
+    version = get_data_version()
+    product_id = overview.execute("SELECT id FROM products").fetchone()[0]
+
+    new_transaction(trade_id=0, date="2024-01-03", product_id=product_id, price=3.0, qty=5, fee=1.0, tax=0.0,
+                    total_price=16.0, price_correct=1, action_id=3, open_qty=5, gain=0)
+
+    assert get_data_version() == version + 1
+    assert load_data()["action"].tolist() == ["rebuy", "buy"]
+
+
+def test_commit_of_another_connection_invalidates_the_cache(overview):
+    load_data()
+    version = get_data_version()
+
+    other = sqlite3.connect(get_db_path())
+    other.execute("UPDATE transactions SET price = 2.5")
+    other.commit()
+    other.close()
+
+    assert get_data_version() == version + 1
+    # Seen once, the commit does not count again
+    assert get_data_version() == version + 1
+    assert load_data()["price"].tolist() == [2.5]
+
+
+def test_reads_do_not_change_the_version(overview):
+    version = get_data_version()
+
+    overview.execute("SELECT COUNT(*) FROM transactions").fetchone()
+    load_data()
+
+    assert get_data_version() == version
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+from utils.importer import import_csv
+from utils.pagination import TransactionFilter, count_transactions, fetch_page, last_page_size
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+@pytest.fixture
+def history(db):
+    rows = [f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d},buy,Underlying {i % 7},Knock-Out,Long,{i},€,1,1,0"
+            for i in range(95)]
+    import_csv(io.StringIO("\n".join([HEADER] + rows) + "\n"))
+    return [tuple(row) for row in db.execute("SELECT id, date FROM transactions ORDER BY date DESC, id DESC")]
+
+
+def test_keyset_pages_cover_the_history_in_order(history):
+    flt = TransactionFilter()
+    seen, after = [], None
+    while True:
+        rows, _, last_key = fetch_page(flt, 10, after=after)
+        if not rows:
+            break
+        seen.extend((row[0], row[1]) for row in rows)
+        after = last_key
+
+    assert seen == history
+    assert count_transactions(flt) == len(history)
+
+
+def test_keyset_previous_and_last_page(history):
+    flt = TransactionFilter()
+    first, _, first_last = fetch_page(flt, 10)
+    second, second_first, _ = fetch_page(flt, 10, after=first_last)
+    back, _, _ = fetch_page(flt, 10, before=second_first)
+    last, last_first, _ = fetch_page(flt, last_page_size(95, 10), last=True)
+    before_last, _, _ = fetch_page(flt, 10, before=last_first)
+
+    assert back == first
+    assert [(row[0], row[1]) for row in second] == history[10:20]
+    # The last page starts at a page boundary: page 10 holds rows 91-95
+    assert [(row[0], row[1]) for row in last] == history[90:]
+    assert [(row[0], row[1]) for row in before_last] == history[80:90]
+
+
+def test_last_page_size():
+    assert [last_page_size(total, 10) for total in (0, 1, 10, 95, 100)] == [10, 1, 10, 5, 10]
+
+
+def test_count_follows_new_rows(history):
+    flt = TransactionFilter()
+    assert count_transactions(flt) == 95
+
+    import_csv(io.StringIO(HEADER + "\n2025-01-01,buy,DAX,Knock-Out,Long,1,€,1,1,0\n"))
+
+    assert count_transactions(flt) == 96
@@ -0,0 +1,115 @@
+import math
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.pricing import black_scholes, implied_volatility, norm_cdf, price_positions
+from utils.valuation import DirectoryQuoteSource, TableQuoteSource, read_quote_file, store_quotes
+
+
+def test_black_scholes_textbook_values():
+    call = black_scholes(100.0, 100.0, 1.0, 0.05, 0.2, True)
+    put = black_scholes(100.0, 100.0, 1.0, 0.05, 0.2, False)
+    assert float(call["value"]) == pytest.approx(10.4506, abs=1e-4)
+    assert float(put["value"]) == pytest.approx(5.5735, abs=1e-4)
+    # Put-call parity
+    assert float(call["value"] - put["value"]) == pytest.approx(100.0 - 100.0 * math.exp(-0.05), abs=1e-9)
+
+
+def test_black_scholes_expired_is_intrinsic():
+    greeks = black_scholes(np.array([120.0, 80.0]), 100.0, 0.0, 0.02, 0.3, np.array([True, False]))
+    assert list(greeks["value"]) == [20.0, 20.0]
+    assert list(greeks["delta"]) == [1.0, -1.0]
+
+
+def test_norm_cdf_matches_erf():
+    x = np.linspace(-6, 6, 121)
+    expected = [0.5 * (1.0 + math.erf(v / math.sqrt(2.0))) for v in x]
+    np.testing.assert_allclose(norm_cdf(x), expected, atol=1e-7)
+
+
+@pytest.mark.parametrize("is_call", [True, False])
+def test_implied_volatility_round_trip(is_call):
+    rng = np.random.default_rng(7)
+    n = 500
+    spot = rng.uniform(50, 150, n)
+    strike = rng.uniform(60, 140, n)
+    years = rng.uniform(0.05, 3.0, n)
+    volatility = rng.uniform(0.05, 1.5, n)
+    price = black_scholes(spot, strike, years, 0.02, volatility, is_call)["value"]
+
+    implied = implied_volatility(price, spot, strike, years, 0.02, is_call, tol=1e-10, max_iter=100)
+
+    # Deep in or out of the money the price hardly depends on the volatility; compare the prices there
+    solved = np.isfinite(implied)
+    assert solved.mean() > 0.95
+    repriced = black_scholes(spot[solved], strike[solved], years[solved], 0.02, implied[solved], is_call)["value"]
+    np.testing.assert_allclose(repriced, price[solved], atol=1e-8)
+    sensitive = solved & (black_scholes(spot, strike, years, 0.02, volatility, is_call)["vega"] > 1.0)
+    np.testing.assert_allclose(implied[sensitive], volatility[sensitive], rtol=1e-6)
+
+
+def test_implied_volatility_outside_bounds_is_nan():
+    # Below intrinsic value, above the spot, and expired
+    implied = implied_volatility([5.0, 101.0, 3.0], [110.0, 100.0, 100.0], [100.0, 100.0, 100.0],
+                                 [1.0, 1.0, 0.0], 0.0, True)
+    assert np.isnan(implied).all()
+
+
+def test_implied_volatility_is_nan_when_not_converged():
+    price = black_scholes(100.0, 100.0, 1.0, 0.02, 0.9, True)["value"]
+
+    assert np.isnan(implied_volatility(price, 100.0, 100.0, 1.0, 0.02, True, tol=1e-12, max_iter=1))
+    assert implied_volatility(price, 100.0, 100.0, 1.0, 0.02, True) == pytest.approx(0.9)
+
+
+def warrant_positions():
+    return pd.DataFrame({
+        "trade_id": [1], "label": ["Call@100€ DAX"], "open_qty": [10], "price_paid": [50.0], "wkn": ["DAX"],
+        "basis_product": ["Dax"], "direction": ["Call"], "strike": [100.0], "expiry_date": ["2025-01-01"],
+        "ratio": [None],
+    })
+
+
+def test_spot_prices_do_not_collide_with_product_quotes():
+    # The warrant's WKN is the underlying's name: its quote must not be taken as the spot
+    quotes = pd.DataFrame({"wkn": ["DAX"], "ts": ["2024-01-01"], "price": [10.0], "previous_close": [None]})
+    spots = pd.DataFrame({"underlying": ["DAX"], "ts": ["2024-01-01"], "price": [105.0], "previous_close": [None]})
+
+    pricing = price_positions(warrant_positions(), quotes, spots, today=date(2024, 1, 1), rate=0.0)
+
+    row = pricing.positions.iloc[0]
+    assert row["spot"] == 105.0
+    assert row["value"] == pytest.approx(10.0)
+    assert row["implied"] == pytest.approx(float(implied_volatility(10.0, 105.0, 100.0, row["years"], 0.0, True)))
+
+
+def test_spot_prices_round_trip_through_the_quote_store(db, tmp_path):
+    spot_file = tmp_path / "spots.csv"
+    spot_file.write_text("underlying;ts;price\nDax;2024-01-02;18.000,5\n")
+    quote_file = tmp_path / "quotes.csv"
+    quote_file.write_text("wkn,ts,price\nDAX,2024-01-02,1.5\n")
+
+    assert store_quotes(read_quote_file(str(spot_file))) == 1
+    assert store_quotes(read_quote_file(str(quote_file))) == 1
+
+    source = TableQuoteSource()
+    assert source.read_spots()[["underlying", "price"]].values.tolist() == [["DAX", 18000.5]]
+    assert source.read()[["wkn", "price"]].values.tolist() == [["DAX", 1.5]]
+    assert DirectoryQuoteSource(str(tmp_path)).read_spots()["price"].tolist() == [18000.5]
+
+
+def test_migration_moves_underlying_quotes_to_spot_prices(db):
+    from utils.migrations import _m011_spot_quotes
+
+    db.execute("INSERT INTO products (basis_product_id, product_type_id, direction_id, strike, strike_currency_id, wkn)"
+               " VALUES (1, 2, 3, 100, 1, 'APPLE')")
+    db.executemany("INSERT INTO quotes (wkn, ts, price) VALUES (?, '2024-01-02', ?)",
+                   [("DAX", 18000.0), ("APPLE", 2.5), ("WKN123", 1.0)])
+
+    _m011_spot_quotes(db)
+
+    assert [tuple(row) for row in db.execute("SELECT underlying, price FROM spot_quotes")] == [("DAX", 18000.0)]
+    assert db.execute("SELECT COUNT(*) FROM quotes").fetchone()[0] == 3
@@ -0,0 +1,49 @@
+import io
+
+from utils.importer import import_csv
+from utils.ledger import get_open_positions, rebuild_positions
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+def import_rows(*rows):
+    import_csv(io.StringIO("\n".join((HEADER,) + rows) + "\n"))
+
+
+def labels(db, sql):
+    return [row[0] for row in db.execute(sql)]
+
+
+def test_positions_use_the_product_label(db):
+    import_rows("2024-01-02,buy,DAX,Knock-Out,Long,100,€,10,2,1")
+
+    assert labels(db, "SELECT label FROM products") == ["Long@100.0€ DAX"]
+    assert [position[1] for position in get_open_positions(db)] == ["Long@100.0€ DAX"]
+
+
+def test_renamed_master_data_updates_products_and_positions(db):
+    import_rows("2024-01-02,buy,DAX,Knock-Out,Long,100,€,10,2,1",
+                "2024-01-02,buy,DAX,Knock-Out,Short,200,€,10,2,1")
+
+    db.execute("UPDATE basis_products SET name = 'DAX 40' WHERE name = 'DAX'")
+    db.execute("UPDATE directions SET name = 'Bull' WHERE name = 'Long'")
+    db.execute("UPDATE products SET strike = 150 WHERE strike = 200")
+    db.commit()
+
+    expected = ["Bull@100.0€ DAX 40", "Short@150.0€ DAX 40"]
+    assert labels(db, "SELECT label FROM products ORDER BY id") == expected
+    assert labels(db, "SELECT label FROM positions ORDER BY trade_id") == expected
+
+    rebuild_positions(db)
+    assert labels(db, "SELECT label FROM positions ORDER BY trade_id") == expected
+
+
+def test_views_carry_the_joined_columns(db):
+    import_rows("2024-01-02,buy,DAX,Knock-Out,Long,100,€,10,2,1",
+                "2024-01-03,sell,DAX,Knock-Out,Long,100,€,10,3,1")
+
+    product = db.execute("SELECT label, basis_product, product_type, direction, strike_currency FROM v_products")
+    assert tuple(product.fetchone()) == ("Long@100.0€ DAX", "DAX", "Knock-Out", "Long", "€")
+    rows = db.execute("SELECT action, label, qty, total_price FROM v_transactions ORDER BY transaction_id")
+    assert [tuple(row) for row in rows] == [("buy", "Long@100.0€ DAX", 10, 21.0), ("sell", "Long@100.0€ DAX", 10, 29.0)]
+    assert db.execute("SELECT COUNT(*) FROM v_transaction_list").fetchone()[0] == 2
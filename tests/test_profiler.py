@@ -0,0 +1,59 @@
+import threading
+import tracemalloc
+
+import pytest
+
+from utils import profiler
+
+
+@pytest.fixture(autouse=True)
+def profiling(monkeypatch):
+    monkeypatch.setenv("PROFILE_PAGES", "1")
+    profiler.reset_page_profiles()
+    yield
+    profiler.end()
+    profiler.reset_page_profiles()
+
+
+def render(page, end=True):
+    profiler.begin(page)
+    with profiler.section("body"):
+        pass
+    if end:
+        profiler.end()
+
+
+def test_begin_end_records_a_run():
+    render("page")
+
+    runs = profiler.get_page_profiles()["page"]
+    assert len(runs) == 1
+    assert list(runs[0]["sections"]) == ["body"]
+    assert not tracemalloc.is_tracing()
+
+
+def test_skipped_end_is_closed_by_the_next_begin():
+    render("page", end=False)
+    assert tracemalloc.is_tracing()
+
+    render("page")
+
+    assert len(profiler.get_page_profiles()["page"]) == 2
+    assert not tracemalloc.is_tracing()
+
+
+def test_skipped_end_is_closed_when_the_script_thread_exits():
+    thread = threading.Thread(target=render, args=("page", False))
+    thread.start()
+    thread.join()
+
+    assert len(profiler.get_page_profiles()["page"]) == 1
+    assert not tracemalloc.is_tracing()
+
+
+def test_off_without_request(monkeypatch):
+    monkeypatch.delenv("PROFILE_PAGES")
+    monkeypatch.setenv("DIAGNOSTICS_ENABLED", "0")
+    render("page")
+
+    assert profiler.get_page_profiles() == {}
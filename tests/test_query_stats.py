@@ -0,0 +1,57 @@
+import pytest
+
+from utils import query_stats
+from utils.query_stats import get_query_stats, get_slow_queries, normalize_sql, reset_query_stats
+
+
+@pytest.fixture
+def stats(db, monkeypatch):
+    monkeypatch.setattr(query_stats, "ENABLED", True)
+    monkeypatch.setattr(query_stats, "SLOW_QUERY_MS", float("inf"))
+    reset_query_stats()
+    yield db
+    reset_query_stats()
+
+
+def statement(sql):
+    return next(row for row in get_query_stats() if row["sql"] == sql)
+
+
+def test_normalize_sql_replaces_literals():
+    assert normalize_sql("SELECT *\n  FROM t WHERE a = 'x''y' AND b = -1.5 AND c IN (?, ?,?)") == \
+        "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)"
+    assert normalize_sql("SELECT col1 FROM t2") == "SELECT col1 FROM t2"
+
+
+def test_executions_are_grouped_by_statement(stats):
+    for name in ("Long", "Short", "Call"):
+        stats.execute(f"SELECT id FROM directions WHERE name = '{name}'").fetchall()
+    rows = stats.execute("SELECT id FROM directions").fetchall()
+    list(stats.execute("SELECT name FROM directions WHERE id > 1"))
+    stats.execute("UPDATE directions SET name = name WHERE id <= 2")
+
+    assert statement("SELECT id FROM directions WHERE name = ?")["count"] == 3
+    assert statement("SELECT id FROM directions WHERE name = ?")["rows"] == 3
+    assert statement("SELECT id FROM directions")["rows"] == len(rows)
+    assert statement("SELECT name FROM directions WHERE id > ?")["rows"] == len(rows) - 1
+    assert statement("UPDATE directions SET name = name WHERE id <= ?")["rows"] == 2
+    assert all(row["max_ms"] >= row["p95_ms"] >= 0 for row in get_query_stats())
+
+
+def test_slow_statements_are_logged_with_their_plan(stats, monkeypatch, caplog):
+    monkeypatch.setattr(query_stats, "SLOW_QUERY_MS", 0.0)
+
+    stats.execute("SELECT id FROM transactions WHERE trade_id = 7 ORDER BY date").fetchall()
+
+    slow = get_slow_queries()[-1]
+    assert slow["sql"] == "SELECT id FROM transactions WHERE trade_id = ? ORDER BY date"
+    assert "idx_transactions_trade" in slow["plan"]
+    assert "Slow query" in caplog.text
+
+
+def test_disabled_instrumentation_records_nothing(stats, monkeypatch):
+    monkeypatch.setattr(query_stats, "ENABLED", False)
+
+    stats.execute("SELECT COUNT(*) FROM actions").fetchone()
+
+    assert get_query_stats() == []
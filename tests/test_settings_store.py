@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from utils.db_helper import get_db_path, write_transaction
+from utils.settings_store import (DEFAULTS, SettingsConflict, get_settings, invalidate_settings, save_settings,
+                                  update_tax_state)
+
+
+def test_settings_cache_sees_updates_from_the_same_process(db):
+    save_settings({"tax_rate": 0.25, "tax_allowance": 1000.0})
+    assert get_settings().tax_allowance == 1000.0
+
+    update_tax_state(loss_carryforward=50.0, tax_allowance=400.0)
+    assert (get_settings().tax_allowance, get_settings().loss_carryforward) == (400.0, 50.0)
+
+    with write_transaction(db) as conn:
+        update_tax_state(tax_allowance=100.0, conn=conn)
+    invalidate_settings()
+    assert get_settings().tax_allowance == 100.0
+
+
+def test_settings_cache_sees_updates_from_other_sessions(db, monkeypatch):
+    monkeypatch.setattr("utils.settings_store.SETTINGS_TTL", 0.0)
+    save_settings({"tax_rate": 0.25})
+    assert get_settings().tax_rate == 0.25
+
+    other = sqlite3.connect(get_db_path())
+    other.execute("UPDATE settings SET tax_rate = 0.3, version = version + 1 WHERE user_id = 'default'")
+    other.commit()
+    other.close()
+
+    assert get_settings().tax_rate == 0.3
+
+
+def test_partial_save_keeps_the_other_fields(db):
+    save_settings({"language_code": "de", "tax_rate": 0.25, "tax_allowance": 1000.0, "loss_carryforward": 80.0})
+
+    saved = save_settings({"tax_rate": 0.3})
+
+    assert saved.as_dict() == {**DEFAULTS, "language_code": "de", "tax_rate": 0.3,
+                               "tax_allowance": 1000.0, "loss_carryforward": 80.0}
+    invalidate_settings()
+    assert get_settings().as_dict() == saved.as_dict()
+
+
+def test_save_with_stale_version_is_rejected(db):
+    read = get_settings()
+    update_tax_state(loss_carryforward=120.0)
+
+    with pytest.raises(SettingsConflict):
+        save_settings({"tax_rate": 0.3, "loss_carryforward": 0.0}, expected_version=read.version)
+    with pytest.raises(SettingsConflict):
+        save_settings(read)
+
+    current = get_settings()
+    assert (current.tax_rate, current.loss_carryforward) == (read.tax_rate, 120.0)
+    assert save_settings({"tax_rate": 0.3}, expected_version=current.version).version == current.version + 1
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from utils.sell_helper import apply_tax_rules
+from utils.tax_replay import replay_gains
+
+
+def sequential_replay(gains, years, tax_rate, annual_allowance, loss_carryforward=0.0, allowance=None):
+    """Row-by-row reference: the booking rules with the allowance reset at every new tax year."""
+    allowance = annual_allowance if allowance is None else allowance
+    taxes, losses, allowances = [], [], []
+    for i, (gain, year) in enumerate(zip(gains, years)):
+        if i and year != years[i - 1]:
+            allowance = annual_allowance
+        tax, loss_carryforward, allowance = apply_tax_rules(gain, tax_rate, allowance, loss_carryforward)
+        taxes.append(tax)
+        losses.append(loss_carryforward)
+        allowances.append(allowance)
+    return np.array(taxes), np.array(losses), np.array(allowances)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_replay_matches_sequential_reference(seed):
+    rng = np.random.default_rng(seed)
+    n = 2000
+    gains = np.round(rng.normal(50.0, 400.0, n), 2)
+    years = np.sort(rng.integers(2019, 2025, n))
+    opening_loss = float(rng.uniform(0, 2000))
+    opening_allowance = float(rng.uniform(0, 1000))
+
+    result = replay_gains(gains, years, 0.26375, 1000.0,
+                          opening_loss_carryforward=opening_loss, opening_allowance=opening_allowance)
+    tax, loss, allowance = sequential_replay(gains, years, 0.26375, 1000.0, opening_loss, opening_allowance)
+
+    np.testing.assert_allclose(result["tax"], tax, atol=0.011)
+    np.testing.assert_allclose(result["loss_carryforward"], loss, atol=1e-6)
+    np.testing.assert_allclose(result["tax_allowance"], allowance, atol=1e-6)
+
+
+def test_replay_resets_allowance_per_year():
+    result = replay_gains([800.0, 800.0, 800.0], [2023, 2023, 2024], 0.25, 1000.0)
+    assert list(result["tax"]) == [0.0, 150.0, 0.0]
+    assert list(result["tax_allowance"]) == [200.0, 0.0, 200.0]
+    assert list(result["year_start"]) == [0, 0, 2]
+
+
+def test_replay_offsets_gains_with_loss_carryforward():
+    result = replay_gains([-500.0, 300.0, 400.0], [2024] * 3, 0.25, 0.0, opening_loss_carryforward=100.0)
+    assert list(result["loss_carryforward"]) == [600.0, 300.0, 0.0]
+    assert list(result["tax"]) == [0.0, 0.0, 25.0]
+
+
+def test_replay_of_no_rows():
+    result = replay_gains([], [], 0.25, 1000.0)
+    assert all(len(values) == 0 for values in result.values())
@@ -0,0 +1,90 @@
+import io
+import os
+import threading
+
+import pytest
+
+from utils.db_helper import (DEFAULT_USER, get_current_user, get_db, get_db_path, get_pool_stats, normalize_tenant_user,
+                             normalize_user, set_current_user, use_user)
+from utils.importer import import_csv
+from utils.overview_helper import invalidate_data_cache, load_data
+from utils.settings_store import get_settings, save_settings
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee"
+
+
+@pytest.fixture
+def tenants(db, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_TENANT_DIR", str(tmp_path / "users"))
+    invalidate_data_cache()
+    yield tmp_path / "users"
+    set_current_user(DEFAULT_USER)
+    invalidate_data_cache()
+
+
+def buy(underlying):
+    import_csv(io.StringIO(f"{HEADER}\n2024-01-02,buy,{underlying},Knock-Out,Long,100,€,10,2,1\n"))
+
+
+def underlyings():
+    return sorted(load_data()["basis_product"])
+
+
+@pytest.mark.parametrize("user_id", ["../etc/passwd", "a/b", "", " ", ".hidden"])
+def test_invalid_user_ids_are_rejected(user_id):
+    with pytest.raises(ValueError):
+        normalize_tenant_user(user_id)
+
+
+def test_user_ids_map_to_own_files(tenants):
+    assert normalize_user(" Alice@Example.com ") == "alice@example.com"
+    assert get_db_path("alice@example.com") == os.path.join(str(tenants), "alice@example.com.db")
+    assert get_db_path(DEFAULT_USER) == os.environ["DATABASE_PATH"]
+    with pytest.raises(ValueError):
+        normalize_tenant_user(DEFAULT_USER)
+
+
+def test_new_user_gets_a_provisioned_and_migrated_database(tenants):
+    with use_user("alice"):
+        conn = get_db()
+        assert conn.execute("SELECT COUNT(*) FROM actions").fetchone()[0] == 6
+        assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] > 0
+    assert os.path.exists(tenants / "alice.db")
+    assert get_current_user() == DEFAULT_USER
+
+
+def test_users_do_not_see_each_others_data(tenants):
+    buy("DAX")
+    with use_user("alice"):
+        buy("Nvidia")
+        save_settings({"tax_rate": 0.25})
+    with use_user("bob"):
+        assert underlyings() == []
+        assert get_settings().tax_rate == 0.0
+
+    with use_user("alice"):
+        assert underlyings() == ["Nvidia"]
+        assert get_settings().tax_rate == 0.25
+    assert underlyings() == ["DAX"]
+    assert get_settings().tax_rate == 0.0
+
+
+def test_threads_keep_their_own_user(tenants):
+    seen = {}
+
+    def session(user_id):
+        set_current_user(user_id)
+        buy(user_id.upper())
+        seen[user_id] = (get_db_path(), underlyings())
+
+    threads = [threading.Thread(target=session, args=(user_id,)) for user_id in ("alice", "bob")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert seen["alice"] == (str(tenants / "alice.db"), ["ALICE"])
+    assert seen["bob"] == (str(tenants / "bob.db"), ["BOB"])
+    assert get_current_user() == DEFAULT_USER
+    # One pool per database file: the default database and the two users
+    assert get_pool_stats()["databases"] == 3
@@ -0,0 +1,94 @@
+import io
+import math
+
+import pandas as pd
+import pytest
+
+from utils.analytics_worker import build_snapshot
+from utils.frame_snapshot import drop_snapshot
+from utils.importer import import_csv
+from utils.overview_helper import invalidate_data_cache
+from utils.valuation import (TableQuoteSource, get_valuation_stats, invalidate_valuations, latest_quotes,
+                             read_quote_file, store_quotes, value_open_positions)
+
+HEADER = "date,action,underlying,product_type,direction,strike,currency,qty,price,fee,wkn"
+
+
+@pytest.fixture
+def portfolio(db):
+    """A DAX trade of 5 units (cost 10.50) and an unquoted Nvidia trade (cost 16)."""
+    import_csv(io.StringIO(HEADER + "\n"
+                           "2024-01-02,buy,DAX,Knock-Out,Long,18000,€,5,2,0.5,ab1\n"
+                           "2024-01-03,buy,Nvidia,Warrant,Call,150,$,5,3,1,CD2\n"))
+    invalidate_data_cache()
+    drop_snapshot()
+    invalidate_valuations()
+    yield db
+    invalidate_data_cache()
+    drop_snapshot()
+    invalidate_valuations()
+
+
+def quotes(*rows):
+    return pd.DataFrame(rows, columns=["wkn", "ts", "price", "previous_close"])
+
+
+def test_positions_are_valued_at_their_latest_quote(portfolio):
+    store_quotes(quotes(("AB1", "2024-01-04T17:30:00", 3.0, 2.5)))
+
+    valuation = value_open_positions(build_snapshot(), TableQuoteSource())
+
+    # WKNs are matched case-insensitively
+    positions = valuation.positions.set_index(valuation.positions["wkn"].str.upper())
+    dax = positions.loc["AB1"]
+    assert (dax["cost"], dax["market_value"], dax["unrealised"], dax["day_change"]) == (10.5, 15.0, 4.5, 2.5)
+    assert dax["unrealised_pct"] == pytest.approx(4.5 / 10.5 * 100)
+    assert math.isnan(positions.loc["CD2", "price"])
+    assert valuation.totals == {"positions": 2, "quoted": 1, "market_value": 15.0, "cost": 10.5, "unrealised": 4.5,
+                                "day_change": 2.5, "exposure": 15.0 + 16.0, "as_of": "2024-01-04T17:30:00"}
+
+
+def test_previous_close_defaults_to_the_last_price_of_an_earlier_day():
+    history = quotes(("AB1", "2024-01-03T10:00:00", 2.0, None), ("AB1", "2024-01-03T17:30:00", 2.2, None),
+                     ("AB1", "2024-01-04T09:00:00", 2.4, None), ("AB1", "2024-01-04T10:00:00", 2.6, None),
+                     ("CD2", "2024-01-04T10:00:00", 1.0, 0.8))
+
+    latest = latest_quotes(history).set_index("wkn")
+
+    assert latest.loc["AB1"].tolist() == ["2024-01-04T10:00:00", 2.6, 2.2]
+    assert latest.loc["CD2"].tolist() == ["2024-01-04T10:00:00", 1.0, 0.8]
+
+
+def test_table_source_matches_the_frame_rules(portfolio):
+    store_quotes(quotes(("AB1", "2024-01-03T17:30:00", 2.2, None), ("AB1", "2024-01-04T10:00:00", 2.6, None)))
+
+    assert TableQuoteSource().read().values.tolist() == [["AB1", "2024-01-04T10:00:00", 2.6, 2.2]]
+
+
+def test_quote_files_accept_decimal_commas_and_need_a_price(tmp_path):
+    path = tmp_path / "quotes.csv"
+    path.write_text("WKN;Price;ts\nab1 ;1.234,5;2024-01-04\n")
+    frame = read_quote_file(str(path))
+    assert frame[["wkn", "ts", "price"]].values.tolist() == [["AB1", "2024-01-04T00:00:00", 1234.5]]
+    assert frame["previous_close"].isna().all()
+
+    path.write_text("wkn;ts\nAB1;2024-01-04\n")
+    with pytest.raises(ValueError, match="missing column"):
+        read_quote_file(str(path))
+
+
+def test_valuation_is_cached_until_quotes_or_trades_change(portfolio):
+    source = TableQuoteSource()
+    snapshot = build_snapshot()
+    store_quotes(quotes(("AB1", "2024-01-04T10:00:00", 3.0, None)))
+
+    first = value_open_positions(snapshot, source)
+    hits = get_valuation_stats()["hits"]
+    assert value_open_positions(snapshot, source) is first
+    assert get_valuation_stats()["hits"] == hits + 1
+
+    store_quotes(quotes(("AB1", "2024-01-04T11:00:00", 4.0, None)))
+    assert value_open_positions(snapshot, source).totals["market_value"] == 20.0
+
+    import_csv(io.StringIO(HEADER + "\n2024-01-05,rebuy,DAX,Knock-Out,Long,18000,€,5,2,0.5,ab1\n"))
+    assert value_open_positions(build_snapshot(), source).totals["market_value"] == 40.0
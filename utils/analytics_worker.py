@@ -0,0 +1,222 @@
+"""
+Background computation of the dashboard analytics.
+
+``ANALYTICS`` keeps one worker per user and a small thread pool
+(``ANALYTICS_THREADS``, default 2) that builds a ``Snapshot`` of everything the
+overview shows: the transaction frame, portfolio metrics, open positions, the
+per-basis and per-direction performance, the daily P&L rollup and the prepared
+tables. The write helpers of ``utils.db_helper`` call ``mark_data_changed``,
+which notifies the user's worker through a write listener; the snapshot is then
+rebuilt off the request path and published by replacing a single reference, so
+readers always see a complete snapshot.
+
+Notifications arriving while a build is queued are coalesced; a write during a
+running build queues exactly one more. Writes of other processes are noticed
+by ``current_snapshot`` through the data version and trigger a rebuild in the
+same way. Only the first snapshot of every user is built synchronously.
+Snapshot frames are shared between sessions and must not be modified in place.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.db_helper import add_write_listener, remove_write_listener, get_current_user, get_data_version, use_user
+from utils.overview_helper import load_data, load_daily_pnl, calculate_open_positions, calculate_portfolio_metrics
+
+logger = logging.getLogger("options_tracker.analytics")
+
+ANALYTICS_THREADS = int(os.environ.get("ANALYTICS_THREADS", "2"))
+
+TOP_COLUMNS = ['date', 'name', 'wkn', 'gain']
+DISPLAY_COLUMNS = ['date', 'name', 'wkn', 'product_type', 'action', 'qty', 'price', 'total_price', 'gain']
+
+
+class Snapshot:
+    __slots__ = ("version", "created", "seconds", "df", "metrics", "open_positions", "basis_performance",
+                 "direction_performance", "daily_pnl", "years", "top_winners", "top_losers", "transactions")
+
+
+def _formatted(frame):
+    frame = frame.copy()
+    frame['date'] = frame['date'].dt.strftime('%d.%m.%Y')
+    return frame
+
+
+def build_snapshot():
+    """Computes all overview aggregates from the current database state."""
+    start = time.perf_counter()
+    snapshot = Snapshot()
+    snapshot.version = get_data_version()
+    df = load_data()
+    snapshot.df = df
+    snapshot.metrics = calculate_portfolio_metrics(df)
+    snapshot.open_positions = calculate_open_positions(df)
+    snapshot.daily_pnl = load_daily_pnl()
+    if df.empty:
+        snapshot.basis_performance = snapshot.direction_performance = None
+        snapshot.years = []
+        snapshot.top_winners = snapshot.top_losers = snapshot.transactions = None
+    else:
+        snapshot.basis_performance = df.groupby('basis_product')['gain'].sum().reset_index()
+        direction_perf = df.groupby('direction').agg({'gain': 'sum', 'transaction_id': 'count'}).reset_index()
+        direction_perf.columns = ['direction', 'total_gain', 'trade_count']
+        snapshot.direction_performance = direction_perf
+        snapshot.years = sorted(df['date'].dt.year.unique())
+        snapshot.top_winners = _formatted(df.nlargest(5, 'gain')[TOP_COLUMNS])
+        snapshot.top_losers = _formatted(df.nsmallest(5, 'gain')[TOP_COLUMNS])
+        snapshot.transactions = _formatted(df[DISPLAY_COLUMNS].sort_values('date', ascending=False, kind='stable'))
+    snapshot.created = time.time()
+    snapshot.seconds = time.perf_counter() - start
+    return snapshot
+
+
+class AnalyticsWorker:
+    """Snapshot of one user's database; rebuilds run on the executor of ``Analytics``."""
+
+    def __init__(self, user_id, executor):
+        self.user_id = user_id
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._queued = False
+        self._snapshot = None
+        self._stats = {"builds": 0, "failures": 0, "notifications": 0, "last_seconds": None}
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def notify(self, version=None):
+        """Queues a rebuild unless one is already waiting."""
+        with self._lock:
+            self._stats["notifications"] += 1
+            if self._queued:
+                return
+            self._queued = True
+        self._executor.submit(self._run)
+
+    def _run(self):
+        try:
+            with use_user(self.user_id), self._build_lock:
+                # Cleared only once the previous build is done, so notifications meanwhile
+                # keep waiting for this build instead of submitting another one
+                with self._lock:
+                    self._queued = False
+                self._publish(build_snapshot())
+        except Exception:
+            self._stats["failures"] += 1
+            logger.exception("Building the analytics snapshot of %s failed", self.user_id)
+
+    def ensure(self):
+        """Latest snapshot; the first one is built in the calling thread."""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._build_lock:
+            if self._snapshot is None:
+                self._publish(build_snapshot())
+        return self._snapshot
+
+    def refresh(self):
+        """Builds and publishes a snapshot in the calling thread; returns the published one."""
+        with self._build_lock:
+            snapshot = build_snapshot()
+            self._publish(snapshot)
+        return self._snapshot
+
+    def _publish(self, snapshot):
+        with self._lock:
+            if self._snapshot is None or snapshot.version >= self._snapshot.version:
+                self._snapshot = snapshot
+            self._stats["builds"] += 1
+            self._stats["last_seconds"] = snapshot.seconds
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return dict(self._stats, queued=self._queued,
+                        version=snapshot.version if snapshot else None,
+                        created=snapshot.created if snapshot else None)
+
+
+class Analytics:
+    """
+    One ``AnalyticsWorker`` per user, sharing a pool of ``ANALYTICS_THREADS``
+    threads, so a rebuild for one user never waits for another user's build
+    longer than the pool is busy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._workers = {}
+
+    def start(self):
+        """Starts the pool and subscribes to the write notifications (idempotent)."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=ANALYTICS_THREADS, thread_name_prefix="analytics")
+                add_write_listener(self.notify)
+        return self
+
+    def worker(self, user_id=None):
+        """Worker of ``user_id`` (default: the current user of the thread)."""
+        user_id = user_id or get_current_user()
+        worker = self._workers.get(user_id)
+        if worker is None:
+            with self._lock:
+                worker = self._workers.get(user_id)
+                if worker is None:
+                    worker = self._workers[user_id] = AnalyticsWorker(user_id, self._executor)
+        return worker
+
+    def notify(self, user_id, version=None):
+        """Write listener: queues a rebuild for ``user_id`` if its overview was used before."""
+        worker = self._workers.get(user_id)
+        if worker is not None and self._executor is not None:
+            worker.notify(version)
+
+    def stats(self):
+        """Summed worker statistics; ``created`` is the time of the newest snapshot."""
+        totals = {"users": 0, "builds": 0, "failures": 0, "notifications": 0, "last_seconds": None,
+                  "created": None}
+        for worker in list(self._workers.values()):
+            stats = worker.stats()
+            totals["users"] += 1
+            for key in ("builds", "failures", "notifications"):
+                totals[key] += stats[key]
+            if stats["created"] and (totals["created"] is None or stats["created"] > totals["created"]):
+                totals["created"] = stats["created"]
+                totals["last_seconds"] = stats["last_seconds"]
+        return totals
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._workers.clear()
+        remove_write_listener(self.notify)
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+ANALYTICS = Analytics()
+
+
+def current_snapshot():
+    """
+    Latest finished snapshot of the current user and whether it reflects the
+    current data version. A stale snapshot is returned as is while the worker
+    rebuilds it.
+    """
+    worker = ANALYTICS.start().worker()
+    snapshot = worker.ensure()
+    if snapshot.version != get_data_version():
+        worker.notify()
+        return snapshot, False
+    return snapshot, True
+
+
+def get_analytics_stats():
+    return ANALYTICS.stats()
@@ -0,0 +1,258 @@
+"""
+Knock-out barrier monitor over a stream of underlying prices.
+
+The open Long/Short positions of product type "Knock-Out" are loaded from the
+``positions`` ledger with their barrier (``products.strike``, in the quote
+units of the underlying). ``BarrierBook`` keeps them per underlying and side in
+sorted lists: a Long is knocked out at a price at or below its barrier, a Short
+at or above it. Shorts are stored with negated barriers, so on both sides the
+knocked-out positions are the tail behind one ``bisect`` - a tick costs
+O(log n) plus the positions it knocks out, which are removed from the book.
+
+Every knock-out is emitted as a suggested booking (one JSON object per line,
+the same gain as the KO tab: the negated price paid); with ``--book`` it is
+booked right away through ``utils.booking.book_knockout``.
+
+Ticks are lines ``underlying,price[,timestamp]`` (``;`` separated with a
+decimal comma works too; in a price with both separators the last one is the
+decimal separator, e.g. ``18.234,56`` or ``18,234.56``) or JSON objects with
+``underlying``, ``price`` and ``ts``, read from a file that is followed like
+``tail -f``, from stdin or from a local TCP socket:
+
+    python -m utils.barrier_monitor --follow ticks.csv
+    python -m utils.barrier_monitor --listen 9100 --book --user alice
+    tail -f feed.log | python -m utils.barrier_monitor
+"""
+import argparse
+import bisect
+import json
+import socket
+import sys
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+from utils.db_helper import get_db, set_current_user
+
+LONG, SHORT = "Long", "Short"
+KNOCK_OUT_TYPE = "Knock-Out"
+DEFAULT_RELOAD_SECONDS = 60
+
+BARRIERS_SQL = """
+    SELECT po.trade_id, po.product_id, po.label, v.basis_product, v.direction, v.strike, po.price_paid
+    FROM positions po
+    JOIN v_products v ON v.product_id = po.product_id
+    WHERE v.product_type = ? AND v.direction IN (?, ?) AND v.strike IS NOT NULL
+"""
+
+_EMPTY = ((), ())
+
+Barrier = namedtuple("Barrier", "trade_id product_id label underlying direction strike price_paid")
+
+
+def _key(underlying):
+    return underlying.strip().casefold()
+
+
+class BarrierBook:
+    """Open knock-out barriers per underlying, sorted for a bisect per tick."""
+
+    def __init__(self, barriers=()):
+        # (underlying, side) -> [sort keys, barriers]; the sort key is the barrier of a Long
+        # and the negated barrier of a Short, so the knocked-out positions are always the tail
+        self._sides = {}
+        by_side = {}
+        for barrier in barriers:
+            sign = 1 if barrier.direction == LONG else -1
+            by_side.setdefault((_key(barrier.underlying), sign), []).append((sign * barrier.strike, barrier))
+        for side, entries in by_side.items():
+            entries.sort(key=lambda entry: (entry[0], entry[1].trade_id))
+            self._sides[side] = [[key for key, _ in entries], [barrier for _, barrier in entries]]
+
+    @classmethod
+    def from_db(cls, conn=None):
+        """Book of the open knock-out positions of the current user."""
+        conn = conn or get_db()
+        rows = conn.execute(BARRIERS_SQL, (KNOCK_OUT_TYPE, LONG, SHORT)).fetchall()
+        return cls(Barrier(*row) for row in rows)
+
+    def __len__(self):
+        return sum(len(keys) for keys, _ in self._sides.values())
+
+    def underlyings(self):
+        return sorted({underlying for underlying, _ in self._sides})
+
+    def tick(self, underlying, price):
+        """Removes and returns the barriers knocked out by ``price`` (empty list for most ticks)."""
+        underlying = _key(underlying)
+        knocked = []
+        for sign in (1, -1):
+            keys, barriers = self._sides.get((underlying, sign), _EMPTY)
+            if not keys or keys[-1] < sign * price:
+                continue
+            index = bisect.bisect_left(keys, sign * price)
+            knocked.extend(barriers[index:])
+            del keys[index:], barriers[index:]
+        return knocked
+
+
+# ----- ticks -----
+
+def _number(text):
+    text = text.strip()
+    if text.rfind(",") > text.rfind("."):
+        # Decimal comma, dots (if any) group the thousands
+        return float(text.replace(".", "").replace(",", "."))
+    return float(text.replace(",", ""))
+
+
+def parse_tick(line):
+    """``(underlying, price, ts)`` of a tick line; None for blank lines and comments."""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        data = json.loads(line)
+        return data["underlying"], float(data["price"]), data.get("ts")
+    parts = line.split(";" if ";" in line else ",")
+    if len(parts) < 2:
+        raise ValueError(f"invalid tick: {line!r}")
+    return parts[0], _number(parts[1]), parts[2].strip() if len(parts) > 2 else None
+
+
+def follow(path, from_start=False, poll=0.2):
+    """Lines appended to ``path`` (like ``tail -f``); with ``from_start`` the existing lines first."""
+    with open(path, encoding="utf-8") as f:
+        if not from_start:
+            f.seek(0, 2)
+        pending = ""
+        while True:
+            chunk = f.readline()
+            if not chunk:
+                time.sleep(poll)
+                continue
+            pending += chunk
+            if pending.endswith("\n"):
+                yield pending
+                pending = ""
+
+
+def listen(port, host="127.0.0.1"):
+    """Lines sent to a local TCP socket, one connection after the other."""
+    with socket.create_server((host, port)) as server:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("r", encoding="utf-8") as stream:
+                yield from stream
+
+
+# ----- monitor -----
+
+def suggestion(barrier, price, ts=None):
+    """Suggested knock-out booking of ``barrier`` (arguments of ``book_knockout`` plus context)."""
+    try:
+        day = datetime.fromisoformat(ts).date() if ts else date.today()
+    except ValueError:
+        day = date.today()
+    return {
+        "trade_id": barrier.trade_id,
+        "product_id": barrier.product_id,
+        "date": day.isoformat(),
+        "gain": round(-barrier.price_paid, 2),
+        "label": barrier.label,
+        "underlying": barrier.underlying,
+        "direction": barrier.direction,
+        "barrier": barrier.strike,
+        "price": price,
+        "ts": ts,
+    }
+
+
+def monitor(lines, on_knockout, book=None, reload_seconds=None, on_error=None):
+    """
+    Feeds tick ``lines`` through the barrier book (default: the open
+    positions of the database) and calls ``on_knockout`` with every
+    suggestion. With ``reload_seconds`` the book is reloaded from the
+    database periodically (new positions, manual bookings); positions that
+    were already reported are not reported again. Invalid tick lines and
+    exceptions from ``on_knockout`` (e.g. a failed booking) are passed to
+    ``on_error`` and the monitor goes on with the next tick; a position whose
+    ``on_knockout`` failed is reported again after the next reload. Without
+    ``on_error`` invalid lines are skipped and ``on_knockout`` errors raised.
+    Returns the number of ticks.
+    """
+    book = book if book is not None else BarrierBook.from_db()
+    loaded = time.monotonic()
+    reported = set()
+    ticks = 0
+    for line in lines:
+        try:
+            tick = parse_tick(line)
+        except (ValueError, KeyError, TypeError) as e:
+            if on_error:
+                on_error(e)
+            continue
+        if tick is None:
+            continue
+        ticks += 1
+        underlying, price, ts = tick
+        for barrier in book.tick(underlying, price):
+            if barrier.trade_id in reported:
+                continue
+            try:
+                on_knockout(suggestion(barrier, price, ts))
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+                continue
+            reported.add(barrier.trade_id)
+        if reload_seconds is not None and time.monotonic() - loaded > reload_seconds:
+            book = BarrierBook.from_db()
+            loaded = time.monotonic()
+    return ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--follow", metavar="FILE", help="follow a tick file (default: read stdin)")
+    source.add_argument("--listen", metavar="PORT", type=int, help="read ticks from a local TCP socket")
+    parser.add_argument("--from-start", action="store_true", help="with --follow: process the existing lines first")
+    parser.add_argument("--book", action="store_true", help="book the knock-outs instead of only suggesting them")
+    parser.add_argument("--reload", type=float, default=DEFAULT_RELOAD_SECONDS,
+                        help="seconds between reloads of the open positions")
+    parser.add_argument("--user", help="user whose database is used (default: the default user)")
+    args = parser.parse_args()
+
+    if args.user:
+        set_current_user(args.user)
+    if args.follow:
+        lines = follow(args.follow, from_start=args.from_start)
+    elif args.listen:
+        lines = listen(args.listen)
+    else:
+        lines = sys.stdin
+
+    def on_knockout(entry):
+        if args.book:
+            from utils.booking import book_knockout
+            try:
+                book_knockout(trade_id=entry["trade_id"], date=date.fromisoformat(entry["date"]),
+                              product_id=entry["product_id"], gain=entry["gain"])
+            except Exception as e:
+                raise RuntimeError(f"knock-out of trade {entry['trade_id']} not booked: {e}") from e
+            entry["booked"] = True
+        print(json.dumps(entry, ensure_ascii=False), flush=True)
+
+    book = BarrierBook.from_db()
+    print(f"{len(book):,} barriers on {len(book.underlyings())} underlyings", file=sys.stderr)
+    try:
+        monitor(lines, on_knockout, book=book, reload_seconds=args.reload,
+                on_error=lambda e: print(f"error: {e}", file=sys.stderr))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
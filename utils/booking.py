@@ -0,0 +1,72 @@
+"""
+Atomic bookings of sells, partial sells, redemptions and knock-outs.
+
+Every booking runs as one unit of work (``db_helper.write_transaction``): the
+closing transaction, the open quantities of the lots, the positions and daily
+P&L ledgers and the tax state in the settings are written inside a single
+``BEGIN IMMEDIATE`` transaction and committed once, so a failure leaves no
+partially booked sale behind and concurrent sessions queue on the write lock
+instead of interleaving their statements.
+
+All bookings take the total and the gain before tax. The tax and the new tax
+state are computed inside the transaction from the stored state with the rules
+of ``sell_helper.apply_tax_rules``, so a loss adds to the carryforward and a
+gain uses up carryforward and allowance before it is taxed, and two sessions
+booking at the same time both count against the allowance. The tax shown by the
+page is only a preview from the cached settings.
+"""
+from utils.db_helper import get_current_user, insert_transaction, write_transaction
+from utils.fifo import LOT_BOOK
+from utils.ledger import refresh_position, refresh_daily_pnl
+from utils.sell_helper import apply_tax_rules
+from utils.settings_store import get_settings, invalidate_settings, read_tax_state, update_tax_state
+
+SELL, PARTIAL_SELL, REDEMPTION, KNOCK_OUT = 2, 4, 5, 6
+
+CLOSE_TRADE_SQL = "UPDATE transactions SET open_qty = 0 WHERE trade_id = ?"
+
+
+def _book(action_id, trade_id, date, product_id, price, qty, fee, total_price, price_correct, gain, partial=False):
+    # The settings row must exist before the tax state is updated inside the transaction
+    get_settings()
+    with write_transaction() as conn:
+        # ``total_price`` and ``gain`` are before tax; the tax state is read under the write lock
+        tax_rate, allowance, carryforward = read_tax_state(conn)
+        tax, loss_carryforward, tax_allowance = apply_tax_rules(gain, tax_rate, allowance, carryforward)
+        insert_transaction(conn, trade_id=trade_id, date=date, product_id=product_id, price=price, qty=qty, fee=fee,
+                           tax=tax, total_price=total_price - tax, price_correct=price_correct, action_id=action_id,
+                           open_qty=0 if action_id == SELL else None, gain=round(gain - tax, 2))
+        if partial:
+            used = LOT_BOOK.consume(trade_id, qty, conn=conn)
+        else:
+            used = None
+            conn.execute(CLOSE_TRADE_SQL, (trade_id,))
+            refresh_position(conn, trade_id)
+        refresh_daily_pnl(conn, date)
+        update_tax_state(loss_carryforward, tax_allowance, conn=conn)
+    invalidate_settings(get_current_user())
+    return used
+
+
+def book_sell(trade_id, date, product_id, price, qty, fee, total_price, price_correct, gain):
+    """Sells the whole position; ``total_price`` and ``gain`` are before tax."""
+    _book(SELL, trade_id, date, product_id, price, qty, fee, total_price, price_correct, gain)
+
+
+def book_partial_sell(trade_id, date, product_id, price, qty, fee, total_price, price_correct, gain):
+    """
+    Sells ``qty`` units (FIFO over the open lots); ``total_price`` and ``gain``
+    are before tax. Returns the used lots as (txn_id, used_qty).
+    """
+    return _book(PARTIAL_SELL, trade_id, date, product_id, price, qty, fee, total_price, price_correct, gain,
+                 partial=True)
+
+
+def book_redemption(trade_id, date, product_id, total_price, gain):
+    """Closes the position with the redemption amount ``total_price``; ``gain`` is before tax."""
+    _book(REDEMPTION, trade_id, date, product_id, 0, 0, 0, total_price, 1, gain)
+
+
+def book_knockout(trade_id, date, product_id, gain):
+    """Closes a knocked-out position without proceeds."""
+    _book(KNOCK_OUT, trade_id, date, product_id, 0, 0, 0, 0, 1, gain)
@@ -1,4 +1,4 @@
-from utils.db_helper import get_db
+from utils.db_helper import get_db, mark_data_changed
 
 def get_new_trade_id():
     conn = get_db()
@@ -28,7 +28,8 @@ def get_direction_id(direction):
     return conn.execute("SELECT id FROM directions WHERE name LIKE ?", (direction,)).fetchone()[0]
 
 
-def get_or_create_product_id(basis_id, product_type_id, direction_id, strike, strike_currency_id, wkn, name, expiry_date):
+def get_or_create_product_id(basis_id, product_type_id, direction_id, strike, strike_currency_id, wkn, name, expiry_date,
+                             ratio=None):
     conn = get_db()
     exists= conn.execute("SELECT id FROM products WHERE "
                    "basis_product_id = ? AND "
@@ -41,9 +42,10 @@ def get_or_create_product_id(basis_id, product_type_id, direction_id, strike, st
         return exists[0]
     else:
         conn.execute("INSERT INTO products (basis_product_id,product_type_id,direction_id,"
-                       "strike,strike_currency_id,wkn,name,expiry_date) "
-                       "VALUES (?,?,?,?,?,?,?,?)",
+                       "strike,strike_currency_id,wkn,name,expiry_date,ratio) "
+                       "VALUES (?,?,?,?,?,?,?,?,?)",
                        (basis_id, product_type_id, direction_id, strike, strike_currency_id,
-                        wkn, name, expiry_date,))
+                        wkn, name, expiry_date, ratio,))
         conn.commit()
+        mark_data_changed()
         return conn.execute("SELECT MAX(id) FROM products").fetchone()[0]
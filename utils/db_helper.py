@@ -1,64 +1,145 @@
+import contextlib
 import os
+import re
 import sqlite3
-import streamlit as st
+import threading
+import weakref
+import atexit
 import logging
 
-def get_db():
+from utils.migrations import migrate, pending_migrations
+from utils.ledger import refresh_position, refresh_daily_pnl, get_open_positions
+from utils import query_stats
+
+# Maximale Anzahl ungenutzter Verbindungen, die pro Datenbankdatei im Pool gehalten werden
+POOL_MAX_IDLE = int(os.environ.get("DATABASE_POOL_SIZE", "8"))
+
+# Benutzer ohne Anmeldung; seine Daten liegen in der bisherigen Datenbankdatei
+DEFAULT_USER = "default"
+
+# Erlaubte Benutzerkennungen (werden als Dateiname verwendet)
+_USER_PATTERN = re.compile(r"[a-z0-9][a-z0-9._@+-]{0,127}")
+
+_path_lock = threading.Lock()
+_db_path = None
+_pools = {}
+_local = threading.local()
+
+_listener_lock = threading.Lock()
+_write_listeners = []
+
+
+class PooledConnection(sqlite3.Connection):
     """
-    Robuste Datenbankverbindungsfunktion, die verschiedene Pfade ausprobiert
-    und sowohl in lokaler Entwicklung als auch in Docker-Containern funktioniert.
+    sqlite3-Verbindung aus dem Pool. close() gibt die Verbindung an den Pool
+    zurück, statt sie zu schließen; geschlossen wird über close_pool().
+    Alle Statements laufen über utils.query_stats.InstrumentedCursor (abschaltbar
+    mit DATABASE_QUERY_STATS=0).
     """
-    
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = query_stats.InstrumentedCursor if query_stats.ENABLED else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def close(self):
+        finalizer = getattr(self, "_finalizer", None)
+        if finalizer is not None and finalizer.alive:
+            finalizer()
+
+    def _close_connection(self):
+        sqlite3.Connection.close(self)
+
+
+class _Lease:
+    """Bindet eine Pool-Verbindung an den aktuellen Thread."""
+    __slots__ = ("conn", "finalizer", "__weakref__")
+
+
+class _Pool:
+    """Verbindungspool, Schema-Status und Schreibzähler einer Datenbankdatei."""
+
+    def __init__(self, path, user_id):
+        self.path = path
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.idle = []
+        self.connections = weakref.WeakSet()
+        self.stats = {"opened": 0, "reused": 0, "checked_out": 0, "released": 0, "closed": 0}
+        self.schema_checked = False
+        self.data_version = 0
+        # Zuletzt gesehener Stand der gemeinsamen Änderungszähler (DATA_STATE_SQL)
+        self.data_state = None
+
+
+def _candidate_paths():
     # Liste möglicher Datenbankpfade (in Prioritätsreihenfolge)
-    possible_paths = [
+    return [
         # Docker-Container Pfade
         "/app/db/options_tracker.db",
-        "/app/options_tracker.db", 
+        "/app/options_tracker.db",
         "./db/options_tracker.db",
         "./options_tracker.db",
         "/app/data/options_tracker.db",
-        
+
         # Relative Pfade basierend auf aktueller Datei
         os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "db", "options_tracker.db"),
         os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "options_tracker.db"),
         os.path.join(os.path.dirname(os.path.abspath(__file__)), "options_tracker.db"),
-        
+
         # Pfade basierend auf Working Directory
         os.path.join(os.getcwd(), "db", "options_tracker.db"),
         os.path.join(os.getcwd(), "options_tracker.db"),
-        
+
         # Root-Level Suche
         os.path.join("/", "db", "options_tracker.db"),
     ]
-    
+
+
+def _resolve_db_path():
+    """
+    Robuste Pfadsuche, die verschiedene Pfade ausprobiert und sowohl in lokaler
+    Entwicklung als auch in Docker-Containern funktioniert. DATABASE_PATH hat
+    Vorrang (wie in init_db.get_db).
+    """
+    env_path = os.environ.get("DATABASE_PATH")
+    if env_path:
+        directory = os.path.dirname(env_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return env_path
+
     # Durchsuche alle möglichen Pfade
-    for db_path in possible_paths:
+    for db_path in _candidate_paths():
         try:
             # Normalisiere den Pfad
             normalized_path = os.path.normpath(db_path)
-            
+
             # Prüfe ob die Datei existiert
-            if os.path.exists(normalized_path):
-                # Teste die Verbindung
-                conn = sqlite3.connect(normalized_path)
-                conn.row_factory = sqlite3.Row
-                
-                # Teste ob es eine gültige SQLite-Datenbank ist
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                tables = cursor.fetchall()
-                
-                if tables:  # Wenn Tabellen vorhanden sind
-                    logging.info(f"Datenbankverbindung erfolgreich: {normalized_path}")
-                    return conn
-                else:
-                    conn.close()
-                    logging.warning(f"Datenbank gefunden aber leer: {normalized_path}")
-                    
+            if not os.path.exists(normalized_path):
+                continue
+
+            # Teste ob es eine gültige SQLite-Datenbank mit Tabellen ist
+            conn = sqlite3.connect(normalized_path)
+            try:
+                tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+            finally:
+                conn.close()
+
+            if tables:
+                return normalized_path
+            logging.warning(f"Datenbank gefunden aber leer: {normalized_path}")
+
         except Exception as e:
             logging.debug(f"Fehler bei Pfad {db_path}: {str(e)}")
             continue
-    
+
     # Wenn keine existierende Datenbank gefunden wurde, erstelle eine neue
     # Bevorzuge Docker-Container Pfad wenn wir in einem Container sind
     if os.path.exists('/app'):
@@ -67,32 +148,358 @@ def get_db():
     else:
         default_path = os.path.join(os.getcwd(), "db", "options_tracker.db")
         os.makedirs(os.path.join(os.getcwd(), "db"), exist_ok=True)
-    
+
+    logging.info(f"Erstelle neue Datenbank: {default_path}")
+    return default_path
+
+
+def normalize_user(user_id):
+    """
+    Benutzerkennung in Kleinbuchstaben; None/leer ergibt DEFAULT_USER.
+    Ungültige Kennungen (z.B. mit Pfadtrennern) lösen ValueError aus.
+    """
+    user_id = (user_id or DEFAULT_USER).strip().lower()
+    if not _USER_PATTERN.fullmatch(user_id):
+        raise ValueError(f"Ungültige Benutzerkennung: {user_id!r}")
+    return user_id
+
+
+def normalize_tenant_user(user_id):
+    """
+    Kennung eines angemeldeten Benutzers (Header oder Login). Wie
+    normalize_user, lehnt aber den reservierten DEFAULT_USER ab, dessen Daten
+    in der gemeinsamen Standarddatenbank liegen.
+    """
+    normalized = normalize_user(user_id) if user_id else None
+    if normalized is None or normalized == DEFAULT_USER:
+        raise ValueError(f"Reservierte Benutzerkennung: {user_id!r}")
+    return normalized
+
+
+def set_current_user(user_id):
+    """Legt den Benutzer fest, dessen Datenbank get_db() in diesem Thread liefert."""
+    _local.user = normalize_user(user_id)
+    return _local.user
+
+
+def get_current_user():
+    return getattr(_local, "user", DEFAULT_USER)
+
+
+@contextlib.contextmanager
+def use_user(user_id):
+    """Führt den Block mit der Datenbank von ``user_id`` aus (danach wieder der vorherige Benutzer)."""
+    previous = get_current_user()
+    set_current_user(user_id)
     try:
-        logging.info(f"Erstelle neue Datenbank: {default_path}")
-        conn = sqlite3.connect(default_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        yield _local.user
+    finally:
+        _local.user = previous
+
+
+def _default_db_path():
+    """Datenbankpfad des Standardbenutzers, der einmal pro Prozess aufgelöst wird."""
+    global _db_path
+    if _db_path is None:
+        with _path_lock:
+            if _db_path is None:
+                _db_path = _resolve_db_path()
+                logging.info(f"Datenbankverbindung erfolgreich: {_db_path}")
+    return _db_path
+
+
+def get_tenant_dir():
+    """Verzeichnis der Benutzerdatenbanken (DATABASE_TENANT_DIR, sonst users/ neben der Standarddatenbank)."""
+    return os.environ.get("DATABASE_TENANT_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(_default_db_path())), "users")
+
+
+def get_db_path(user_id=None):
+    """
+    Datenbankdatei von ``user_id`` (Standard: Benutzer des aktuellen Threads).
+    Der Standardbenutzer verwendet die bisherige Datenbank, alle anderen eine
+    eigene Datei <DATABASE_TENANT_DIR>/<user>.db.
+    """
+    user_id = normalize_user(user_id) if user_id is not None else get_current_user()
+    if user_id == DEFAULT_USER:
+        return _default_db_path()
+    return os.path.join(get_tenant_dir(), f"{user_id}.db")
+
+
+def reset_db_path():
+    """Pools schließen und die Datenbankpfade beim nächsten Zugriff neu auflösen."""
+    global _db_path
+    close_pool()
+    with _path_lock:
+        _db_path = None
+        _pools.clear()
+
+
+def _provision(path):
+    """Legt die Datenbank eines neuen Benutzers mit Tabellen und Basisdaten an."""
+    import init_db
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    logging.info(f"Erstelle Benutzerdatenbank: {path}")
+    init_db.create_tables(path)
+    init_db.fill_tables(path)
+
+
+def _get_pool(user_id=None):
+    user_id = normalize_user(user_id) if user_id is not None else get_current_user()
+    path = get_db_path(user_id)
+    pool = _pools.get(path)
+    if pool is not None:
+        return pool
+    with _path_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            if user_id != DEFAULT_USER and not os.path.exists(path):
+                _provision(path)
+            pool = _pools[path] = _Pool(path, user_id)
+    return pool
+
+
+def _open_connection(pool):
+    try:
+        conn = sqlite3.connect(pool.path, timeout=30.0, check_same_thread=False,
+                               factory=PooledConnection)
     except Exception as e:
-        logging.error(f"Fehler beim Erstellen der Datenbank: {str(e)}")
+        logging.error(f"Fehler beim Öffnen der Datenbank: {str(e)}")
         raise Exception(f"Konnte keine Datenbankverbindung herstellen: {str(e)}")
 
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")  # Bessere Parallelität
+    conn.execute("PRAGMA synchronous = NORMAL")  # Bessere Performance
+    with pool.lock:
+        pool.connections.add(conn)
+        pool.stats["opened"] += 1
+    _ensure_schema(conn, pool)
+    return conn
+
+
+def _ensure_schema(conn, pool):
+    """Wendet ausstehende Migrationen einmal pro Prozess und Datei an (z.B. nach einem Update)."""
+    if pool.schema_checked:
+        return
+    with pool.lock:
+        if pool.schema_checked:
+            return
+        if pending_migrations(conn):
+            try:
+                applied = migrate(conn)
+            except Exception as e:
+                logging.error(f"Schema-Migration fehlgeschlagen ({pool.path}): {e}")
+                raise
+            if applied:
+                logging.info(f"Schema-Migrationen angewendet ({pool.path}): {applied}")
+        pool.schema_checked = True
+
+
+def _checkin(conn, pool):
+    """Verbindung zurück in den Pool legen (oder schließen, wenn er voll ist)."""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.ProgrammingError:
+        # Verbindung wurde bereits geschlossen
+        return
+
+    with pool.lock:
+        pool.stats["released"] += 1
+        if len(pool.idle) < POOL_MAX_IDLE:
+            pool.idle.append(conn)
+            return
+        pool.connections.discard(conn)
+        pool.stats["closed"] += 1
+    conn._close_connection()
+
+
+def get_db(user_id=None):
+    """
+    Liefert die Datenbankverbindung des aktuellen Threads für ``user_id``
+    (Standard: Benutzer des Threads, siehe set_current_user). Pro Thread und
+    Datenbankdatei wird genau eine Verbindung aus dem Pool der Datei
+    ausgeliehen; sie wird beim Ende des Threads oder bei conn.close() an den
+    Pool zurückgegeben. Jeder Benutzer hat eine eigene Datei und damit eine
+    eigene Schreibsperre.
+    """
+    pool = _get_pool(user_id)
+    leases = _local.__dict__.setdefault("leases", {})
+    lease = leases.get(pool.path)
+    if lease is not None and lease.finalizer.alive:
+        return lease.conn
+
+    with pool.lock:
+        conn = pool.idle.pop() if pool.idle else None
+        if conn is not None:
+            pool.stats["reused"] += 1
+        pool.stats["checked_out"] += 1
+    if conn is None:
+        conn = _open_connection(pool)
+
+    lease = _Lease()
+    lease.conn = conn
+    lease.finalizer = weakref.finalize(lease, _checkin, conn, pool)
+    conn._finalizer = lease.finalizer
+    leases[pool.path] = lease
+    return conn
+
+
+def close_pool():
+    """Schließt alle Verbindungen aller Pools, auch die aktuell ausgeliehenen."""
+    connections = []
+    for pool in list(_pools.values()):
+        with pool.lock:
+            connections.extend(pool.connections)
+            pool.stats["closed"] += len(pool.connections)
+            pool.connections.clear()
+            pool.idle.clear()
+    for conn in connections:
+        finalizer = getattr(conn, "_finalizer", None)
+        if finalizer is not None:
+            finalizer.detach()
+        conn._close_connection()
+    _local.__dict__.pop("leases", None)
+
+
+atexit.register(close_pool)
+
+
+def get_pool_stats():
+    """Kennzahlen der Verbindungspools (Summen über alle Datenbankdateien)."""
+    totals = {"path": get_db_path(), "databases": 0, "opened": 0, "reused": 0, "checked_out": 0,
+              "released": 0, "closed": 0, "open": 0, "idle": 0, "in_use": 0}
+    for pool in list(_pools.values()):
+        with pool.lock:
+            totals["databases"] += 1
+            for key, value in pool.stats.items():
+                totals[key] += value
+            totals["open"] += len(pool.connections)
+            totals["idle"] += len(pool.idle)
+            totals["in_use"] += len(pool.connections) - len(pool.idle)
+    return totals
+
+
+# Gemeinsamer Datenstand aller Verbindungen: die Zähler aus Migration 006
+# (Datei, Updates, Löschungen) und die höchste Transaktions-ID (Inserts)
+DATA_STATE_SQL = """
+    SELECT (SELECT version FROM data_version WHERE name = 'generation'),
+           (SELECT version FROM data_version WHERE name = 'rewrite'),
+           (SELECT version FROM data_version WHERE name = 'changes'),
+           (SELECT MAX(id) FROM transactions)
+"""
+
+
+def _read_data_state(conn):
+    try:
+        return tuple(conn.execute(DATA_STATE_SQL).fetchone())
+    except sqlite3.OperationalError:
+        # Schema ohne Zähler (z.B. nach reset_database): jeder Aufruf gilt als Änderung
+        return object()
+
+
+def mark_data_changed():
+    """
+    Erhöht den Schreibzähler der Datenbank des aktuellen Benutzers nach einem
+    eigenen Schreibzugriff und benachrichtigt die registrierten Listener (nach
+    dem Commit, mit Benutzer und neuer Version). Der neue Datenstand wird als
+    gesehen gemerkt, damit get_data_version() denselben Commit nicht noch
+    einmal zählt.
+    """
+    pool = _get_pool()
+    state = _read_data_state(get_db())
+    with pool.lock:
+        pool.data_version += 1
+        pool.data_state = state
+        version = pool.data_version
+    for listener in list(_write_listeners):
+        try:
+            listener(pool.user_id, version)
+        except Exception:
+            logging.exception("Fehler im Schreib-Listener")
+    return version
+
+
+def add_write_listener(listener):
+    """Registriert ``listener(user_id, version)``, der nach jedem mark_data_changed() aufgerufen wird."""
+    with _listener_lock:
+        if listener not in _write_listeners:
+            _write_listeners.append(listener)
+
+
+def remove_write_listener(listener):
+    with _listener_lock:
+        if listener in _write_listeners:
+            _write_listeners.remove(listener)
+
+
+def get_data_version():
+    """
+    Günstige Datenversion für Caches: der Schreibzähler dieses Prozesses für die
+    Datenbank des aktuellen Benutzers. Zeigt PRAGMA data_version auf der
+    Verbindung des Threads Commits anderer Verbindungen (auch anderer
+    Prozesse) an, wird der gemeinsame Datenstand (DATA_STATE_SQL) gelesen und
+    mit dem zuletzt im Pool gesehenen verglichen, so dass ein Commit den Zähler
+    nur einmal erhöht, egal wie viele Verbindungen des Pools ihn bemerken.
+    """
+    pool = _get_pool()
+    conn = get_db()
+    current = conn.execute("PRAGMA data_version").fetchone()[0]
+    if getattr(conn, "_seen_data_version", None) == current:
+        return pool.data_version
+    state = _read_data_state(conn)
+    with pool.lock:
+        conn._seen_data_version = current
+        if state != pool.data_state:
+            pool.data_state = state
+            pool.data_version += 1
+        return pool.data_version
+
 
 def get_options(query):
     conn = get_db()
     return [tuple(row) for row in conn.execute(query).fetchall()]
 
 
-def new_transaction(**kwargs):
-    conn = get_db()
-    sql = """
+INSERT_TRANSACTION_SQL = """
     INSERT INTO transactions (
         trade_id, date, product_id, price, qty, fee, tax, total_price, price_correct, action_id, open_qty, gain
     ) VALUES (
         ?,?,?,?,?,?,?,?,?,?,?,?
     )
+"""
+
+
+@contextlib.contextmanager
+def write_transaction(conn=None):
+    """
+    Unit of Work für zusammengehörige Schreibzugriffe: BEGIN IMMEDIATE holt die
+    Schreibsperre sofort (kein späteres Upgrade, das mit anderen Schreibern in
+    SQLITE_BUSY enden kann), am Ende wird genau einmal committet, bei einem
+    Fehler alles zurückgerollt. Nach dem Commit wird mark_data_changed()
+    aufgerufen. Verschachtelte Aufrufe laufen in der äußeren Transaktion.
     """
+    conn = conn or get_db()
+    if getattr(conn, "_unit_of_work", False):
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    conn._unit_of_work = True
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn._unit_of_work = False
+    mark_data_changed()
+
 
+def insert_transaction(conn, **kwargs):
+    """Fügt eine Transaktion ein, ohne zu committen oder die Ledger zu aktualisieren."""
     values = (
         kwargs["trade_id"],
         kwargs["date"],
@@ -107,54 +514,23 @@ def new_transaction(**kwargs):
         kwargs["open_qty"],
         kwargs["gain"]
     )
+    conn.execute(INSERT_TRANSACTION_SQL, values)
 
-    conn.execute(sql, values)
-    conn.commit()
+
+def new_transaction(**kwargs):
+    with write_transaction() as conn:
+        insert_transaction(conn, **kwargs)
+        refresh_position(conn, kwargs["trade_id"])
+        refresh_daily_pnl(conn, kwargs["date"])
 
 
 def get_product_choices():
-    conn = get_db()
-    return [
-        (row["trade_id"], f"{row['direction']} @ {row['strike']}{row['currency']} {row['basis_name']}",
-         row["open_qty"], row["product_id"], row["price_paid"])
-        for row in conn.execute("""           
-        SELECT
-            t.trade_id,
-            p.id AS product_id,
-            bp.name AS basis_name,
-            pt.name AS type_name,
-            d.name AS direction,
-            p.strike,
-            sc.symbol AS currency,
-            SUM(COALESCE(t.open_qty,0)) AS open_qty,
-            SUM(COALESCE(t.total_price,0)) AS price_paid
-        FROM transactions t
-        JOIN products p ON t.product_id = p.id
-        JOIN basis_products bp ON p.basis_product_id = bp.id
-        JOIN product_types pt ON p.product_type_id = pt.id
-        JOIN directions d ON p.direction_id = d.id
-        JOIN strike_currencies sc ON p.strike_currency_id = sc.id
-        JOIN actions a ON t.action_id = a.id
-        GROUP BY t.trade_id, p.id
-        HAVING SUM(open_qty) > 0
-        ORDER BY p.id;
-        """).fetchall()
-    ]
+    """Offene Positionen aus dem Positions-Ledger (trade_id, label, open_qty, product_id, price_paid)."""
+    return get_open_positions(get_db())
 
 
 def update_open_qty(trade_id, open_qty):
-    conn = get_db()
-    conn.execute("UPDATE transactions SET open_qty = ? WHERE trade_id = ?", (open_qty, trade_id,))
-    conn.commit()
-
-def update_loss_carryforward(amount, user_id="default"):
-    conn=get_db()
-    conn.execute("UPDATE settings SET loss_carryforward = ? WHERE user_id = ?", (amount, user_id))
-    conn.commit()
-    st.session_state.loss_carryforward = amount
-
-def update_tax_allowance(amount, user_id="default"):
-    conn=get_db()
-    conn.execute("UPDATE settings SET tax_allowance = ? WHERE user_id = ?", (amount, user_id))
-    conn.commit()
-    st.session_state.tax_allowance = amount
+    with write_transaction() as conn:
+        conn.execute("UPDATE transactions SET open_qty = ? WHERE trade_id = ?", (open_qty, trade_id,))
+        refresh_position(conn, trade_id)
+
@@ -0,0 +1,214 @@
+"""
+Streaming export of the transaction history to CSV, Parquet and Excel.
+
+Rows are read through a cursor with ``fetchmany`` in fixed-size chunks and
+written chunk by chunk, so memory use stays flat regardless of the size of the
+history: CSV via ``csv.writer``, Parquet via ``pyarrow.parquet.ParquetWriter``
+(one row group per chunk, only when pyarrow is installed) and Excel via
+xlsxwriter in ``constant_memory`` mode with a transactions and a products sheet.
+
+The download button of the tables page hands the finished file to Streamlit,
+which keeps it in memory while it is offered; the page therefore exports at most
+``DOWNLOAD_MAX_ROWS`` transactions (``EXPORT_DOWNLOAD_MAX_ROWS``), larger
+histories are exported with the command line:
+
+    python -m utils.exporter transactions.csv
+    python -m utils.exporter history.xlsx --chunk-size 20000
+"""
+import csv
+import importlib.util
+import os
+import time
+
+from utils.db_helper import get_db, set_current_user
+
+DEFAULT_CHUNK_SIZE = 5000
+DOWNLOAD_MAX_ROWS = int(os.environ.get("EXPORT_DOWNLOAD_MAX_ROWS", "100000"))
+
+TRANSACTIONS_EXPORT_SQL = """
+    SELECT transaction_id,
+           trade_id,
+           date,
+           basis_product AS underlying,
+           product_type,
+           direction,
+           strike,
+           strike_currency AS currency,
+           wkn,
+           product_name AS name,
+           expiry_date,
+           action,
+           price,
+           qty,
+           fee,
+           tax,
+           total_price,
+           gain,
+           open_qty,
+           price_correct
+    FROM v_transactions
+    ORDER BY date ASC, transaction_id ASC
+"""
+
+PRODUCTS_EXPORT_SQL = """
+    SELECT product_id,
+           basis_product AS underlying,
+           product_type,
+           direction,
+           strike,
+           strike_currency AS currency,
+           wkn,
+           product_name AS name,
+           expiry_date
+    FROM v_products
+    ORDER BY product_id ASC
+"""
+
+TRANSACTION_COLUMNS = ["id", "trade_id", "date", "underlying", "product_type", "direction", "strike", "currency",
+                       "wkn", "name", "expiry_date", "action", "price", "qty", "fee", "tax", "total_price", "gain",
+                       "open_qty", "price_correct"]
+PRODUCT_COLUMNS = ["id", "underlying", "product_type", "direction", "strike", "currency", "wkn", "name",
+                   "expiry_date"]
+
+FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+}
+
+
+class ExportTooLarge(ValueError):
+    """The history has more transactions than an export may hold."""
+
+    def __init__(self, rows, max_rows):
+        self.rows = rows
+        self.max_rows = max_rows
+        super().__init__(f"{rows:,} transactions exceed the limit of {max_rows:,}")
+
+
+def has_parquet():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != "parquet" or has_parquet()]
+
+
+def iter_chunks(sql, chunk_size=DEFAULT_CHUNK_SIZE, conn=None):
+    """Yields the result rows of ``sql`` as tuples in lists of at most ``chunk_size``."""
+    cursor = (conn or get_db()).cursor()
+    cursor.row_factory = None
+    try:
+        cursor.execute(sql)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def export_csv(path, chunk_size=DEFAULT_CHUNK_SIZE, conn=None):
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(TRANSACTION_COLUMNS)
+        for chunk in iter_chunks(TRANSACTIONS_EXPORT_SQL, chunk_size, conn):
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    types = {"id": pa.int64(), "trade_id": pa.int64(), "qty": pa.int64(), "open_qty": pa.int64(),
+             "price_correct": pa.int64(), "strike": pa.float64(), "price": pa.float64(), "fee": pa.float64(),
+             "tax": pa.float64(), "total_price": pa.float64(), "gain": pa.float64()}
+    return pa.schema([(column, types.get(column, pa.string())) for column in TRANSACTION_COLUMNS])
+
+
+def export_parquet(path, chunk_size=DEFAULT_CHUNK_SIZE, conn=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_chunks(TRANSACTIONS_EXPORT_SQL, chunk_size, conn):
+            columns = list(zip(*chunk))
+            arrays = [pa.array([None if v is None else str(v) for v in values], field.type)
+                      if field.type == pa.string() else pa.array(values, field.type, from_pandas=True)
+                      for field, values in zip(schema, columns)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+def _write_sheet(workbook, name, columns, sql, chunk_size, conn):
+    sheet = workbook.add_worksheet(name)
+    header = workbook.add_format({"bold": True})
+    sheet.write_row(0, 0, columns, header)
+    row_index = 0
+    for chunk in iter_chunks(sql, chunk_size, conn):
+        for row in chunk:
+            row_index += 1
+            sheet.write_row(row_index, 0, row)
+    sheet.freeze_panes(1, 0)
+    return row_index
+
+
+def export_excel(path, chunk_size=DEFAULT_CHUNK_SIZE, conn=None):
+    import xlsxwriter
+
+    # constant_memory flushes every finished row to disk; rows must be written in order
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_numbers": False})
+    try:
+        rows = _write_sheet(workbook, "Transactions", TRANSACTION_COLUMNS, TRANSACTIONS_EXPORT_SQL, chunk_size, conn)
+        _write_sheet(workbook, "Products", PRODUCT_COLUMNS, PRODUCTS_EXPORT_SQL, chunk_size, conn)
+    finally:
+        workbook.close()
+    return rows
+
+
+EXPORTERS = {"csv": export_csv, "parquet": export_parquet, "xlsx": export_excel}
+
+
+def export_transactions(path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE, conn=None, max_rows=None):
+    """
+    Exports the transaction history to ``path``; the format defaults to the file
+    extension. With ``max_rows`` a larger history raises ExportTooLarge before
+    anything is written.
+    """
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == "parquet" and not has_parquet():
+        raise RuntimeError("Parquet export requires pyarrow")
+    if max_rows is not None:
+        rows = (conn or get_db()).execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        if rows > max_rows:
+            raise ExportTooLarge(rows, max_rows)
+    return EXPORTERS[fmt](path, chunk_size, conn)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the transaction history (CSV, Parquet or Excel)")
+    parser.add_argument("file", help="target file, the format is taken from the extension")
+    parser.add_argument("--format", choices=list(EXPORTERS), help="override the format")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--user", default="default", help="user whose database is used")
+    args = parser.parse_args()
+    set_current_user(args.user)
+
+    started = time.perf_counter()
+    rows = export_transactions(args.file, args.format, args.chunk_size)
+    elapsed = time.perf_counter() - started
+    print(f"Exported {rows:,} transactions to {args.file} in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
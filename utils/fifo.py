@@ -0,0 +1,156 @@
+"""
+In-memory FIFO lot index for partial sells.
+
+``LOT_BOOK`` keeps the open buy/rebuy lots of every trade it has seen, in FIFO
+order (date, id), separately for every database file (one per user). The lots
+are loaded once per trade and dropped whenever the data version of that
+database changes because of a write the book did not perform itself, so
+previews run without touching the ``transactions`` table.
+``consume`` writes all lot updates of a partial sell with one ``executemany``,
+in its own transaction or in the caller's unit of work.
+"""
+import threading
+
+from utils.db_helper import get_db, get_db_path, get_data_version, mark_data_changed
+from utils.ledger import refresh_position
+
+LOTS_SQL = """
+    SELECT id, qty, open_qty, total_price
+    FROM transactions
+    WHERE trade_id = ? AND action_id IN (1,3) AND open_qty > 0
+    ORDER BY date ASC, id ASC
+"""
+
+
+class Lot:
+    __slots__ = ("txn_id", "qty", "open_qty", "unit_cost")
+
+    def __init__(self, txn_id, qty, open_qty, total_price):
+        self.txn_id = txn_id
+        self.qty = qty
+        self.open_qty = open_qty
+        self.unit_cost = total_price / qty
+
+
+class LotBook:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Per database file: [data version, {trade_id: [Lot, ...]}]
+        self._books = {}
+
+    def _sync(self):
+        """Lot state of the current user's database, emptied if its data version moved."""
+        path = get_db_path()
+        version = get_data_version()
+        state = self._books.get(path)
+        if state is None or state[0] != version:
+            state = self._books[path] = [version, {}]
+        return state
+
+    @staticmethod
+    def _trade_lots(state, trade_id):
+        lots = state[1].get(trade_id)
+        if lots is None:
+            rows = get_db().execute(LOTS_SQL, (trade_id,)).fetchall()
+            lots = [Lot(row[0], row[1], row[2], row[3]) for row in rows]
+            state[1][trade_id] = lots
+        return lots
+
+    @staticmethod
+    def _plan(lots, qty):
+        """FIFO allocation of ``qty``: (total_cost, [(lot, used_qty), ...])."""
+        remaining = qty
+        total_cost = 0
+        used = []
+        for lot in lots:
+            if remaining == 0:
+                break
+            used_qty = min(remaining, lot.open_qty)
+            total_cost += lot.unit_cost * used_qty
+            remaining -= used_qty
+            used.append((lot, used_qty))
+        return total_cost, used
+
+    def open_lots(self, trade_id):
+        """Open lots of a trade as (txn_id, qty, open_qty) tuples in FIFO order."""
+        with self._lock:
+            state = self._sync()
+            return [(lot.txn_id, lot.qty, lot.open_qty) for lot in self._trade_lots(state, trade_id)]
+
+    def preview(self, trade_id, qty, price, fee):
+        """
+        FIFO cost of selling ``qty`` units at ``price`` minus ``fee``. Returns the
+        cost basis, revenue, gross gain and the used lots as (txn_id, used_qty).
+        """
+        with self._lock:
+            state = self._sync()
+            total_cost, used = self._plan(self._trade_lots(state, trade_id), qty)
+            used_transactions = [(lot.txn_id, used_qty) for lot, used_qty in used]
+
+        total_revenue = (price * qty) - fee
+        return {
+            "cost": total_cost,
+            "revenue": total_revenue,
+            "gross_gain": total_revenue - total_cost,
+            "sold_qty": sum(used_qty for _, used_qty in used_transactions),
+            "used_transactions": used_transactions,
+        }
+
+    def consume(self, trade_id, qty, conn=None):
+        """
+        Books the FIFO consumption of ``qty`` units: one executemany for all lot
+        updates plus the positions ledger refresh, committed together. With
+        ``conn`` the updates join the caller's open transaction (see
+        ``db_helper.write_transaction``) and the trade's lots are reloaded on
+        the next use. Returns the used lots as (txn_id, used_qty).
+        """
+        own = conn is None
+        conn = conn or get_db()
+        with self._lock:
+            state = self._sync()
+            lots = self._trade_lots(state, trade_id)
+            _, used = self._plan(lots, qty)
+            if not used:
+                return []
+
+            try:
+                conn.executemany("UPDATE transactions SET open_qty = ? WHERE id = ?",
+                                 [(lot.open_qty - used_qty, lot.txn_id) for lot, used_qty in used])
+                refresh_position(conn, trade_id)
+                if own:
+                    conn.commit()
+            except Exception:
+                if own:
+                    conn.rollback()
+                state[1].pop(trade_id, None)
+                raise
+
+            if not own:
+                # The caller commits (or rolls back) later
+                state[1].pop(trade_id, None)
+                return [(lot.txn_id, used_qty) for lot, used_qty in used]
+
+            for lot, used_qty in used:
+                lot.open_qty -= used_qty
+            state[1][trade_id] = [lot for lot in lots if lot.open_qty > 0]
+
+            # Keep the loaded lots if no other write happened in between
+            expected = state[0] + 1
+            state[0] = mark_data_changed()
+            if state[0] != expected:
+                state[1].clear()
+
+            return [(lot.txn_id, used_qty) for lot, used_qty in used]
+
+    def invalidate(self, trade_id=None):
+        """Drops the lots of ``trade_id`` in the current user's database (all lots of all databases if None)."""
+        with self._lock:
+            if trade_id is None:
+                self._books.clear()
+            else:
+                state = self._books.get(get_db_path())
+                if state is not None:
+                    state[1].pop(trade_id, None)
+
+
+LOT_BOOK = LotBook()
@@ -0,0 +1,380 @@
+"""
+Columnar on-disk snapshot of the joined transaction frame.
+
+The frame built by ``overview_helper.load_data`` is written next to each
+database (``<database>.frame/``, or below ``FRAME_SNAPSHOT_DIR`` in a directory
+named after the database file and a hash of its full path) as one NumPy
+``.npy`` file per column: numeric and datetime columns as they are, text
+columns dictionary-encoded as ``int32`` codes plus a small array of distinct
+values (missing values are the code -1 and come back as missing values).
+A fresh process memory-maps the columns instead of running the join and the
+date parsing again.
+
+Every snapshot is tagged with the persistent counters of the ``data_version``
+table (migration 006), which triggers keep up to date in every process:
+
+* ``changes`` - increased by every UPDATE of a transaction; the updated id is
+  logged in ``transaction_changes`` with the new counter value,
+* ``rewrite`` - increased by deletes of transactions and by changes of
+  products and master data, which can touch any row of the frame.
+
+When only ``changes`` moved or transactions were appended (``id`` above the
+snapshot's highest id), only those rows are queried, merged in memory and
+appended to the snapshot on disk as a delta part: a snapshot is a manifest
+listing a base part with all rows and the delta parts written since, and a
+reader combines them (a row of a later part replaces the same id in an earlier
+one). A write therefore costs the size of the new rows, not of the history.
+When the delta parts grow beyond ``COMPACT_FRACTION`` of the base part (or
+``MAX_PARTS`` parts), and whenever the ``rewrite`` counter differs, a single new
+base part is written. Manifests are published by replacing the ``CURRENT``
+pointer file, so readers in other processes never see a partial snapshot.
+Disabled with ``FRAME_SNAPSHOT=0``.
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from utils.db_helper import get_db, get_db_path
+
+ENABLED = os.environ.get("FRAME_SNAPSHOT", "1") not in ("0", "false", "False", "")
+FORMAT = 2
+KEEP_SECONDS = 60
+# Delta rows (as a share of the base part) and number of parts that trigger a compaction
+COMPACT_FRACTION = float(os.environ.get("FRAME_SNAPSHOT_COMPACT", "0.25"))
+MAX_PARTS = 16
+
+logger = logging.getLogger("options_tracker.frame_snapshot")
+
+# _lock guards the dictionaries below; loads of one database file are serialised
+# by that file's lock, so users with their own databases do not wait for each other
+_lock = threading.Lock()
+_path_locks = {}
+_current = {}
+_stats = {"full": 0, "incremental": 0, "mapped": 0, "current": 0, "rows_merged": 0}
+
+
+def _path_lock(path):
+    with _lock:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.Lock()
+        return lock
+
+
+def _count(**increments):
+    with _lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def snapshot_dir(db_path=None):
+    db_path = db_path or get_db_path()
+    parent = os.environ.get("FRAME_SNAPSHOT_DIR")
+    if parent:
+        # Equal file names of different databases (e.g. a user named like the default database) must not collide
+        digest = hashlib.sha1(os.path.abspath(db_path).encode()).hexdigest()[:12]
+        return os.path.join(parent, f"{os.path.basename(db_path)}-{digest}.frame")
+    return f"{db_path}.frame"
+
+
+def read_versions(conn):
+    """Persistent counters (generation, rewrite, changes) and the highest transaction id; None before migration 006."""
+    try:
+        counters = dict(conn.execute("SELECT name, version FROM data_version").fetchall())
+    except Exception:
+        return None
+    max_id = conn.execute("SELECT MAX(id) FROM transactions").fetchone()[0] or 0
+    return {"generation": counters.get("generation", 0), "rewrite": counters.get("rewrite", 0),
+            "changes": counters.get("changes", 0), "max_id": max_id}
+
+
+class FrameSnapshot:
+    __slots__ = ("df", "generation", "rewrite", "changes", "max_id", "manifest", "parts")
+
+    def __init__(self, df, generation, rewrite, changes, max_id, manifest=None, parts=None):
+        self.df = df
+        self.generation = generation
+        self.rewrite = rewrite
+        self.changes = changes
+        self.max_id = max_id
+        # Name of the published manifest and its parts ([{"name", "rows"}], base first); None if not on disk
+        self.manifest = manifest
+        self.parts = parts
+
+    def covers(self, versions):
+        """True if the snapshot can be brought up to ``versions`` incrementally."""
+        return (self.generation == versions["generation"] and self.rewrite == versions["rewrite"]
+                and self.changes <= versions["changes"] and self.max_id <= versions["max_id"])
+
+    def is_current(self, versions):
+        return self.covers(versions) and (self.changes, self.max_id) == (versions["changes"], versions["max_id"])
+
+
+# ----- files -----
+
+def _write_columns(df, target):
+    columns = []
+    for position, name in enumerate(df.columns):
+        column = df[name]
+        stem = os.path.join(target, f"c{position}")
+        if column.dtype.kind in "biufM":
+            np.save(stem + ".npy", column.to_numpy())
+            columns.append({"name": name, "kind": "array", "dtype": str(column.dtype)})
+        else:
+            # Missing values get the code -1 and are restored as missing, never as text
+            codes, uniques = pd.factorize(column, use_na_sentinel=True)
+            values = np.asarray(uniques, dtype=object)
+            np.save(stem + ".codes.npy", codes.astype(np.int32))
+            if all(isinstance(value, str) for value in values):
+                np.save(stem + ".values.npy", values.astype(str))
+                columns.append({"name": name, "kind": "text", "dtype": str(column.dtype)})
+            else:
+                # Other values (e.g. numbers in an object column) keep their type instead of becoming strings
+                np.save(stem + ".values.npy", values, allow_pickle=True)
+                columns.append({"name": name, "kind": "text", "dtype": str(column.dtype), "values": "object"})
+    return columns
+
+
+def _read_columns(source, columns):
+    data = {}
+    for position, column in enumerate(columns):
+        stem = os.path.join(source, f"c{position}")
+        if column["kind"] == "array":
+            # Plain ndarray view of the mapping (no copy)
+            data[column["name"]] = np.asarray(np.load(stem + ".npy", mmap_mode="r"))
+            continue
+        codes = np.load(stem + ".codes.npy", mmap_mode="r")
+        uniques = np.load(stem + ".values.npy", allow_pickle=column.get("values") == "object")
+        if column["dtype"] == "object":
+            values = np.empty(len(uniques) + 1, dtype=object)
+            values[:-1] = uniques
+            values[-1] = None
+            data[column["name"]] = values[codes]
+        else:
+            data[column["name"]] = pd.array(uniques, dtype=column["dtype"]).take(codes, allow_fill=True)
+    return pd.DataFrame(data, copy=False)
+
+
+def _new_name(prefix):
+    return f"{prefix}{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+
+def _write_part(df, directory):
+    name = _new_name("p")
+    target = os.path.join(directory, name)
+    os.makedirs(target)
+    meta = {"rows": len(df), "columns": _write_columns(df, target)}
+    with open(os.path.join(target, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return {"name": name, "rows": len(df)}
+
+
+def _read_part(directory, part):
+    with open(os.path.join(directory, part["name"], "meta.json")) as f:
+        meta = json.load(f)
+    return _read_columns(os.path.join(directory, part["name"]), meta["columns"])
+
+
+def _current_manifest(directory):
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _needs_compaction(parts, fresh_rows):
+    delta = sum(part["rows"] for part in parts[1:]) + fresh_rows
+    return len(parts) + 1 > MAX_PARTS or delta > COMPACT_FRACTION * max(parts[0]["rows"], 1)
+
+
+def write_snapshot(snapshot, directory=None, base=None, fresh=None):
+    """
+    Publishes ``snapshot`` in ``directory``. With ``base`` (the published
+    snapshot it was merged from) and ``fresh`` (the merged rows) only ``fresh``
+    is written as a delta part, unless the parts need a compaction or another
+    process has published a different snapshot meanwhile; otherwise the whole
+    frame is written as a new base part. Sets ``snapshot.manifest/parts``.
+    """
+    directory = directory or snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+    if (base is not None and fresh is not None and base.parts and base.manifest == _current_manifest(directory)
+            and not _needs_compaction(base.parts, len(fresh))):
+        parts = base.parts + [_write_part(fresh, directory)]
+    else:
+        parts = [_write_part(snapshot.df, directory)]
+
+    name = _new_name("m")
+    manifest = {
+        "format": FORMAT,
+        "generation": snapshot.generation,
+        "rewrite": snapshot.rewrite,
+        "changes": snapshot.changes,
+        "max_id": snapshot.max_id,
+        "rows": len(snapshot.df),
+        "parts": parts,
+        "created": time.time(),
+    }
+    with open(os.path.join(directory, f"{name}.json"), "w") as f:
+        json.dump(manifest, f)
+    pointer = os.path.join(directory, f"CURRENT.{name}")
+    with open(pointer, "w") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(directory, "CURRENT"))
+    snapshot.manifest, snapshot.parts = name, parts
+    _remove_old(directory, keep={name, *(part["name"] for part in parts)})
+
+
+def _remove_old(directory, keep):
+    # Unreferenced manifests and parts stay for a while: other processes may still be mapping them
+    cutoff = time.time() - KEEP_SECONDS
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        name = entry[:-len(".json")] if entry.endswith(".json") else entry
+        if name in keep or entry.startswith("CURRENT") or os.path.getmtime(path) >= cutoff:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+def open_snapshot(directory=None, id_column="transaction_id", sort_columns=("date", "transaction_id")):
+    """
+    Memory-maps the current snapshot of ``directory`` (None if there is none or
+    it is unreadable). A snapshot with delta parts is combined in memory and
+    ordered like ``load_frame`` orders it.
+    """
+    directory = directory or snapshot_dir()
+    try:
+        name = _current_manifest(directory)
+        if name is None:
+            return None
+        with open(os.path.join(directory, f"{name}.json")) as f:
+            meta = json.load(f)
+        if meta["format"] != FORMAT:
+            return None
+        frames = [_read_part(directory, part) for part in meta["parts"]]
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logger.warning("Frame snapshot in %s is unreadable: %s", directory, e)
+        return None
+    df = frames[0]
+    if len(frames) > 1:
+        df = pd.concat(frames, ignore_index=True).drop_duplicates(id_column, keep="last")
+        df = _sort(df, sort_columns)
+    return FrameSnapshot(df, meta["generation"], meta["rewrite"], meta["changes"], meta["max_id"],
+                         manifest=name, parts=meta["parts"])
+
+
+# ----- loading -----
+
+def _align(fresh, base):
+    """
+    All-NULL columns of newly queried rows get the snapshot's dtype (integers
+    become float), so the merge does not fall back to object columns. Other
+    differences are left to the upcasting of pd.concat.
+    """
+    for name, dtype in base.dtypes.items():
+        column = fresh[name]
+        if column.dtype != dtype and column.isna().all():
+            fresh[name] = column.astype("float64" if dtype.kind in "biu" else dtype)
+    return fresh
+
+
+def _sort(df, sort_columns):
+    ascending = [False] + [True] * (len(sort_columns) - 1)
+    return df.sort_values(list(sort_columns), ascending=ascending, kind="stable", ignore_index=True)
+
+
+def _merge(base, fresh, id_column, sort_columns):
+    kept = base.df[~base.df[id_column].isin(fresh[id_column])]
+    return _sort(pd.concat([kept, fresh], ignore_index=True), sort_columns)
+
+
+def load_frame(query, id_column, sort_columns, conn=None):
+    """
+    The frame of ``query(where, params)`` for the whole table, served from the
+    snapshot when possible. ``query`` must select the transaction id as
+    ``id_column``; the frame is ordered by ``sort_columns`` (the first one
+    descending). Callers must not modify the returned frame in place.
+    """
+    conn = conn or get_db()
+    if not ENABLED:
+        return query("1=1", ())
+
+    path = get_db_path()
+    with _path_lock(path):
+        # One read transaction: counters and queried rows belong to the same state
+        own = not conn.in_transaction
+        if own:
+            conn.execute("BEGIN")
+        try:
+            versions = read_versions(conn)
+            if versions is None:
+                return query("1=1", ())
+
+            base = _current.get(path)
+            if base is None or not base.covers(versions):
+                base = open_snapshot(snapshot_dir(path), id_column, sort_columns)
+                if base is not None:
+                    _count(mapped=1)
+
+            if base is not None and base.is_current(versions):
+                _count(current=1)
+                with _lock:
+                    _current[path] = base
+                return base.df
+
+            fresh = None
+            if base is not None and base.covers(versions):
+                # IN over a UNION keeps both lookups on their indexes (an OR would scan)
+                fresh = _align(query(
+                    f"{id_column} IN (SELECT id FROM transactions WHERE id > ?"
+                    " UNION ALL SELECT id FROM transaction_changes WHERE seq > ?)",
+                    (base.max_id, base.changes),
+                ), base.df)
+                df = _merge(base, fresh, id_column, sort_columns)
+                _count(incremental=1, rows_merged=len(fresh))
+            else:
+                base = None
+                df = query("1=1", ())
+                _count(full=1)
+        finally:
+            if own:
+                conn.commit()
+
+        snapshot = FrameSnapshot(df, versions["generation"], versions["rewrite"], versions["changes"],
+                                 versions["max_id"])
+        with _lock:
+            _current[path] = snapshot
+        # Written under the file's lock, so the delta parts of this process form one chain
+        try:
+            write_snapshot(snapshot, snapshot_dir(path), base=base, fresh=fresh)
+        except OSError as e:
+            logger.warning("Could not write the frame snapshot: %s", e)
+    return snapshot.df
+
+
+def drop_snapshot(db_path=None, remove_files=True):
+    """Forgets the in-memory snapshot of ``db_path`` and (by default) removes its files."""
+    db_path = db_path or get_db_path()
+    with _lock:
+        _current.pop(db_path, None)
+    if remove_files:
+        shutil.rmtree(snapshot_dir(db_path), ignore_errors=True)
+
+
+def get_snapshot_stats():
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,366 @@
+"""
+Bulk import of broker statements (CSV).
+
+Rows are parsed lazily from the file, products and master data are resolved
+from in-memory lookups (created on first use), trade ids and FIFO lot updates
+are tracked in memory, and the transactions are written with ``executemany``
+in batches. The whole import is one unit of work (``write_transaction``): the
+ids are allocated after ``BEGIN IMMEDIATE``, so no other session can take them
+between two batches, and a failing import leaves nothing behind. The positions
+ledger and the daily P&L rollup are rebuilt once at the end.
+
+Expected columns (header, case-insensitive, ``,`` or ``;`` separated):
+
+    date, action, underlying, product_type, direction, strike, currency, qty,
+    price, fee, total_price, tax, gain, wkn, name, expiry_date
+
+``action`` is one of buy, rebuy, sell, partial sell, redemption, knock-out.
+The number format is decided once per file: ``;``-separated statements (the
+German export format) use a decimal comma and dots for the thousands
+("1.000,50"), ``,``-separated ones a decimal point ("1000.50").
+``total_price``, ``tax``, ``gain``, ``fee``, ``wkn``, ``name`` and
+``expiry_date`` are optional; a missing total price is derived from price,
+quantity, fee and tax, a missing gain from the FIFO cost of the closed lots.
+
+    python -m utils.importer statement.csv [--batch-size 5000] [--skip-errors] [--decimal-comma]
+"""
+import csv
+import time
+from datetime import datetime
+
+from utils.db_helper import get_db, set_current_user, write_transaction
+from utils.ledger import rebuild_positions, rebuild_daily_pnl
+
+BUY_ACTIONS = ("buy", "rebuy")
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%m/%d/%Y")
+DEFAULT_BATCH_SIZE = 5000
+
+
+class ImportRowError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+
+def _parse_date(value):
+    value = (value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value[:10], fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date '{value}'")
+
+
+def _parse_number(value, default=None, decimal_comma=False):
+    value = (value or "").strip()
+    if not value:
+        if default is None:
+            raise ValueError("missing number")
+        return default
+    if decimal_comma:
+        # Dots group the thousands ("1.000" is a thousand, not one)
+        return float(value.replace(".", "").replace(",", "."))
+    return float(value.replace(",", ""))
+
+
+def _detect_delimiter(header):
+    return ";" if header.count(";") > header.count(",") else ","
+
+
+def read_rows(stream, delimiter=None, header=None):
+    """
+    Yields (line number, row dict with lower-case keys) from a CSV stream.
+    ``header`` is the header line if it was already read from the stream.
+    """
+    first = stream.readline() if header is None else header
+    if delimiter is None:
+        delimiter = _detect_delimiter(first)
+    header = [column.strip().lower() for column in next(csv.reader([first], delimiter=delimiter))]
+    for line, values in enumerate(csv.reader(stream, delimiter=delimiter), start=2):
+        if not values or not any(v.strip() for v in values):
+            continue
+        yield line, dict(zip(header, values))
+
+
+class _ImportState:
+    """
+    Master data, products, open trades and lots known to the running import.
+    Must be created inside the import's write transaction, otherwise the next
+    ids could be taken by another session.
+    """
+
+    def __init__(self, conn, decimal_comma=False):
+        self.conn = conn
+        self.decimal_comma = decimal_comma
+        self.basis = {name.lower(): id_ for id_, name in conn.execute("SELECT id, name FROM basis_products")}
+        self.types = {name.lower(): id_ for id_, name in conn.execute("SELECT id, name FROM product_types")}
+        self.directions = {name.lower(): id_ for id_, name in conn.execute("SELECT id, name FROM directions")}
+        self.currencies = {symbol.lower(): id_ for id_, symbol in conn.execute("SELECT id, symbol FROM strike_currencies")}
+        self.actions = {name.lower(): id_ for id_, name in conn.execute("SELECT id, name FROM actions")}
+        self.products = {
+            tuple(row[1:]): row[0] for row in conn.execute(
+                "SELECT id, basis_product_id, product_type_id, direction_id, strike, strike_currency_id FROM products")
+        }
+        self.open_trades = {product_id: trade_id for trade_id, product_id in conn.execute(
+            "SELECT trade_id, product_id FROM positions WHERE open_qty > 0 ORDER BY trade_id DESC")}
+        self.lots = {}
+        self.next_trade_id = (conn.execute("SELECT MAX(trade_id) FROM transactions").fetchone()[0] or -1) + 1
+        self.next_txn_id = (conn.execute("SELECT MAX(id) FROM transactions").fetchone()[0] or 0) + 1
+        self.next_product_id = (conn.execute("SELECT MAX(id) FROM products").fetchone()[0] or 0) + 1
+
+        self.new_basis = []
+        self.new_products = []
+        self.transactions = []
+        self.lot_updates = {}
+
+    def basis_id(self, name):
+        key = name.strip().lower()
+        if key not in self.basis:
+            cursor = self.conn.execute("INSERT INTO basis_products (name) VALUES (?)", (name.strip(),))
+            self.basis[key] = cursor.lastrowid
+            self.new_basis.append(name.strip())
+        return self.basis[key]
+
+    def trade_lots(self, trade_id):
+        """Open lots of a trade as [txn_id, open_qty, unit_cost] lists in FIFO order."""
+        lots = self.lots.get(trade_id)
+        if lots is None:
+            lots = [
+                [row[0], row[1], row[2] / row[3]] for row in self.conn.execute("""
+                    SELECT id, open_qty, total_price, qty
+                    FROM transactions
+                    WHERE trade_id = ? AND action_id IN (1,3) AND open_qty > 0
+                    ORDER BY date ASC, id ASC
+                """, (trade_id,))
+            ]
+            self.lots[trade_id] = lots
+        return lots
+
+
+def _lookup(mapping, value, what, line):
+    try:
+        return mapping[value.strip().lower()]
+    except (KeyError, AttributeError):
+        raise ImportRowError(line, f"unknown {what} '{value}'")
+
+
+def _process_row(state, line, row):
+    """Validates a row and appends its transaction to the state buffers."""
+    comma = state.decimal_comma
+    try:
+        txn_date = _parse_date(row.get("date"))
+        qty = _parse_number(row.get("qty"), 0.0, comma)
+        price = _parse_number(row.get("price"), 0.0, comma)
+        fee = _parse_number(row.get("fee"), 0.0, comma)
+        tax = _parse_number(row.get("tax"), 0.0, comma)
+        strike = _parse_number(row.get("strike"), None, comma)
+        total_price = _parse_number(row.get("total_price"), float("nan"), comma)
+        gain = _parse_number(row.get("gain"), float("nan"), comma)
+        expiry_date = _parse_date(row["expiry_date"]) if (row.get("expiry_date") or "").strip() else None
+    except ValueError as e:
+        raise ImportRowError(line, str(e))
+
+    action = (row.get("action") or "").strip().lower()
+    action_id = _lookup(state.actions, action, "action", line)
+    type_id = _lookup(state.types, row.get("product_type"), "product type", line)
+    direction_id = _lookup(state.directions, row.get("direction"), "direction", line)
+    currency_id = _lookup(state.currencies, row.get("currency"), "currency", line)
+    if not (row.get("underlying") or "").strip():
+        raise ImportRowError(line, "missing underlying")
+
+    basis_key = row["underlying"].strip().lower()
+    identity = (state.basis.get(basis_key), type_id, direction_id, strike, currency_id)
+    product_id = state.products.get(identity) if identity[0] is not None else None
+    trade_id = state.open_trades.get(product_id) if product_id is not None else None
+
+    if action not in BUY_ACTIONS and trade_id is None:
+        raise ImportRowError(line, f"no open position for '{action}'")
+    if action in BUY_ACTIONS and qty <= 0:
+        raise ImportRowError(line, "quantity must be positive")
+    if action == "partial sell" and not 0 < qty < sum(lot[1] for lot in state.trade_lots(trade_id)):
+        raise ImportRowError(line, "partial sell quantity must be below the open quantity")
+    if action == "redemption" and total_price != total_price:
+        raise ImportRowError(line, "missing total_price for redemption")
+
+    # Validated: from here on the state is mutated
+    if product_id is None:
+        identity = (state.basis_id(row["underlying"]), type_id, direction_id, strike, currency_id)
+        product_id = state.products.get(identity)
+    if product_id is None:
+        product_id = state.next_product_id
+        state.next_product_id += 1
+        state.products[identity] = product_id
+        state.new_products.append((product_id, *identity, (row.get("wkn") or "").strip(),
+                                   (row.get("name") or "").strip(),
+                                   expiry_date.isoformat() if expiry_date else None))
+
+    txn_id = state.next_txn_id
+    state.next_txn_id += 1
+
+    if action in BUY_ACTIONS:
+        if trade_id is None:
+            trade_id = state.next_trade_id
+            state.next_trade_id += 1
+            state.open_trades[product_id] = trade_id
+            state.lots[trade_id] = []
+        if total_price != total_price:
+            total_price = price * qty + fee
+        state.trade_lots(trade_id).append([txn_id, qty, total_price / qty])
+        open_qty = qty
+        tax = 0.0
+        gain = 0.0 if gain != gain else gain
+        price_correct = 1 if total_price == price * qty + fee else 0
+    else:
+        lots = state.trade_lots(trade_id)
+        closes_trade = action != "partial sell"
+        if action == "sell" and qty <= 0:
+            qty = sum(lot[1] for lot in lots)
+
+        remaining = sum(lot[1] for lot in lots) if closes_trade else qty
+        cost = 0.0
+        for lot in lots:
+            if remaining <= 0:
+                break
+            used = min(remaining, lot[1])
+            cost += lot[2] * used
+            lot[1] -= used
+            remaining -= used
+            state.lot_updates[lot[0]] = lot[1]
+        if closes_trade:
+            for lot in lots:
+                state.lot_updates[lot[0]] = 0
+        state.lots[trade_id] = [] if closes_trade else [lot for lot in lots if lot[1] > 0]
+        if closes_trade:
+            state.open_trades.pop(product_id, None)
+
+        if action in ("redemption", "knock-out"):
+            price, qty, fee, tax = 0.0, 0.0, 0.0, 0.0
+            total_price = 0.0 if action == "knock-out" else total_price
+            price_correct = 1
+        else:
+            expected_total = price * qty - fee - tax
+            if total_price != total_price:
+                total_price = expected_total
+            price_correct = 1 if total_price == expected_total else 0
+        gain = total_price - cost if gain != gain else gain
+        open_qty = 0 if action == "sell" else None
+
+    state.transactions.append((txn_id, trade_id, txn_date.isoformat(), product_id, price, qty, fee, tax,
+                               total_price, round(gain, 2), price_correct, action_id, open_qty))
+
+
+def _flush(state):
+    """Writes the buffered batch (inside the import's transaction)."""
+    conn = state.conn
+    if state.new_products:
+        conn.executemany("""
+            INSERT INTO products (id, basis_product_id, product_type_id, direction_id, strike,
+                                  strike_currency_id, wkn, name, expiry_date)
+            VALUES (?,?,?,?,?,?,?,?,?)
+        """, state.new_products)
+    if state.transactions:
+        conn.executemany("""
+            INSERT INTO transactions (id, trade_id, date, product_id, price, qty, fee, tax,
+                                      total_price, gain, price_correct, action_id, open_qty)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
+        """, state.transactions)
+    if state.lot_updates:
+        conn.executemany("UPDATE transactions SET open_qty = ? WHERE id = ?",
+                         [(open_qty, txn_id) for txn_id, open_qty in state.lot_updates.items()])
+    written = len(state.transactions)
+    state.new_products.clear()
+    state.transactions.clear()
+    state.lot_updates.clear()
+    return written
+
+
+def import_csv(stream, batch_size=DEFAULT_BATCH_SIZE, skip_errors=False, delimiter=None, progress=None,
+               decimal_comma=None):
+    """
+    Imports a broker statement from a text stream. Returns a dict with the
+    imported row count, skipped rows, created products/underlyings, elapsed
+    seconds and rows per second.
+
+    The import is committed once at the end. With ``skip_errors`` invalid
+    rows are reported and skipped, otherwise the first invalid row aborts the
+    import and rolls back all rows written so far. ``progress`` is called with
+    the number of written rows after every batch. ``decimal_comma`` sets the
+    number format of the file (default: decimal comma for ``;``-separated
+    files, decimal point otherwise).
+    """
+    conn = get_db()
+    if conn.in_transaction and not getattr(conn, "_unit_of_work", False):
+        conn.commit()
+    started = time.perf_counter()
+    imported = 0
+    errors = []
+    header = stream.readline()
+    delimiter = delimiter or _detect_delimiter(header)
+    if decimal_comma is None:
+        decimal_comma = delimiter == ";"
+
+    with write_transaction(conn):
+        state = _ImportState(conn, decimal_comma)
+        products_before = len(state.products)
+        for line, row in read_rows(stream, delimiter, header):
+            try:
+                _process_row(state, line, row)
+            except ImportRowError as e:
+                if not skip_errors:
+                    raise
+                errors.append(str(e))
+                continue
+            if len(state.transactions) >= batch_size:
+                imported += _flush(state)
+                if progress:
+                    progress(imported)
+        imported += _flush(state)
+        # Derived tables are rebuilt once for the whole import
+        rebuild_positions(conn)
+        rebuild_daily_pnl(conn)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": imported,
+        "skipped": len(errors),
+        "errors": errors,
+        "products_created": len(state.products) - products_before,
+        "underlyings_created": len(state.new_basis),
+        "seconds": elapsed,
+        "rows_per_second": imported / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import a broker statement (CSV) into the options tracker")
+    parser.add_argument("file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--delimiter", help="default: detected from the header (',' or ';')")
+    parser.add_argument("--skip-errors", action="store_true", help="skip invalid rows instead of aborting")
+    number_format = parser.add_mutually_exclusive_group()
+    number_format.add_argument("--decimal-comma", dest="decimal_comma", action="store_true", default=None,
+                               help="numbers like 1.000,50 (default for ';'-separated files)")
+    number_format.add_argument("--decimal-point", dest="decimal_comma", action="store_false",
+                               help="numbers like 1000.50 (default for ','-separated files)")
+    parser.add_argument("--user", default="default", help="user whose database is used")
+    args = parser.parse_args()
+    set_current_user(args.user)
+
+    with open(args.file, newline="", encoding="utf-8-sig") as stream:
+        result = import_csv(stream, args.batch_size, args.skip_errors, args.delimiter,
+                            progress=lambda rows: print(f"  {rows:,} rows ...", end="\r"),
+                            decimal_comma=args.decimal_comma)
+
+    print(" " * 40, end="\r")
+    for error in result["errors"]:
+        print(f"  skipped - {error}")
+    print(f"Imported {result['rows']:,} rows in {result['seconds']:.2f}s "
+          f"({result['rows_per_second']:,.0f} rows/s), {result['skipped']:,} skipped, "
+          f"{result['products_created']:,} new products")
+
+
+if __name__ == "__main__":
+    main()
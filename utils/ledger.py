@@ -0,0 +1,123 @@
+"""
+Derived ledger tables that are maintained alongside ``transactions``.
+
+``positions`` holds one row per open trade (trade_id) with the open quantity,
+the summed cost and the display label used by the position pickers, a copy of
+``products.label`` that a trigger keeps up to date when products or master data
+are renamed (migration 010).
+``daily_pnl`` holds one row per trading day with realised gain, trade count,
+fees, taxes and the cumulative gain up to that day.
+
+The write helpers in ``utils.db_helper`` call the ``refresh_*`` functions inside
+their own transaction; the ``rebuild_*`` functions recompute a table from scratch.
+All functions take an open connection and never commit; the tables are created
+by the schema migrations (``utils.migrations``).
+"""
+from datetime import date, datetime, timedelta
+
+POSITION_SOURCE_SQL = """
+    SELECT
+        trade_id,
+        product_id,
+        label,
+        SUM(COALESCE(open_qty,0)) AS open_qty,
+        SUM(COALESCE(total_price,0)) AS price_paid
+    FROM v_transaction_list
+    {where}
+    GROUP BY trade_id, product_id
+    HAVING SUM(open_qty) > 0
+"""
+
+
+def refresh_position(conn, trade_id):
+    """Recomputes the ledger row of a single trade (uses idx_transactions_trade)."""
+    rows = conn.execute(POSITION_SOURCE_SQL.format(where="WHERE trade_id = ?"), (trade_id,)).fetchall()
+    conn.execute("DELETE FROM positions WHERE trade_id = ?", (trade_id,))
+    if rows:
+        conn.executemany("INSERT INTO positions (trade_id, product_id, label, open_qty, price_paid) "
+                         "VALUES (?,?,?,?,?)", rows)
+
+
+def rebuild_positions(conn):
+    """Recomputes the whole ledger from ``transactions``. Returns the number of open positions."""
+    rows = conn.execute(POSITION_SOURCE_SQL.format(where="")).fetchall()
+    conn.execute("DELETE FROM positions")
+    conn.executemany("INSERT INTO positions (trade_id, product_id, label, open_qty, price_paid) "
+                     "VALUES (?,?,?,?,?)", rows)
+    return len(rows)
+
+
+def get_open_positions(conn):
+    """Open positions as (trade_id, label, open_qty, product_id, price_paid), ordered by product."""
+    return [
+        tuple(row) for row in conn.execute("""
+            SELECT trade_id, label, open_qty, product_id, price_paid
+            FROM positions
+            WHERE open_qty > 0
+            ORDER BY product_id, trade_id
+        """).fetchall()
+    ]
+
+
+DAILY_PNL_SOURCE_SQL = """
+    SELECT date(t.date) AS day,
+           SUM(COALESCE(t.gain,0)) AS gain,
+           COUNT(*) AS trade_count,
+           SUM(COALESCE(t.fee,0)) AS fees,
+           SUM(COALESCE(t.tax,0)) AS taxes
+    FROM transactions t
+    {where}
+    GROUP BY day
+"""
+
+
+def _day(value):
+    """ISO day (YYYY-MM-DD) of a date, datetime or date string."""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)[:10]
+
+
+def _update_cumulative(conn, day):
+    """Recomputes cumulative_gain for all days from ``day`` on."""
+    conn.execute("""
+        UPDATE daily_pnl
+        SET cumulative_gain = c.cumulative_gain
+        FROM (
+            SELECT date,
+                   (SELECT COALESCE(SUM(gain), 0) FROM daily_pnl WHERE date < :day)
+                   + SUM(gain) OVER (ORDER BY date) AS cumulative_gain
+            FROM daily_pnl
+            WHERE date >= :day
+        ) c
+        WHERE daily_pnl.date = c.date
+    """, {"day": day})
+
+
+def refresh_daily_pnl(conn, *days):
+    """Recomputes the rollup rows of the given days (uses idx_transactions_date)."""
+    days = sorted({_day(day) for day in days if day is not None})
+    if not days:
+        return
+    for day in days:
+        next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+        row = conn.execute(DAILY_PNL_SOURCE_SQL.format(where="WHERE t.date >= ? AND t.date < ?"),
+                           (day, next_day)).fetchone()
+        conn.execute("DELETE FROM daily_pnl WHERE date = ?", (day,))
+        if row is not None:
+            conn.execute("INSERT INTO daily_pnl (date, gain, trade_count, fees, taxes, cumulative_gain) "
+                         "VALUES (?,?,?,?,?,0)", (day, row[1], row[2], row[3], row[4]))
+    _update_cumulative(conn, days[0])
+
+
+def rebuild_daily_pnl(conn):
+    """Recomputes the whole daily rollup from ``transactions``. Returns the number of days."""
+    conn.execute("DELETE FROM daily_pnl")
+    conn.execute(f"""
+        INSERT INTO daily_pnl (date, gain, trade_count, fees, taxes, cumulative_gain)
+        SELECT day, gain, trade_count, fees, taxes, SUM(gain) OVER (ORDER BY day)
+        FROM ({DAILY_PNL_SOURCE_SQL.format(where="WHERE t.date IS NOT NULL")})
+    """)
+    return conn.execute("SELECT COUNT(*) FROM daily_pnl").fetchone()[0]
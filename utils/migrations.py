@@ -0,0 +1,525 @@
+"""
+Versioned schema migrations for the options tracker database.
+
+Each migration is a ``(version, name, function)`` tuple in ``MIGRATIONS``. The
+function receives an open connection and runs inside the transaction opened by
+``migrate``; the applied versions are recorded in the ``schema_version`` table.
+New steps are appended with the next version number, existing steps are never
+edited once released. Steps therefore contain their own SQL and do not call
+runtime code (e.g. ``utils.ledger``), whose later changes would change what an
+old step does.
+"""
+import sqlite3
+from datetime import datetime
+
+BASE_TABLES = ("transactions", "products")
+
+
+DUPLICATE_PRODUCTS_SQL = """
+    SELECT p.id, keep.id
+    FROM products p
+    JOIN (
+        SELECT MIN(id) AS id, basis_product_id, product_type_id, direction_id, strike, strike_currency_id
+        FROM products
+        GROUP BY basis_product_id, product_type_id, direction_id, strike, strike_currency_id
+        HAVING COUNT(*) > 1
+    ) keep ON p.basis_product_id = keep.basis_product_id
+          AND p.product_type_id = keep.product_type_id
+          AND p.direction_id = keep.direction_id
+          AND p.strike = keep.strike
+          AND p.strike_currency_id = keep.strike_currency_id
+    WHERE p.id <> keep.id
+    ORDER BY p.id
+"""
+
+
+class DuplicateProductsError(sqlite3.IntegrityError):
+    """Products with the same identity block the unique index of migration 001."""
+
+    def __init__(self, duplicates):
+        self.duplicates = duplicates
+        listed = ", ".join(f"{dup_id} (= {keep_id})" for dup_id, keep_id in duplicates)
+        super().__init__(
+            f"{len(duplicates)} duplicate product(s) block the schema migration: {listed}. "
+            "Run 'python init_db.py merge-duplicates' to merge them into the oldest product "
+            "(a backup of the database is written first)."
+        )
+
+
+def find_duplicate_products(conn):
+    """Duplicate products as (product_id, id of the oldest product with the same identity)."""
+    return [tuple(row) for row in conn.execute(DUPLICATE_PRODUCTS_SQL)]
+
+
+def merge_duplicate_products(conn):
+    """
+    Points the transactions of duplicate products to the oldest product with the
+    same identity and deletes the duplicates, in the caller's transaction.
+    Returns the merges as (product_id, kept_id, moved transactions).
+    """
+    merges = []
+    for dup_id, keep_id in find_duplicate_products(conn):
+        moved = conn.execute("UPDATE transactions SET product_id = ? WHERE product_id = ?", (keep_id, dup_id)).rowcount
+        conn.execute("DELETE FROM products WHERE id = ?", (dup_id,))
+        merges.append((dup_id, keep_id, moved))
+    return merges
+
+
+# Display label of a product ("Long@100.0€ DAX"), kept in products.label
+LABEL_SQL = """
+    (SELECT d.name || '@' || CAST(products.strike AS TEXT) || sc.symbol || ' ' || bp.name
+     FROM directions d, strike_currencies sc, basis_products bp
+     WHERE d.id = products.direction_id
+       AND sc.id = products.strike_currency_id
+       AND bp.id = products.basis_product_id)
+"""
+
+
+def _m001_core_indexes(conn):
+    """Indexes for the FIFO lookups, trade grouping, date ranges and product identity."""
+    # Duplicate products (possible before the unique index existed) are not merged
+    # silently: ``init_db.py merge-duplicates`` backs up the database and merges them.
+    duplicates = find_duplicate_products(conn)
+    if duplicates:
+        raise DuplicateProductsError(duplicates)
+
+    # Trade grouping and FIFO lot order (trade_id, date, id)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_trade ON transactions (trade_id, date, id)")
+    # Open lots per product (buy_helper.get_or_create_trade_id)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_open_product
+        ON transactions (product_id, date) WHERE open_qty > 0
+    """)
+    # Date range filters on the overview
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)")
+    # Product identity (buy_helper.get_or_create_product_id)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_products_identity
+        ON products (basis_product_id, product_type_id, direction_id, strike, strike_currency_id)
+    """)
+
+
+def _m002_positions_ledger(conn):
+    """Ledger of open positions per trade, filled from the existing history."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS positions (
+            trade_id INTEGER PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            open_qty INTEGER NOT NULL,
+            price_paid REAL NOT NULL,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_positions_product ON positions (product_id, trade_id)")
+    conn.execute("DELETE FROM positions")
+    conn.execute(f"""
+        INSERT INTO positions (trade_id, product_id, label, open_qty, price_paid)
+        SELECT t.trade_id,
+               t.product_id,
+               {LABEL_SQL},
+               SUM(COALESCE(t.open_qty,0)),
+               SUM(COALESCE(t.total_price,0))
+        FROM transactions t
+        JOIN products ON products.id = t.product_id
+        GROUP BY t.trade_id, t.product_id
+        HAVING SUM(t.open_qty) > 0
+    """)
+
+
+def _m003_tax_checkpoints(conn):
+    """Yearly start states for the tax replay (utils.tax_replay)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tax_checkpoints (
+            year INTEGER PRIMARY KEY,
+            loss_carryforward REAL NOT NULL,
+            tax_allowance REAL NOT NULL,
+            annual_allowance REAL NOT NULL,
+            tax_rate REAL NOT NULL
+        )
+    """)
+
+
+def _m004_daily_pnl(conn):
+    """Daily P&L rollup for the equity curve and the calendar, filled from the history."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_pnl (
+            date TEXT PRIMARY KEY,
+            gain REAL NOT NULL,
+            trade_count INTEGER NOT NULL,
+            fees REAL NOT NULL,
+            taxes REAL NOT NULL,
+            cumulative_gain REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("DELETE FROM daily_pnl")
+    conn.execute("""
+        INSERT INTO daily_pnl (date, gain, trade_count, fees, taxes, cumulative_gain)
+        SELECT day, gain, trade_count, fees, taxes, SUM(gain) OVER (ORDER BY day)
+        FROM (
+            SELECT date(t.date) AS day,
+                   SUM(COALESCE(t.gain,0)) AS gain,
+                   COUNT(*) AS trade_count,
+                   SUM(COALESCE(t.fee,0)) AS fees,
+                   SUM(COALESCE(t.tax,0)) AS taxes
+            FROM transactions t
+            WHERE t.date IS NOT NULL
+            GROUP BY day
+        )
+    """)
+
+
+def _m005_settings_version(conn):
+    """Version stamp of the settings row, increased by every write (utils.settings_store)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(settings)")}
+    if not columns:
+        # Created with the column by settings_store.init_settings_table
+        return
+    if "theme_mode" not in columns:
+        conn.execute("ALTER TABLE settings ADD COLUMN theme_mode TEXT DEFAULT 'Dark'")
+    if "version" not in columns:
+        conn.execute("ALTER TABLE settings ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+
+# Tables whose changes can affect any row of the transaction frame
+FRAME_SOURCE_TABLES = ("products", "basis_products", "product_types", "directions", "strike_currencies", "actions")
+
+
+def _m006_data_version(conn):
+    """Persistent change counters and the log of updated transactions (utils.frame_snapshot)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # generation identifies the database file, so snapshots of a replaced database are not reused
+    conn.execute("""
+        INSERT OR IGNORE INTO data_version (name, version)
+        VALUES ('generation', abs(random())), ('rewrite', 0), ('changes', 0)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transaction_changes (
+            id INTEGER PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transaction_changes_seq ON transaction_changes (seq)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_update AFTER UPDATE ON transactions
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE name = 'changes';
+            INSERT OR REPLACE INTO transaction_changes (id, seq)
+            VALUES (NEW.id, (SELECT version FROM data_version WHERE name = 'changes'));
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_delete AFTER DELETE ON transactions
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE name = 'rewrite';
+        END
+    """)
+    for table in FRAME_SOURCE_TABLES:
+        for event in ("UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE name = 'rewrite';
+                END
+            """)
+
+
+# The lookup tables are LEFT JOINed on their primary keys, so SQLite skips those a
+# plain SELECT neither reads nor filters on. products stays an inner join (the
+# product of a transaction is mandatory), which lets the planner start from
+# products when a query filters on product columns.
+PRODUCTS_VIEW_SQL = """
+    CREATE VIEW IF NOT EXISTS v_products AS
+    SELECT p.id AS product_id,
+           p.label,
+           p.name AS product_name,
+           p.wkn,
+           p.strike,
+           p.expiry_date,
+           p.basis_product_id,
+           bp.name AS basis_product,
+           p.product_type_id,
+           pt.name AS product_type,
+           p.direction_id,
+           d.name AS direction,
+           p.strike_currency_id,
+           sc.symbol AS strike_currency
+    FROM products p
+    LEFT JOIN basis_products bp ON bp.id = p.basis_product_id
+    LEFT JOIN product_types pt ON pt.id = p.product_type_id
+    LEFT JOIN directions d ON d.id = p.direction_id
+    LEFT JOIN strike_currencies sc ON sc.id = p.strike_currency_id
+"""
+
+TRANSACTIONS_VIEW_SQL = """
+    CREATE VIEW IF NOT EXISTS v_transactions AS
+    SELECT t.id AS transaction_id,
+           t.trade_id,
+           t.date,
+           t.price,
+           t.qty,
+           t.fee,
+           t.tax,
+           t.total_price,
+           t.gain,
+           t.open_qty,
+           t.price_correct,
+           t.action_id,
+           a.name AS action,
+           t.product_id,
+           p.label,
+           p.name AS product_name,
+           p.wkn,
+           p.strike,
+           p.expiry_date,
+           p.basis_product_id,
+           bp.name AS basis_product,
+           p.product_type_id,
+           pt.name AS product_type,
+           p.direction_id,
+           d.name AS direction,
+           p.strike_currency_id,
+           sc.symbol AS strike_currency
+    FROM transactions t
+    LEFT JOIN actions a ON a.id = t.action_id
+    JOIN products p ON p.id = t.product_id
+    LEFT JOIN basis_products bp ON bp.id = p.basis_product_id
+    LEFT JOIN product_types pt ON pt.id = p.product_type_id
+    LEFT JOIN directions d ON d.id = p.direction_id
+    LEFT JOIN strike_currencies sc ON sc.id = p.strike_currency_id
+"""
+
+# Projection for the transaction lists (recent transactions, transaction browser):
+# only the tables the lists show, also for aggregates where no join is dropped
+TRANSACTION_LIST_VIEW_SQL = """
+    CREATE VIEW IF NOT EXISTS v_transaction_list AS
+    SELECT t.id AS transaction_id,
+           t.trade_id,
+           t.date,
+           t.price,
+           t.qty,
+           t.fee,
+           t.tax,
+           t.total_price,
+           t.gain,
+           t.open_qty,
+           t.action_id,
+           a.name AS action,
+           t.product_id,
+           p.label,
+           p.basis_product_id,
+           p.product_type_id
+    FROM transactions t
+    LEFT JOIN actions a ON a.id = t.action_id
+    JOIN products p ON p.id = t.product_id
+"""
+
+
+def _m007_product_views(conn):
+    """Denormalised product label maintained by triggers, shared views v_products, v_transactions and v_transaction_list."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(products)")}
+    if "label" not in columns:
+        conn.execute("ALTER TABLE products ADD COLUMN label TEXT")
+
+    # The label is derived data: writing it must not invalidate the frame snapshots
+    conn.execute("DROP TRIGGER IF EXISTS trg_products_update")
+    conn.execute("""
+        CREATE TRIGGER trg_products_update
+        AFTER UPDATE OF basis_product_id, product_type_id, direction_id, strike, strike_currency_id, wkn, name,
+                        expiry_date ON products
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE name = 'rewrite';
+        END
+    """)
+
+    label_triggers = [
+        ("trg_products_label_insert", "AFTER INSERT ON products", "id = NEW.id"),
+        ("trg_products_label_update",
+         "AFTER UPDATE OF basis_product_id, direction_id, strike, strike_currency_id ON products", "id = NEW.id"),
+        ("trg_basis_products_label", "AFTER UPDATE OF name ON basis_products", "basis_product_id = NEW.id"),
+        ("trg_directions_label", "AFTER UPDATE OF name ON directions", "direction_id = NEW.id"),
+        ("trg_strike_currencies_label", "AFTER UPDATE OF symbol ON strike_currencies", "strike_currency_id = NEW.id"),
+    ]
+    for name, event, condition in label_triggers:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                UPDATE products SET label = {LABEL_SQL} WHERE {condition};
+            END
+        """)
+    conn.execute(f"UPDATE products SET label = {LABEL_SQL}")
+
+    # Filters on underlying / product type start from products and reach the
+    # transactions through a covering index instead of scanning the history
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_products_basis ON products (basis_product_id, product_type_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_product ON transactions (product_id, date, id)")
+
+    conn.execute(PRODUCTS_VIEW_SQL)
+    conn.execute(TRANSACTIONS_VIEW_SQL)
+    conn.execute(TRANSACTION_LIST_VIEW_SQL)
+
+
+def _m008_quotes(conn):
+    """Local price store for the mark-to-market valuation (utils.valuation)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS quotes (
+            wkn TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            price REAL NOT NULL,
+            previous_close REAL,
+            PRIMARY KEY (wkn, ts)
+        ) WITHOUT ROWID
+    """)
+    # Own counter: new quotes invalidate the valuation, not the transaction snapshots
+    conn.execute("INSERT OR IGNORE INTO data_version (name, version) VALUES ('quotes', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_quotes_{event.lower()} AFTER {event} ON quotes
+            BEGIN
+                UPDATE data_version SET version = version + 1 WHERE name = 'quotes';
+            END
+        """)
+
+
+def _m009_product_ratio(conn):
+    """Ratio (Bezugsverhältnis) of warrants for the pricing in utils.pricing; NULL counts as 1."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(products)")}
+    if "ratio" not in columns:
+        conn.execute("ALTER TABLE products ADD COLUMN ratio REAL")
+
+
+def _m010_position_labels(conn):
+    """Keeps positions.label in step with products.label (renamed master data, edited products)."""
+    # products.label is refreshed by the label triggers of migration 007, which fire this one
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_positions_label AFTER UPDATE OF label ON products
+        BEGIN
+            UPDATE positions SET label = NEW.label WHERE product_id = NEW.id;
+        END
+    """)
+    conn.execute("UPDATE positions SET label = (SELECT label FROM products WHERE id = positions.product_id)")
+
+
+def _m011_spot_quotes(conn):
+    """
+    Spot prices of the underlyings (utils.pricing), kept apart from the product
+    quotes so an underlying cannot collide with a product whose WKN is its name.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS spot_quotes (
+            underlying TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            price REAL NOT NULL,
+            previous_close REAL,
+            PRIMARY KEY (underlying, ts)
+        ) WITHOUT ROWID
+    """)
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_spot_quotes_{event.lower()} AFTER {event} ON spot_quotes
+            BEGIN
+                UPDATE data_version SET version = version + 1 WHERE name = 'quotes';
+            END
+        """)
+    # Spot prices were stored in quotes under the underlying's name: copy those that
+    # are no product's WKN (the rows stay in quotes, where they are no longer read)
+    conn.execute("""
+        INSERT OR IGNORE INTO spot_quotes (underlying, ts, price, previous_close)
+        SELECT q.wkn, q.ts, q.price, q.previous_close
+        FROM quotes q
+        WHERE q.wkn IN (SELECT UPPER(name) FROM basis_products)
+          AND q.wkn NOT IN (SELECT UPPER(wkn) FROM products WHERE wkn IS NOT NULL)
+    """)
+
+
+MIGRATIONS = [
+    (1, "core_indexes", _m001_core_indexes),
+    (2, "positions_ledger", _m002_positions_ledger),
+    (3, "tax_checkpoints", _m003_tax_checkpoints),
+    (4, "daily_pnl", _m004_daily_pnl),
+    (5, "settings_version", _m005_settings_version),
+    (6, "data_version", _m006_data_version),
+    (7, "product_views", _m007_product_views),
+    (8, "quotes", _m008_quotes),
+    (9, "product_ratio", _m009_product_ratio),
+    (10, "position_labels", _m010_position_labels),
+    (11, "spot_quotes", _m011_spot_quotes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+
+
+def get_schema_version(conn):
+    """Highest applied migration version, 0 for a database without migrations."""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def has_base_tables(conn):
+    rows = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ({','.join('?' * len(BASE_TABLES))})",
+        BASE_TABLES
+    ).fetchone()
+    return rows[0] == len(BASE_TABLES)
+
+
+def pending_migrations(conn):
+    current = get_schema_version(conn)
+    return [m for m in MIGRATIONS if m[0] > current]
+
+
+def migrate(conn, target=None, verbose=False):
+    """
+    Applies all pending migrations up to ``target`` (default: latest) and runs
+    ANALYZE afterwards. Every migration runs in its own transaction, so a failing
+    step leaves the database at the previous version. Returns the applied versions.
+    """
+    if not has_base_tables(conn):
+        return []
+
+    applied = []
+    for version, name, step in pending_migrations(conn):
+        if target is not None and version > target:
+            break
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ensure_version_table(conn)
+            # Another process may have applied the step while we were waiting for the lock
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                         (version, name, datetime.now().isoformat(timespec="seconds")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"  ✓ Migration {version:03d} {name}")
+
+    if applied:
+        conn.execute("ANALYZE")
+        conn.commit()
+    return applied
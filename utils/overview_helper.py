@@ -1,70 +1,153 @@
-import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
+import numpy as np
 import calendar
-from utils.db_helper import get_db
+import threading
+from utils.db_helper import get_db, get_db_path, get_data_version
+from utils.frame_snapshot import load_frame
 from datetime import datetime, timedelta
 
+# Process-wide cache of the joined transaction frame per database file, shared by all sessions.
+# _cache_lock guards the dictionaries; a load holds the lock of its database file only, so
+# users with their own databases do not wait for each other.
+_cache_lock = threading.Lock()
+_load_locks = {}
+_data_cache = {}
+_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _load_lock(path):
+    with _cache_lock:
+        lock = _load_locks.get(path)
+        if lock is None:
+            lock = _load_locks[path] = threading.Lock()
+        return lock
+
 
 def load_data():
+    """
+    Returns the joined transaction frame of the current user's database. The
+    frame is cached process-wide per database file and keyed by its data version, so reruns without writes are served from
+    memory; after a restart or a write it comes from the columnar snapshot of
+    utils.frame_snapshot, which only queries new and changed rows. Callers get a
+    shallow copy and must not modify columns in place.
+    """
+    path = get_db_path()
+    version = get_data_version()
+    with _load_lock(path):
+        with _cache_lock:
+            cached = _data_cache.get(path)
+            if cached is not None and cached[0] == version:
+                _cache_stats["hits"] += 1
+                return cached[1].copy(deep=False)
+            _cache_stats["misses"] += 1
+
+        df = load_frame(_query_data, 'transaction_id', ['date', 'transaction_id'])
+        with _cache_lock:
+            _data_cache[path] = (version, df)
+        return df.copy(deep=False)
+
+
+def invalidate_data_cache():
+    """Drops the cached transaction frames; the next load_data() queries the database."""
+    with _cache_lock:
+        _data_cache.clear()
+        _cache_stats["invalidations"] += 1
+
+
+def get_data_cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats, databases=len(_data_cache),
+                    rows=sum(len(df) for _, df in _data_cache.values()))
+
+
+def _query_data(where="1=1", params=()):
     conn = get_db()
 
-    # Main query for transaction data with joins
+    # Main query over the denormalised transaction view (migration 007)
     query = """
     SELECT 
-        t.id as transaction_id,
-        t.trade_id AS "Trade ID",
-        t.date,
-        t.price,
-        t.qty,
-        t.fee,
-        t.tax,
-        t.total_price,
-        t.gain,
-        t.open_qty AS open_qty,
-        p.name as product_name,
-        p.wkn,
-        p.strike,
-        p.expiry_date,
-        bp.name as basis_product,
-        pt.name as product_type,
-        d.name as direction,
-        sc.symbol as strike_currency,
-        a.name as action,
-        d.name || '@' || CAST(p.strike AS TEXT) || sc.symbol || ' ' || bp.name AS name
-    FROM transactions t
-    JOIN products p ON t.product_id = p.id
-    JOIN basis_products bp ON p.basis_product_id = bp.id
-    JOIN product_types pt ON p.product_type_id = pt.id
-    JOIN directions d ON p.direction_id = d.id
-    JOIN strike_currencies sc ON p.strike_currency_id = sc.id
-    JOIN actions a ON t.action_id = a.id
-    ORDER BY t.date DESC
+        transaction_id,
+        trade_id AS "Trade ID",
+        date,
+        price,
+        qty,
+        fee,
+        tax,
+        total_price,
+        gain,
+        open_qty,
+        product_name,
+        wkn,
+        strike,
+        expiry_date,
+        basis_product,
+        product_type,
+        direction,
+        strike_currency,
+        action,
+        label AS name
+    FROM v_transactions
+    WHERE {where}
+    ORDER BY date DESC, transaction_id
     """
 
-    df = pd.read_sql_query(query, conn)
+    df = pd.read_sql_query(query.format(where=where), conn, params=params)
     df['date'] = pd.to_datetime(df['date'])
     return df
 
+def load_daily_pnl(start=None, end=None):
+    """
+    Reads the daily P&L rollup (date, gain, trade_count, fees, taxes,
+    cumulative_gain) for ``start <= date < end`` with an indexed range query.
+    """
+    conn = get_db()
+    query = "SELECT date, gain, trade_count, fees, taxes, cumulative_gain FROM daily_pnl WHERE date >= ?"
+    params = [start.isoformat() if start else "0000-00-00"]
+    if end is not None:
+        query += " AND date < ?"
+        params.append(end.isoformat())
+    daily = pd.read_sql_query(query + " ORDER BY date", conn, params=params)
+    daily['date'] = pd.to_datetime(daily['date'])
+    return daily
+
+
+def aggregate_daily(df):
+    """Daily gain and trade count computed from a transaction frame (same columns as daily_pnl)."""
+    daily = df.groupby(df['date'].dt.normalize()).agg(gain=('gain', 'sum'), trade_count=('gain', 'size'))
+    return daily.reset_index()
+
+
 def calculate_open_positions(df):
     """
     Calculates open positions based on purchases and sales
+
+    Buys and rebuys count positive, all other actions negative. A group that
+    contains a missing value stays missing (and is therefore not open), exactly
+    like a plain Python sum over the group would behave.
     """
     if df.empty:
         return pd.DataFrame()
 
-    # Group by trade_id and calculate net positions
-    position_data = df.groupby(['Trade ID','name']).agg({
-        'open_qty': lambda x: sum(val if action == 'buy' or action == 'rebuy' else -val for val, action in zip(x, df.loc[x.index, 'action'])),
-        'total_price': lambda x: sum(
-            val if action == 'buy' or action=='rebuy' else -val for val, action in zip(x, df.loc[x.index, 'action']))
+    keys = ['Trade ID', 'name']
+    sign = np.where(df['action'].isin(['buy', 'rebuy']).to_numpy(), 1, -1)
+    signed = pd.DataFrame({
+        'Trade ID': df['Trade ID'].to_numpy(),
+        'name': df['name'].to_numpy(),
+        'open_qty': df['open_qty'].to_numpy() * sign,
+        'total_price': df['total_price'].to_numpy() * sign,
     })
 
+    # Group by trade_id and calculate net positions in a single pass
+    grouped = signed.groupby(keys)
+    position_data = grouped[['open_qty', 'total_price']].sum()
+    has_missing = signed[['open_qty', 'total_price']].isna().groupby([signed['Trade ID'], signed['name']]).any()
+    if has_missing.to_numpy().any():
+        position_data = position_data.mask(has_missing)
+
     position_data = position_data.reset_index(level='name')
 
     # Only positions with quantity > 0 (open positions)
     open_positions = position_data[position_data['open_qty'] > 0]
-    print(open_positions)
 
     return open_positions
 
@@ -104,260 +187,110 @@ def calculate_portfolio_metrics(df):
         'avg_gain_per_trade': avg_gain_per_trade
     }
 
-def create_monthly_calendar_view(df, year, month):
-    """Creates a real calendar view for a specific month with dark mode"""
-    if df.empty:
-        return None
+CALENDAR_THEMES = {
+    'dark': {
+        'positive': 'rgba(76, 175, 80, 0.9)',
+        'negative': 'rgba(244, 67, 54, 0.9)',
+        'neutral': 'rgba(60, 60, 60, 0.8)',
+        'text': '#E0E0E0',
+        'background': 'rgba(30, 30, 30, 1)',
+    },
+    'light': {
+        'positive': 'rgba(56, 142, 60, 0.85)',
+        'negative': 'rgba(211, 47, 47, 0.85)',
+        'neutral': 'rgba(240, 240, 240, 0.8)',
+        'text': 'black',
+        'background': 'rgba(255, 255, 255, 1)',
+    },
+}
+
+DEFAULT_WEEKDAYS = ['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So']
+
+
+def calendar_grid(daily, year, month):
+    """
+    Day grid of a month as NumPy arrays (weeks x 7): day numbers (0 outside the
+    month), daily P&L and trade count. ``daily`` has one row per day with the
+    columns date, gain and trade_count (see load_daily_pnl).
+    """
+    days = np.array(calendar.monthcalendar(year, month))
 
-    # Filter data for the selected month
     month_start = datetime(year, month, 1)
-    if month == 12:
-        month_end = datetime(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        month_end = datetime(year, month + 1, 1) - timedelta(days=1)
-
-    month_df = df[(df['date'] >= month_start) & (df['date'] <= month_end)]
-
-    # Daily aggregation for the month
-    daily_data = month_df.groupby(month_df['date'].dt.date).agg({
-        'gain': 'sum',
-        'transaction_id': 'count'
-    }).reset_index()
-    daily_data.columns = ['date', 'daily_pnl', 'trade_count']
-
-    # Create dictionary for quick access
-    daily_dict = {}
-    for _, row in daily_data.iterrows():
-        daily_dict[row['date']] = {
-            'pnl': row['daily_pnl'],
-            'trades': row['trade_count']
-        }
+    month_end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    month_daily = daily[(daily['date'] >= month_start) & (daily['date'] < month_end)]
 
-    # Create calendar
-    cal = calendar.monthcalendar(year, month)
-    month_name = calendar.month_name[month]
-
-    # Create Plotly Figure with Dark Mode Theme
-    fig = go.Figure()
-
-    # Weekdays Header
-    weekdays = ['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So']
-
-    for week_num, week in enumerate(cal):
-        for day_num, day in enumerate(week):
-            if day == 0:
-                continue
-
-            day_date = datetime(year, month, day).date()
-            day_data = daily_dict.get(day_date, {'pnl': 0, 'trades': 0})
-
-            # Determine color based on P&L (dark mode optimized)
-            if day_data['pnl'] > 0:
-                color = 'rgba(76, 175, 80, 0.9)'  # Green
-                text_color = 'white'
-            elif day_data['pnl'] < 0:
-                color = 'rgba(244, 67, 54, 0.9)'  # Red
-                text_color = 'white'
-            else:
-                color = 'rgba(60, 60, 60, 0.8)'  # Dark gray for dark mode
-                text_color = '#E0E0E0'
-
-            # Larger rectangles for better display
-            fig.add_shape(
-                type="rect",
-                x0=day_num * 1.2, y0=-(week_num + 1) * 1.5, x1=day_num * 1.2 + 1.1, y1=-(week_num + 0.1) * 1.5,
-                fillcolor=color,
-                line=dict(color="rgba(255,255,255,0.3)", width=1)
-            )
-
-            # Tag number - larger and better positioned
-            fig.add_annotation(
-                x=day_num * 1.2 + 0.55, y=-(week_num + 0.15) * 1.5,
-                text=f"<b>{day}</b>",
-                showarrow=False,
-                font=dict(size=16, color=text_color),
-                xanchor="center", yanchor="top"
-            )
-
-            # Display P&L and trades (if available) - better positioning
-            if day_data['trades'] > 0:
-                # P&L in larger font
-                fig.add_annotation(
-                    x=day_num * 1.2 + 0.55, y=-(week_num + 0.5) * 1.5,
-                    text=f"<b>€{day_data['pnl']:.0f}</b>",
-                    showarrow=False,
-                    font=dict(size=20, color=text_color),
-                    xanchor="center", yanchor="middle"
-                )
-
-                # Trade Count in smaller font
-                fig.add_annotation(
-                    x=day_num * 1.2 + 0.55, y=-(week_num + 0.8) * 1.5,
-                    text=f"{day_data['trades']} T",
-                    showarrow=False,
-                    font=dict(size=15, color=text_color),
-                    xanchor="center", yanchor="bottom"
-                )
-
-    # Add weekday header - customized positioning
-    for i, weekday in enumerate(weekdays):
-        fig.add_annotation(
-            x=i * 1.2 + 0.55, y=0.4,
-            text=f"<b>{weekday}</b>",
-            showarrow=False,
-            font=dict(size=14, color="#E0E0E0"),
-            xanchor="center", yanchor="bottom"
-        )
-
-    # Configure layout - Dark Mode Theme
-    fig.update_layout(
-        title={
-            'text': f"Trading Kalender - {month_name} {year}",
-            'font': {'color': '#E0E0E0', 'size': 18}
-        },
-        xaxis=dict(
-            range=[-0.2, 8.5],
-            showgrid=False,
-            showticklabels=False,
-            zeroline=False
-        ),
-        yaxis=dict(
-            range=[-(len(cal) + 0.5) * 1.5, 0.6],
-            showgrid=False,
-            showticklabels=False,
-            zeroline=False
-        ),
-        height=800,
-        plot_bgcolor='rgba(30, 30, 30, 1)',  # Dark background
-        paper_bgcolor='rgba(30, 30, 30, 1)',  # Dark paper background
-        showlegend=False,
-        margin=dict(l=20, r=20, t=60, b=20)
-    )
-
-    return fig
+    day_of_month = month_daily['date'].dt.day.to_numpy()
+    pnl = np.bincount(day_of_month, weights=month_daily['gain'].fillna(0).to_numpy(), minlength=32)
+    trades = np.bincount(day_of_month, weights=month_daily['trade_count'].to_numpy(), minlength=32).astype(int)
 
-def create_monthly_calendar_view_test(df, year, month):
-    """Creates a real calendar view for a specific month with auto theme (light/dark)"""
-    mode = st.session_state.get("theme_mode")
-    if df.empty:
-        return None
+    return days, pnl[days], trades[days]
 
-    # Filter data for the selected month
-    month_start = datetime(year, month, 1)
-    month_end = datetime(year + 1, 1, 1) - timedelta(days=1) if month == 12 else datetime(year, month + 1, 1) - timedelta(days=1)
-    month_df = df[(df['date'] >= month_start) & (df['date'] <= month_end)]
-
-    # Daily aggregation for the month
-    daily_data = month_df.groupby(month_df['date'].dt.date).agg({
-        'gain': 'sum',
-        'transaction_id': 'count'
-    }).reset_index()
-    daily_data.columns = ['date', 'daily_pnl', 'trade_count']
-
-    # Create dictionary for quick access
-    daily_dict = {
-        row['date']: {
-            'pnl': row['daily_pnl'],
-            'trades': row['trade_count']
-        }
-        for _, row in daily_data.iterrows()
-    }
 
-    # Farben je nach Modus
-    if mode == 'dark':
-        pos_color = 'rgba(76, 175, 80, 0.9)'
-        neg_color = 'rgba(244, 67, 54, 0.9)'
-        neutral_color = 'rgba(60, 60, 60, 0.8)'
-        text_color = 'white'
-        template = 'plotly_dark'
-        bg_color = 'rgba(0,0,0,0)'
-    else:
-        pos_color = 'rgba(56, 142, 60, 0.85)'
-        neg_color = 'rgba(211, 47, 47, 0.85)'
-        neutral_color = 'rgba(240, 240, 240, 0.8)'
-        text_color = 'black'
-        template = 'plotly_white'
-        bg_color = 'rgba(255,255,255,1)'
-
-    cal = calendar.monthcalendar(year, month)
-    month_name = calendar.month_name[month]
-    fig = go.Figure(layout_template=template)
-
-    weekdays = ['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So']
-
-    for week_num, week in enumerate(cal):
-        for day_num, day in enumerate(week):
-            if day == 0:
-                continue
-
-            day_date = datetime(year, month, day).date()
-            day_data = daily_dict.get(day_date, {'pnl': 0, 'trades': 0})
-
-            color = pos_color if day_data['pnl'] > 0 else neg_color if day_data['pnl'] < 0 else neutral_color
-
-            fig.add_shape(
-                type="rect",
-                x0=day_num * 1.2, y0=-(week_num + 1) * 1.5,
-                x1=day_num * 1.2 + 1.1, y1=-(week_num + 0.1) * 1.5,
-                fillcolor=color,
-                line=dict(width=1, color='rgba(100,100,100,0.3)')
-            )
-
-            fig.add_annotation(
-                x=day_num * 1.2 + 0.55, y=-(week_num + 0.15) * 1.5,
-                text=f"<b>{day}</b>",
-                showarrow=False,
-                font=dict(size=16, color=text_color),
-                xanchor="center", yanchor="top"
-            )
-
-            if day_data['trades'] > 0:
-                fig.add_annotation(
-                    x=day_num * 1.2 + 0.55, y=-(week_num + 0.5) * 1.5,
-                    text=f"<b>€{day_data['pnl']:.0f}</b>",
-                    showarrow=False,
-                    font=dict(size=20, color=text_color),
-                    xanchor="center", yanchor="middle"
-                )
-                fig.add_annotation(
-                    x=day_num * 1.2 + 0.55, y=-(week_num + 0.8) * 1.5,
-                    text=f"{day_data['trades']} T",
-                    showarrow=False,
-                    font=dict(size=15, color=text_color),
-                    xanchor="center", yanchor="bottom"
-                )
-
-    for i, weekday in enumerate(weekdays):
-        fig.add_annotation(
-            x=i * 1.2 + 0.55, y=0.4,
-            text=f"<b>{weekday}</b>",
-            showarrow=False,
-            font=dict(size=14, color=text_color),
-            xanchor="center", yanchor="bottom"
-        )
+def create_monthly_calendar_view(daily, year, month, weekdays=None, theme='dark', title=None, height=760):
+    """
+    Creates a calendar view for a specific month as a single heatmap trace:
+    one cell per day, colored by the sign of the daily P&L, with the day number,
+    P&L and trade count as cell text. ``daily`` is the daily P&L rollup.
+    """
+    if daily is None:
+        return None
+    # plotly is only needed once a figure is built
+    import plotly.graph_objects as go
+
+    colors = CALENDAR_THEMES.get(str(theme).lower(), CALENDAR_THEMES['dark'])
+    weekdays = weekdays or DEFAULT_WEEKDAYS
+    days, pnl, trades = calendar_grid(daily, year, month)
+    in_month = days > 0
+
+    # -1 loss, 0 no result, 1 profit; days outside the month stay empty
+    z = np.where(in_month, np.sign(pnl), np.nan)
+    text = [
+        [
+            (f"<b>{day}</b><br><br><b>€{day_pnl:.0f}</b><br>{day_trades} T" if day_trades else f"<b>{day}</b><br><br><br>")
+            if day else ""
+            for day, day_pnl, day_trades in zip(week_days, week_pnl, week_trades)
+        ]
+        for week_days, week_pnl, week_trades in zip(days.tolist(), pnl.tolist(), trades.tolist())
+    ]
+
+    fig = go.Figure(go.Heatmap(
+        z=z,
+        x=list(range(7)),
+        y=list(range(len(days))),
+        customdata=np.dstack([days, pnl, trades]),
+        text=text,
+        texttemplate="%{text}",
+        textfont=dict(size=16, color=colors['text']),
+        hovertemplate="%{customdata[0]:.0f}: €%{customdata[1]:,.2f} · %{customdata[2]:.0f} T<extra></extra>",
+        colorscale=[[0, colors['negative']], [0.5, colors['neutral']], [1, colors['positive']]],
+        zmin=-1, zmax=1,
+        showscale=False,
+        xgap=6, ygap=6,
+        hoverongaps=False,
+    ))
 
     fig.update_layout(
-        title={
-            'text': f"Trading Kalender - {month_name} {year}",
-            'font': {'color': text_color, 'size': 18}
-        },
+        title={'text': title, 'font': {'color': colors['text'], 'size': 18}} if title else None,
         xaxis=dict(
-            range=[-0.2, 8.5],
+            side='top',
+            tickmode='array',
+            tickvals=list(range(7)),
+            ticktext=[f"<b>{weekday}</b>" for weekday in weekdays],
+            tickfont=dict(size=14, color=colors['text']),
             showgrid=False,
-            showticklabels=False,
             zeroline=False
         ),
         yaxis=dict(
-            range=[-(len(cal) + 0.5) * 1.5, 0.6],
+            autorange='reversed',
             showgrid=False,
             showticklabels=False,
             zeroline=False
         ),
-        height=800,
+        height=height,
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
         showlegend=False,
-        margin=dict(l=20, r=20, t=60, b=20),
-        plot_bgcolor=bg_color,
-        paper_bgcolor=bg_color
+        margin=dict(l=20, r=20, t=60 if title else 40, b=20)
     )
 
     return fig
@@ -0,0 +1,141 @@
+"""
+Keyset pagination over the transaction history for the tables page.
+
+Pages are addressed by the ``(date, id)`` key of their first or last row instead
+of an OFFSET: the next page is ``WHERE (date, id) > last_key``, the previous
+one ``WHERE (date, id) < first_key`` in reverse order. Both are served by
+``idx_transactions_date`` (which includes the rowid ``id``), so a page flip
+costs the same at any depth of the history. Rows come from the
+``v_transaction_list`` view (migration 007), whose stored product label saves
+the joins of the lookup tables. Filters are pushed into the WHERE clause; total counts are cached per filter set and data version, and read from
+the ``daily_pnl`` rollup when only a date range is set.
+"""
+import threading
+from datetime import timedelta
+
+from utils.db_helper import get_db, get_db_path, get_data_version
+
+PAGE_SQL = """
+    SELECT transaction_id, date, label, price, qty, tax, total_price, action, open_qty
+    FROM v_transaction_list
+    WHERE {where}
+    ORDER BY date {order}, transaction_id {order}
+    LIMIT ?
+"""
+
+# The filter columns exist under the same names in the view and in this join
+COUNT_SQL = """
+    SELECT COUNT(*)
+    FROM transactions t
+    JOIN products p ON t.product_id = p.id
+    WHERE {where}
+"""
+
+_count_lock = threading.Lock()
+_count_cache = {}
+
+
+class TransactionFilter:
+    """Filter of the transaction browser; id lists are empty for "all"."""
+
+    def __init__(self, basis_ids=(), product_type_ids=(), action_ids=(), date_from=None, date_to=None):
+        self.basis_ids = tuple(sorted(basis_ids))
+        self.product_type_ids = tuple(sorted(product_type_ids))
+        self.action_ids = tuple(sorted(action_ids))
+        self.date_from = date_from
+        self.date_to = date_to
+
+    def key(self):
+        return (self.basis_ids, self.product_type_ids, self.action_ids, self.date_from, self.date_to)
+
+    def only_dates(self):
+        return not (self.basis_ids or self.product_type_ids or self.action_ids)
+
+    def date_bounds(self):
+        """Half-open ISO bounds ``[start, end)`` of the date range (None if open)."""
+        start = self.date_from.isoformat() if self.date_from else None
+        end = (self.date_to + timedelta(days=1)).isoformat() if self.date_to else None
+        return start, end
+
+    def sql(self):
+        clauses = ["1=1"]
+        params = []
+        for column, ids in (("basis_product_id", self.basis_ids),
+                            ("product_type_id", self.product_type_ids),
+                            ("action_id", self.action_ids)):
+            if ids:
+                clauses.append(f"{column} IN ({','.join('?' * len(ids))})")
+                params.extend(ids)
+        start, end = self.date_bounds()
+        if start:
+            clauses.append("date >= ?")
+            params.append(start)
+        if end:
+            clauses.append("date < ?")
+            params.append(end)
+        return " AND ".join(clauses), params
+
+
+def fetch_page(flt, page_size, descending=True, after=None, before=None, last=False, conn=None):
+    """
+    One page of transactions in display order as ``(rows, first_key, last_key)``.
+
+    ``after`` continues behind the given ``(date, id)`` key (next page),
+    ``before`` returns the page in front of it (previous page), ``last`` the
+    final ``page_size`` rows (pass ``last_page_size`` for a page aligned to
+    the page boundaries). Without a key the first page is returned. Rows are
+    ``(id, date, name, price, qty, tax, total_price, action, open_qty)``.
+    """
+    conn = conn or get_db()
+    where, params = flt.sql()
+    # Reading backwards (previous/last page) flips the order, the rows are reversed afterwards
+    backwards = before is not None or last
+    ascending = descending == backwards
+    key = after if after is not None else before
+    if key is not None:
+        forward_op = "<" if descending else ">"
+        op = forward_op if after is not None else {"<": ">", ">": "<"}[forward_op]
+        where += f" AND (date, transaction_id) {op} (?, ?)"
+        params = params + [key[0], key[1]]
+
+    rows = [tuple(row) for row in conn.execute(
+        PAGE_SQL.format(where=where, order="ASC" if ascending else "DESC"), params + [page_size]
+    ).fetchall()]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+    return rows, (rows[0][1], rows[0][0]), (rows[-1][1], rows[-1][0])
+
+
+def last_page_size(total, page_size):
+    """Rows on the last of the ``page_size`` pages of ``total`` rows (``fetch_page(..., last=True)``)."""
+    return total - (max(1, -(-total // page_size)) - 1) * page_size or page_size
+
+
+def count_transactions(flt, conn=None):
+    """Number of transactions matching ``flt``, cached per database, filter set and data version."""
+    version = get_data_version()
+    cache_key = (get_db_path(), flt.key())
+    with _count_lock:
+        cached = _count_cache.get(cache_key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    conn = conn or get_db()
+    if flt.only_dates():
+        # Date ranges only: sum of the pre-aggregated daily counts
+        start, end = flt.date_bounds()
+        total = conn.execute(
+            "SELECT COALESCE(SUM(trade_count), 0) FROM daily_pnl WHERE date >= ? AND date < ?",
+            (start or "0000-00-00", end or "9999-99-99")
+        ).fetchone()[0]
+    else:
+        where, params = flt.sql()
+        total = conn.execute(COUNT_SQL.format(where=where), params).fetchone()[0]
+
+    with _count_lock:
+        if len(_count_cache) > 256:
+            _count_cache.clear()
+        _count_cache[cache_key] = (version, total)
+    return total
@@ -0,0 +1,240 @@
+"""
+Black-Scholes pricing and Greeks of the open warrant positions.
+
+All functions work on NumPy arrays, so a whole book of warrants is priced in
+one pass: ``black_scholes`` returns value, delta, gamma, vega and theta of
+European calls and puts, ``implied_volatility`` solves the volatility of
+market prices with a vectorized Newton iteration that falls back to
+bisection inside a bracket where Newton would leave it. The normal CDF comes
+from ``scipy.special.ndtr`` when SciPy is installed, otherwise from a NumPy
+approximation (absolute error below 1.5e-7).
+
+``price_open_warrants`` prices the open Call/Put positions of product type
+"Warrant" with the quotes of ``utils.valuation``: the underlying's spot price
+comes from the spot prices of the quote source (``read_spots``, by the
+underlying's name, e.g. ``DAX``), the warrant's own quote (by WKN) gives the
+implied volatility. Without a warrant quote
+``PRICING_VOLATILITY`` is used. Prices and Greeks are per warrant, i.e.
+multiplied with the product's ratio (``products.ratio``, migration 009; 1 if
+not set). Positions without expiry date or spot price are counted but not
+priced. The result is cached per database, quote state, data version and day.
+"""
+import os
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils.db_helper import get_db, get_db_path, get_data_version
+from utils.valuation import get_quote_source
+
+try:
+    from scipy.special import ndtr as _ndtr
+except ImportError:
+    _ndtr = None
+
+PRICING_RATE = float(os.environ.get("PRICING_RATE", "0.02"))
+PRICING_VOLATILITY = float(os.environ.get("PRICING_VOLATILITY", "0.3"))
+
+WARRANT_TYPE = "Warrant"
+CALL, PUT = "Call", "Put"
+DAYS_PER_YEAR = 365.0
+MIN_VOLATILITY, MAX_VOLATILITY = 1e-4, 5.0
+
+WARRANTS_SQL = """
+    SELECT po.trade_id, po.label, po.open_qty, po.price_paid,
+           v.wkn, v.basis_product, v.direction, v.strike, v.expiry_date, p.ratio
+    FROM positions po
+    JOIN v_products v ON v.product_id = po.product_id
+    JOIN products p ON p.id = po.product_id
+    WHERE v.product_type = ? AND v.direction IN (?, ?)
+"""
+
+_lock = threading.Lock()
+_cache = {}
+
+_SQRT_2PI = np.sqrt(2.0 * np.pi)
+
+
+def has_scipy():
+    return _ndtr is not None
+
+
+def norm_cdf(x):
+    if _ndtr is not None:
+        return _ndtr(x)
+    # Abramowitz & Stegun 7.1.26 for erf(|x| / sqrt(2))
+    z = np.abs(x) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / _SQRT_2PI
+
+
+def black_scholes(spot, strike, years, rate, volatility, is_call):
+    """
+    Value and Greeks of European options (arrays broadcast against each
+    other). Returns a dict of arrays: ``value``, ``delta``, ``gamma``,
+    ``vega`` (per 1.0 volatility) and ``theta`` (per year). Expired options
+    (``years <= 0``) are worth their intrinsic value and have no time Greeks.
+    """
+    spot, strike, years, volatility, is_call = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (spot, strike, years, volatility)), np.asarray(is_call, dtype=bool))
+    live = years > 0
+    t = np.where(live, years, 1.0)
+    sigma = np.where(live, volatility, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqrt_t = np.sqrt(t)
+        d1 = (np.log(spot / strike) + (rate + 0.5 * sigma * sigma) * t) / (sigma * sqrt_t)
+        d2 = d1 - sigma * sqrt_t
+        discount = np.exp(-rate * t)
+        pdf = norm_pdf(d1)
+        cdf_d1, cdf_d2 = norm_cdf(d1), norm_cdf(d2)
+        value = np.where(is_call, spot * cdf_d1 - strike * discount * cdf_d2,
+                         strike * discount * (1.0 - cdf_d2) - spot * (1.0 - cdf_d1))
+        delta = np.where(is_call, cdf_d1, cdf_d1 - 1.0)
+        gamma = pdf / (spot * sigma * sqrt_t)
+        vega = spot * pdf * sqrt_t
+        decay = -spot * pdf * sigma / (2.0 * sqrt_t)
+        theta = np.where(is_call, decay - rate * strike * discount * cdf_d2,
+                         decay + rate * strike * discount * (1.0 - cdf_d2))
+
+    intrinsic = np.where(is_call, np.maximum(spot - strike, 0.0), np.maximum(strike - spot, 0.0))
+    in_the_money = np.where(is_call, spot > strike, spot < strike)
+    return {
+        "value": np.where(live, value, intrinsic),
+        "delta": np.where(live, delta, np.where(in_the_money, np.where(is_call, 1.0, -1.0), 0.0)),
+        "gamma": np.where(live, gamma, 0.0),
+        "vega": np.where(live, vega, 0.0),
+        "theta": np.where(live, theta, 0.0),
+    }
+
+
+def implied_volatility(price, spot, strike, years, rate, is_call, tol=1e-6, max_iter=50):
+    """
+    Volatility at which ``black_scholes`` matches ``price`` (arrays). NaN
+    where the price lies outside the no-arbitrage bounds, the option has
+    expired or the iteration did not converge within ``max_iter`` steps.
+    """
+    price, spot, strike, years, is_call = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (price, spot, strike, years)), np.asarray(is_call, dtype=bool))
+    # Solved on flat copies, so scalars work as well
+    shape = price.shape
+    price, spot, strike, years, is_call = (a.ravel() for a in (price, spot, strike, years, is_call))
+    with np.errstate(invalid="ignore"):
+        discounted = strike * np.exp(-rate * np.where(years > 0, years, 0.0))
+        lower = np.where(is_call, np.maximum(spot - discounted, 0.0), np.maximum(discounted - spot, 0.0))
+        upper = np.where(is_call, spot, discounted)
+        solvable = (years > 0) & (price > lower) & (price < upper)
+
+    low = np.full(price.shape, MIN_VOLATILITY)
+    high = np.full(price.shape, MAX_VOLATILITY)
+    sigma = np.full(price.shape, 0.3)
+    active = solvable.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        greeks = black_scholes(spot[active], strike[active], years[active], rate, sigma[active], is_call[active])
+        diff = greeks["value"] - price[active]
+        low[active] = np.where(diff < 0, sigma[active], low[active])
+        high[active] = np.where(diff > 0, sigma[active], high[active])
+        converged = np.abs(diff) < tol
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = sigma[active] - diff / greeks["vega"]
+        bisect = 0.5 * (low[active] + high[active])
+        inside = np.isfinite(newton) & (newton > low[active]) & (newton < high[active])
+        sigma[active] = np.where(converged, sigma[active], np.where(inside, newton, bisect))
+        active[np.flatnonzero(active)[converged]] = False
+    return np.where(solvable & ~active, sigma, np.nan).reshape(shape)
+
+
+# ----- open warrant positions -----
+
+class Pricing:
+    __slots__ = ("positions", "totals")
+
+    def __init__(self, positions, totals):
+        self.positions = positions
+        self.totals = totals
+
+
+def load_warrant_positions(conn=None):
+    conn = conn or get_db()
+    return pd.read_sql_query(WARRANTS_SQL, conn, params=(WARRANT_TYPE, CALL, PUT))
+
+
+def price_positions(positions, quotes, spots, today=None, rate=PRICING_RATE, volatility=PRICING_VOLATILITY):
+    """
+    Prices the warrant ``positions`` (``load_warrant_positions``) with the
+    latest warrant ``quotes`` (by WKN) and ``spots`` of the underlyings. Adds ``spot, years, volatility, implied, value,
+    delta, gamma, vega, theta`` per warrant and the position figures
+    ``position_value``, ``cash_delta`` (value change per +1% in the underlying),
+    ``cash_gamma`` (change of the cash delta per +1%), ``position_vega``
+    (per +1 volatility point) and ``position_theta`` (per day).
+    """
+    today = today or date.today()
+    quoted = quotes.drop_duplicates("wkn", keep="last").set_index("wkn")["price"]
+    spot_prices = spots.drop_duplicates("underlying", keep="last").set_index("underlying")["price"]
+    spot = spot_prices.reindex(positions["basis_product"].str.upper().to_numpy()).to_numpy(dtype=float)
+    market = quoted.reindex(positions["wkn"].fillna("").str.upper().to_numpy()).to_numpy(dtype=float)
+    expiry = pd.to_datetime(positions["expiry_date"], errors="coerce")
+    years = ((expiry - pd.Timestamp(today)).dt.days / DAYS_PER_YEAR).to_numpy(dtype=float)
+    ratio = positions["ratio"].fillna(1.0).to_numpy(dtype=float)
+    strike = positions["strike"].to_numpy(dtype=float)
+    is_call = (positions["direction"] == CALL).to_numpy()
+    qty = positions["open_qty"].to_numpy(dtype=float)
+
+    priced = ~np.isnan(spot) & ~np.isnan(years) & ~np.isnan(strike)
+    implied = np.full(len(positions), np.nan)
+    has_market = priced & ~np.isnan(market)
+    if has_market.any():
+        implied[has_market] = implied_volatility(market[has_market] / ratio[has_market], spot[has_market],
+                                                 strike[has_market], years[has_market], rate, is_call[has_market])
+    sigma = np.where(np.isnan(implied), volatility, implied)
+
+    greeks = {name: np.full(len(positions), np.nan) for name in ("value", "delta", "gamma", "vega", "theta")}
+    if priced.any():
+        result = black_scholes(spot[priced], strike[priced], years[priced], rate, sigma[priced], is_call[priced])
+        for name, values in result.items():
+            greeks[name][priced] = values * ratio[priced]
+
+    positions = positions.assign(
+        spot=spot, years=years, volatility=np.where(priced, sigma, np.nan), implied=implied, **greeks,
+        position_value=qty * greeks["value"],
+        cash_delta=qty * greeks["delta"] * spot * 0.01,
+        cash_gamma=qty * greeks["gamma"] * (spot * 0.01) ** 2,
+        position_vega=qty * greeks["vega"] * 0.01,
+        position_theta=qty * greeks["theta"] / DAYS_PER_YEAR,
+    )
+    totals = {
+        "positions": len(positions),
+        "priced": int(priced.sum()),
+        "implied": int((~np.isnan(implied)).sum()),
+        "value": float(np.nansum(positions["position_value"])),
+        "cash_delta": float(np.nansum(positions["cash_delta"])),
+        "cash_gamma": float(np.nansum(positions["cash_gamma"])),
+        "vega": float(np.nansum(positions["position_vega"])),
+        "theta": float(np.nansum(positions["position_theta"])),
+    }
+    return Pricing(positions, totals)
+
+
+def price_open_warrants(source=None):
+    """Pricing of the open warrant positions, cached per database, quote state, data version and day."""
+    source = source or get_quote_source()
+    key = (get_db_path(), source.key())
+    state = (source.token(), get_data_version(), date.today())
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+
+    pricing = price_positions(load_warrant_positions(), source.read(), source.read_spots())
+    with _lock:
+        _cache[key] = (state, pricing)
+    return pricing
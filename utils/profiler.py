@@ -0,0 +1,209 @@
+"""
+Opt-in render profiler for the Streamlit pages.
+
+Enabled with ``PROFILE_PAGES=1`` (all reruns) or, when the diagnostics are
+enabled (``DIAGNOSTICS_ENABLED=1``), with the query parameter ``?profile=1``
+(the reruns of one browser session). A page run is wrapped in
+``profile_page(name)``, named parts of it in ``section(name)``:
+
+    with profile_page("overview"):
+        with section("load_data"):
+            df = load_data()
+
+Page scripts without a ``main()`` call ``begin(name)`` after
+``st.set_page_config`` and ``end()`` as their last statement instead, so the
+page body keeps its indentation.
+
+Every profiled rerun records its wall time, the time per section and the peak
+traced memory (tracemalloc, process-wide) in a rolling window per page, shown on
+the diagnostics page. tracemalloc runs only while a profiled rerun is active and
+is stopped again after the last one (unless it was already tracing before).
+Reruns ended by ``st.rerun()`` / ``st.stop()`` are recorded up to that point;
+with ``begin()`` the skipped ``end()`` is made up by the next ``begin()`` on the
+script thread or, at the latest, when the script thread exits.
+``PROFILE_PAGES=cprofile`` or ``?profile=cprofile`` also writes a cProfile dump
+per rerun to ``PROFILE_DIR`` (default ``/app/logs``, or ``./logs`` outside the
+container); ``pyinstrument`` writes an HTML report when pyinstrument is
+installed. When profiling is off, ``section`` is a shared no-op context manager.
+"""
+import contextlib
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+WINDOW = 500
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/app/logs" if os.path.isdir("/app/logs") else "./logs")
+MODES = ("1", "true", "cprofile", "pyinstrument")
+
+_lock = threading.Lock()
+_runs = {}
+_local = threading.local()
+_NO_OP = contextlib.nullcontext()
+
+# Active profiled reruns and whether this module started tracemalloc for them
+_tracing = {"active": 0, "started": False}
+
+
+def _query_param_allowed():
+    return os.environ.get("DIAGNOSTICS_ENABLED", "0") in ("1", "true", "True")
+
+
+def _start_tracing():
+    with _lock:
+        if _tracing["active"] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing["started"] = True
+        _tracing["active"] += 1
+    tracemalloc.reset_peak()
+
+
+def _stop_tracing():
+    with _lock:
+        _tracing["active"] -= 1
+        if _tracing["active"] == 0 and _tracing["started"]:
+            tracemalloc.stop()
+            _tracing["started"] = False
+
+
+def _requested_mode():
+    """Profiling mode of the current rerun (None if off)."""
+    mode = os.environ.get("PROFILE_PAGES", "").lower()
+    if mode in MODES:
+        return mode
+    if not _query_param_allowed():
+        return None
+    try:
+        import streamlit as st
+        mode = (st.query_params.get("profile") or "").lower()
+    except Exception:
+        return None
+    return mode if mode in MODES else None
+
+
+class PageProfile:
+    def __init__(self, page, mode):
+        self.page = page
+        self.mode = mode
+        self.sections = {}
+        self._started = None
+        self._dumper = None
+
+    def __enter__(self):
+        _local.profile = self
+        _start_tracing()
+        if self.mode == "cprofile":
+            import cProfile
+            self._dumper = cProfile.Profile()
+            try:
+                self._dumper.enable()
+            except ValueError:
+                # Another profiler is active (e.g. a concurrent session on Python >= 3.12)
+                self._dumper = None
+        elif self.mode == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                self._dumper = None
+            else:
+                self._dumper = Profiler()
+                self._dumper.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._started
+        peak = tracemalloc.get_traced_memory()[1]
+        _stop_tracing()
+        if getattr(_local, "profile", None) is self:
+            _local.profile = None
+        if self._dumper is not None:
+            self._dump()
+
+        run = {
+            "time": time.time(),
+            "wall_ms": wall * 1000,
+            "peak_mb": peak / 1024 / 1024,
+            "sections": dict(self.sections),
+        }
+        with _lock:
+            _runs.setdefault(self.page, deque(maxlen=WINDOW)).append(run)
+        return False
+
+    @contextlib.contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[name] = self.sections.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def _dump(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        if self.mode == "cprofile":
+            self._dumper.disable()
+            self._dumper.dump_stats(os.path.join(PROFILE_DIR, f"{self.page}_{stamp}.prof"))
+        else:
+            self._dumper.stop()
+            with open(os.path.join(PROFILE_DIR, f"{self.page}_{stamp}.html"), "w") as f:
+                f.write(self._dumper.output_html())
+
+
+def profile_page(page):
+    """Context manager that profiles one rerun of ``page`` when profiling is requested."""
+    mode = _requested_mode()
+    return PageProfile(page, mode) if mode else _NO_OP
+
+
+class _OpenRun:
+    """A rerun started with ``begin()``; closed once, by ``end()`` or when it is dropped."""
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def close(self):
+        profile, self.profile = self.profile, None
+        if profile is not None:
+            profile.__exit__(None, None, None)
+
+    __del__ = close
+
+
+def begin(page):
+    """
+    Starts profiling a rerun of ``page`` when profiling is requested. A run of
+    the same thread that was not ended (``st.rerun()`` / ``st.stop()`` before
+    ``end()``) is closed first.
+    """
+    end()
+    mode = _requested_mode()
+    if mode:
+        _local.open_run = _OpenRun(PageProfile(page, mode).__enter__())
+
+
+def end():
+    """Ends the rerun started with ``begin()`` on this thread (no-op if none)."""
+    run = getattr(_local, "open_run", None)
+    _local.open_run = None
+    if run is not None:
+        run.close()
+
+
+def section(name):
+    """Times a named part of the current page run (no-op without an active profile)."""
+    profile = getattr(_local, "profile", None)
+    return profile.section(name) if profile is not None else _NO_OP
+
+
+def get_page_profiles():
+    """Recorded runs per page (oldest first)."""
+    with _lock:
+        return {page: list(runs) for page, runs in _runs.items()}
+
+
+def reset_page_profiles():
+    with _lock:
+        _runs.clear()
@@ -0,0 +1,224 @@
+"""
+Per-statement query statistics for the pooled connections of ``utils.db_helper``.
+
+``InstrumentedCursor`` times ``execute``/``executemany`` and the ``fetch*``
+calls that follow (rows consumed by iterating are counted, not timed), counts
+the returned rows and records one sample per execution under the
+normalised SQL text (whitespace collapsed, literals replaced by ``?``). Samples
+slower than ``DATABASE_SLOW_QUERY_MS`` are logged together with their
+``EXPLAIN QUERY PLAN`` and kept in a bounded slow-query log.
+
+The overhead is a ``perf_counter`` pair and a dictionary update per call; the
+normalised text is cached per distinct SQL string. Instrumentation can be
+switched off with ``DATABASE_QUERY_STATS=0``.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+ENABLED = os.environ.get("DATABASE_QUERY_STATS", "1") not in ("0", "false", "False", "")
+SLOW_QUERY_MS = float(os.environ.get("DATABASE_SLOW_QUERY_MS", "250"))
+SAMPLES_PER_STATEMENT = 512
+SLOW_LOG_SIZE = 200
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_normalised = {}
+_statements = {}
+_slow_log = deque(maxlen=SLOW_LOG_SIZE)
+_plans = {}
+
+logger = logging.getLogger("options_tracker.queries")
+
+
+def normalize_sql(sql):
+    """Statement key: literals as ``?``, IN lists as ``IN (...)``, single spaces."""
+    key = _normalised.get(sql)
+    if key is None:
+        key = _STRING_LITERAL.sub("?", sql)
+        key = _NUMBER_LITERAL.sub("?", key)
+        key = _IN_LIST.sub("IN (...)", key)
+        key = _WHITESPACE.sub(" ", key).strip()
+        if len(_normalised) > 4096:
+            _normalised.clear()
+        _normalised[sql] = key
+    return key
+
+
+class StatementStats:
+    __slots__ = ("sql", "count", "total", "max", "rows", "samples")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLES_PER_STATEMENT)
+
+    def add(self, elapsed, rows):
+        self.count += 1
+        self.total += elapsed
+        self.rows += rows
+        if elapsed > self.max:
+            self.max = elapsed
+        self.samples.append(elapsed)
+
+    def p95(self):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+def _explain(conn, sql, params):
+    key = normalize_sql(sql)
+    plan = _plans.get(key)
+    if plan is None:
+        if sql.lstrip()[:6].upper() not in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT"):
+            return ""
+        try:
+            cursor = sqlite3.Cursor(conn)
+            rows = cursor.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            plan = "\n".join(str(row[3]) for row in rows)
+        except sqlite3.Error as e:
+            plan = f"(no plan: {e})"
+        _plans[key] = plan
+    return plan
+
+
+def record(conn, sql, params, elapsed, rows):
+    """Adds one execution of ``sql`` to the statistics."""
+    key = normalize_sql(sql)
+    with _lock:
+        stats = _statements.get(key)
+        if stats is None:
+            stats = _statements[key] = StatementStats(key)
+        stats.add(elapsed, rows)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        plan = _explain(conn, sql, params if isinstance(params, (tuple, list, dict)) else ())
+        _slow_log.append({"time": time.time(), "sql": key, "ms": elapsed * 1000, "rows": rows, "plan": plan})
+        logger.warning("Slow query (%.1f ms, %d rows): %s\n%s", elapsed * 1000, rows, key, plan)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports every execution (execute + fetches) to ``record``."""
+
+    _sql = None
+
+    def _finish(self):
+        sql = self._sql
+        if sql is not None:
+            self._sql = None
+            record(self.connection, sql, self._params, self._elapsed, self._rows)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._sql, self._params, self._rows = sql, parameters, 0
+            self._elapsed = time.perf_counter() - start
+        # Statements without a result set are complete after execute
+        if self.description is None:
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+        record(self.connection, sql, (), elapsed, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            if row is None:
+                self._finish()
+            else:
+                self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        # Iteration only counts rows; timing every row would cost more than the fetch itself
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+def get_query_stats():
+    """Aggregated statistics per normalised statement, slowest total first."""
+    with _lock:
+        rows = [
+            {
+                "sql": s.sql,
+                "count": s.count,
+                "total_ms": s.total * 1000,
+                "mean_ms": s.total / s.count * 1000 if s.count else 0.0,
+                "p95_ms": s.p95() * 1000,
+                "max_ms": s.max * 1000,
+                "rows": s.rows,
+            }
+            for s in _statements.values()
+        ]
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+
+def get_slow_queries():
+    return list(_slow_log)
+
+
+def reset_query_stats():
+    with _lock:
+        _statements.clear()
+        _slow_log.clear()
+        _plans.clear()
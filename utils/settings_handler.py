@@ -1,7 +1,16 @@
-from utils.db_helper import get_db
 import importlib
+import os
 import streamlit as st
 
+from utils.db_helper import DEFAULT_USER, normalize_tenant_user, set_current_user
+from utils.settings_store import (FIELDS, SettingsConflict, get_settings, load_settings, save_settings,
+                                  init_settings_table)
+
+# Where the user of a session comes from: off (single user), header (set by an
+# authenticating reverse proxy) or auth (Streamlit's built-in login, st.login)
+TENANT_MODE = os.environ.get("TENANT_MODE", "off")
+TENANT_HEADER = os.environ.get("TENANT_HEADER", "X-Forwarded-User")
+
 LANGUAGES = {
         "English": "en",
         "Deutsch": "de"
@@ -34,59 +43,52 @@ def get_theme_mode():
                                           index=list(THEME.values()).index(st.session_state.theme_mode))
     st.session_state.theme_mode = THEME[theme_mode_display]
 
-def init_settings_db():
-    conn = get_db()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-            user_id TEXT PRIMARY KEY,
-            language_code TEXT DEFAULT 'de',
-            tax_rate REAL DEFAULT 0.0,
-            date_format TEXT DEFAULT '%d.%m.%Y',
-            tax_allowance REAL DEFAULT 0.0,
-            loss_carryforward REAL DEFAULT 0.0
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-
-def load_settings(user_id="default"):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT language_code, tax_rate, date_format, tax_allowance, loss_carryforward, theme_mode FROM settings WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if row:
-        return {
-            "language_code": row[0],
-            "tax_rate": row[1],
-            "date_format": row[2],
-            "tax_allowance": row[3],
-            "loss_carryforward": row[4],
-            "theme_mode": row[5]
-        }
+def _translations():
+    return importlib.import_module(f"lang.{st.session_state.get('language_code', 'en')}").translations
+
+
+def init_user():
+    """
+    Selects the database of the session's user for this script run; called at
+    the top of every page, before the first database access.
+    """
+    if TENANT_MODE == "header":
+        user_id = st.context.headers.get(TENANT_HEADER)
+        if not user_id:
+            st.error(_translations()["tenant_unknown_user"].format(header=TENANT_HEADER))
+            st.stop()
+    elif TENANT_MODE == "auth":
+        if not st.user.get("is_logged_in", False):
+            T = _translations()
+            st.info(T["tenant_login_required"])
+            st.button(T["tenant_login"], on_click=st.login)
+            st.stop()
+        user_id = st.user.get("email") or st.user.get("sub")
+        st.sidebar.button(_translations()["tenant_logout"], on_click=st.logout)
     else:
-        save_settings({"language_code": "en", "tax_rate": 0.0, "date_format": "%d.%m.%Y", "tax_allowance": 0.0, "loss_carryforward": 0.0, "theme_mode":"Dark"}, user_id)
-        return load_settings(user_id)
-
-
-def save_settings(settings, user_id="default"):
-    conn = get_db()
-    conn.execute("""
-        INSERT INTO settings (user_id, language_code, tax_rate, date_format, tax_allowance, loss_carryforward, theme_mode)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET
-            language_code=excluded.language_code,
-            tax_rate=excluded.tax_rate,
-            date_format=excluded.date_format,
-            tax_allowance=excluded.tax_allowance,
-            loss_carryforward=excluded.loss_carryforward,
-            theme_mode=excluded.theme_mode
-    """, (user_id, settings["language_code"], settings["tax_rate"], settings["date_format"], settings["tax_allowance"],
-          settings["loss_carryforward"], settings["theme_mode"]))
-    conn.commit()
-    conn.close()
+        user_id = DEFAULT_USER
+
+    try:
+        if TENANT_MODE != "off":
+            # Signed-in users never get the shared default database
+            user_id = normalize_tenant_user(user_id)
+        user_id = set_current_user(user_id)
+    except ValueError:
+        st.error(_translations()["tenant_invalid_user"].format(user=user_id))
+        st.stop()
+
+    if st.session_state.get("user_id") not in (None, user_id):
+        # Another user in the same browser session: drop the preferences of the previous one
+        for key in FIELDS + ("settings_version",):
+            st.session_state.pop(key, None)
+    st.session_state.user_id = user_id
+    if TENANT_MODE != "off":
+        st.sidebar.caption(_translations()["tenant_signed_in"].format(user=user_id))
+    return user_id
+
+def init_settings_db():
+    init_settings_table()
+
 
 if __name__=="__main__":
     if "theme_mode" not in st.session_state:
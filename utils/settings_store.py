@@ -0,0 +1,239 @@
+"""
+Write-through settings cache.
+
+``get_settings(user_id)`` returns a read-only ``Settings`` object from an
+in-process cache shared by all sessions of the server, so settings reads on the
+pages and in the tax calculation do not touch SQLite. Writes go through
+``save_settings`` and ``update_tax_state``, which persist the row and replace
+the cached object with the stored values in the same call.
+
+Every write increases the ``version`` column of the settings row. A cached
+entry older than ``SETTINGS_TTL_SECONDS`` (default 5) is revalidated with a
+single ``SELECT version``, so changes made by other processes (e.g.
+``python -m utils.tax_replay --apply``) are picked up without reloading the row
+on every read. ``save_settings`` only writes the given fields and, when the
+caller passes the version it has read, only if the row is still at that
+version (``SettingsConflict`` otherwise), so a form saved in one session does
+not overwrite a change made meanwhile in another. ``user_id`` defaults to the current user of the thread (see
+``utils.db_helper.set_current_user``), whose row lives in that user's database.
+The module does not import streamlit and can be used from the CLI tools.
+"""
+import os
+import threading
+import time
+
+from utils.db_helper import get_db, get_db_path, get_current_user
+
+SETTINGS_TTL = float(os.environ.get("SETTINGS_TTL_SECONDS", "5"))
+
+FIELDS = ("language_code", "tax_rate", "date_format", "tax_allowance", "loss_carryforward", "theme_mode")
+DEFAULTS = {
+    "language_code": "en",
+    "tax_rate": 0.0,
+    "date_format": "DD.MM.YYYY",
+    "tax_allowance": 0.0,
+    "loss_carryforward": 0.0,
+    "theme_mode": "Dark",
+}
+
+COLUMNS = ", ".join(FIELDS)
+SELECT_SQL = f"SELECT {COLUMNS}, version FROM settings WHERE user_id = ?"
+
+# None keeps the stored value; the version check is skipped when no version is given
+SAVE_SQL = f"""
+    UPDATE settings
+    SET language_code = COALESCE(?, language_code),
+        tax_rate = COALESCE(?, tax_rate),
+        date_format = COALESCE(?, date_format),
+        tax_allowance = COALESCE(?, tax_allowance),
+        loss_carryforward = COALESCE(?, loss_carryforward),
+        theme_mode = COALESCE(?, theme_mode),
+        version = version + 1
+    WHERE user_id = ? AND (? IS NULL OR version = ?)
+    RETURNING {COLUMNS}, version
+"""
+
+INSERT_DEFAULTS_SQL = f"""
+    INSERT INTO settings (user_id, {COLUMNS}, version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+    ON CONFLICT(user_id) DO NOTHING
+"""
+
+TAX_STATE_SQL = f"""
+    UPDATE settings
+    SET loss_carryforward = COALESCE(?, loss_carryforward),
+        tax_allowance = COALESCE(?, tax_allowance),
+        version = version + 1
+    WHERE user_id = ?
+    RETURNING {COLUMNS}, version
+"""
+
+_lock = threading.Lock()
+_cache = {}
+_ready = set()
+
+
+class SettingsConflict(Exception):
+    """The settings row was changed since the version the caller has read."""
+
+    def __init__(self, user_id, expected_version):
+        super().__init__(f"Settings of '{user_id}' changed since version {expected_version}")
+        self.user_id = user_id
+        self.expected_version = expected_version
+
+
+class Settings:
+    """Settings of one user. Read-only; changed through save_settings / update_tax_state."""
+
+    __slots__ = ("user_id", "version") + FIELDS
+
+    def __init__(self, user_id, language_code, tax_rate, date_format, tax_allowance, loss_carryforward, theme_mode,
+                 version=0):
+        self.user_id = user_id
+        self.language_code = language_code or DEFAULTS["language_code"]
+        self.tax_rate = float(tax_rate or 0.0)
+        self.date_format = date_format or DEFAULTS["date_format"]
+        self.tax_allowance = float(tax_allowance or 0.0)
+        self.loss_carryforward = float(loss_carryforward or 0.0)
+        self.theme_mode = theme_mode or DEFAULTS["theme_mode"]
+        self.version = version or 0
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def __repr__(self):
+        return f"Settings({self.user_id!r}, version={self.version}, {self.as_dict()})"
+
+
+def init_settings_table(conn=None):
+    """Creates the settings table if needed (once per database file and process)."""
+    path = get_db_path()
+    if path in _ready:
+        return
+    conn = conn or get_db()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            user_id TEXT PRIMARY KEY,
+            language_code TEXT DEFAULT 'en',
+            tax_rate REAL DEFAULT 0.0,
+            date_format TEXT DEFAULT 'DD.MM.YYYY',
+            tax_allowance REAL DEFAULT 0.0,
+            loss_carryforward REAL DEFAULT 0.0,
+            theme_mode TEXT DEFAULT 'Dark',
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.commit()
+    _ready.add(path)
+
+
+def _store(settings):
+    """Caches ``settings`` unless a newer version is already cached."""
+    key = (get_db_path(), settings.user_id)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None or entry[0].version <= settings.version:
+            _cache[key] = [settings, time.monotonic()]
+    return settings
+
+
+def _load(conn, user_id):
+    row = conn.execute(SELECT_SQL, (user_id,)).fetchone()
+    if row is None:
+        # Missing row: store the defaults (another session may have been faster)
+        conn.execute(INSERT_DEFAULTS_SQL, (user_id, *(DEFAULTS[f] for f in FIELDS)))
+        conn.commit()
+        row = conn.execute(SELECT_SQL, (user_id,)).fetchone()
+    return Settings(user_id, *row)
+
+
+def get_settings(user_id=None):
+    """Cached settings of ``user_id``; touches the database only after the TTL expired."""
+    user_id = user_id or get_current_user()
+    key = (get_db_path(), user_id)
+    entry = _cache.get(key)
+    now = time.monotonic()
+    if entry is not None and now - entry[1] < SETTINGS_TTL:
+        return entry[0]
+
+    conn = get_db()
+    init_settings_table(conn)
+    if entry is not None:
+        row = conn.execute("SELECT version FROM settings WHERE user_id = ?", (user_id,)).fetchone()
+        if row is not None and row[0] == entry[0].version:
+            entry[1] = now
+            return entry[0]
+    return _store(_load(conn, user_id))
+
+
+def load_settings(user_id=None):
+    """Settings of ``user_id`` as a dict (see get_settings)."""
+    return get_settings(user_id).as_dict()
+
+
+def save_settings(settings, user_id=None, expected_version=None):
+    """
+    Persists the fields present in ``settings`` (dict or Settings); missing
+    fields and None keep their stored values. With ``expected_version`` (for a
+    Settings object: its version) the row is only written if it is still at
+    that version, otherwise ``SettingsConflict`` is raised. Updates the cache.
+    """
+    user_id = user_id or get_current_user()
+    if isinstance(settings, Settings):
+        if expected_version is None:
+            expected_version = settings.version
+        settings = settings.as_dict()
+    conn = get_db()
+    init_settings_table(conn)
+    conn.execute(INSERT_DEFAULTS_SQL, (user_id, *(DEFAULTS[f] for f in FIELDS)))
+    rows = conn.execute(SAVE_SQL, (*(settings.get(f) for f in FIELDS), user_id,
+                                   expected_version, expected_version)).fetchall()
+    conn.commit()
+    if not rows:
+        invalidate_settings(user_id)
+        raise SettingsConflict(user_id, expected_version)
+    return _store(Settings(user_id, *rows[0]))
+
+
+def read_tax_state(conn, user_id=None):
+    """
+    Tax rate, remaining allowance and loss carryforward straight from the
+    settings row (uncached), for bookings that update the tax state inside
+    their own transaction.
+    """
+    user_id = user_id or get_current_user()
+    row = conn.execute("SELECT tax_rate, tax_allowance, loss_carryforward FROM settings WHERE user_id = ?",
+                       (user_id,)).fetchone()
+    if row is None:
+        return DEFAULTS["tax_rate"], DEFAULTS["tax_allowance"], DEFAULTS["loss_carryforward"]
+    return float(row[0] or 0.0), float(row[1] or 0.0), float(row[2] or 0.0)
+
+
+def update_tax_state(loss_carryforward=None, tax_allowance=None, user_id=None, conn=None):
+    """
+    Writes loss carryforward and/or remaining tax allowance (None keeps the
+    stored value) in one statement. Without ``conn`` the change is committed and
+    cached; with ``conn`` it joins the caller's transaction, and the caller calls
+    invalidate_settings after committing.
+    """
+    user_id = user_id or get_current_user()
+    own = conn is None
+    conn = conn or get_db()
+    init_settings_table(conn)
+    if own:
+        # Create the row with the defaults first, so the update never misses
+        get_settings(user_id)
+    rows = conn.execute(TAX_STATE_SQL, (loss_carryforward, tax_allowance, user_id)).fetchall()
+    if not own:
+        return None
+    conn.commit()
+    return _store(Settings(user_id, *rows[0]))
+
+
+def invalidate_settings(user_id=None):
+    """Drops the cached settings of ``user_id`` (all users if None)."""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop((get_db_path(), user_id), None)
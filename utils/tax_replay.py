@@ -0,0 +1,244 @@
+"""
+Full-history tax replay for loss carryforward and tax allowance.
+
+Walks all realised transactions (sell, partial sell, redemption, knock-out) in
+date order and re-applies the rules of ``sell_helper.calc_sell_tax``: a gain is
+first offset against the loss carryforward, then against the remaining yearly
+allowance, the rest is taxed with the tax rate; a loss is added to the
+carryforward. The allowance resets at the start of every tax year, the
+carryforward is carried over.
+
+The recurrence is solved with array operations instead of a Python loop: the
+carryforward ``L_i = max(L_{i-1} - g_i, 0)`` is a walk reflected at zero, i.e.
+``X_i - min(0, min_k X_k)`` with ``X = L_0 - cumsum(g)``, and the allowance used
+within a year is ``min(allowance, cumsum(excess gain))``.
+
+The state at the start of every replayed year is stored in ``tax_checkpoints``
+so that a replay can start at the year of a backdated or corrected trade.
+
+    python -m utils.tax_replay                      # show the resulting tax state
+    python -m utils.tax_replay --from 2024-03-01    # replay from the 2024 checkpoint
+    python -m utils.tax_replay --apply              # write taxes and settings state
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils.db_helper import get_db, get_current_user, set_current_user, mark_data_changed
+from utils.ledger import refresh_daily_pnl
+from utils.settings_store import get_settings, update_tax_state, invalidate_settings
+
+# Actions that realise a gain or loss (sell, partial sell, redemption, knock-out)
+REALISING_ACTION_IDS = (2, 4, 5, 6)
+DEFAULT_ANNUAL_ALLOWANCE = 1000.0
+
+REALISED_SQL = f"""
+    SELECT id AS transaction_id,
+           date,
+           CAST(substr(date, 1, 4) AS INTEGER) AS year,
+           COALESCE(gain, 0) + COALESCE(tax, 0) AS gross_gain,
+           COALESCE(tax, 0) AS tax,
+           total_price
+    FROM transactions
+    WHERE action_id IN ({','.join(str(a) for a in REALISING_ACTION_IDS)})
+      AND date >= ?
+    ORDER BY date ASC, id ASC
+"""
+
+
+def replay_gains(gross_gain, year, tax_rate, annual_allowance,
+                 opening_loss_carryforward=0.0, opening_allowance=None, first_year=None):
+    """
+    Vectorized replay over gross gains in date order.
+
+    ``opening_allowance`` is the remaining allowance in ``first_year`` (default:
+    the year of the first row and the full ``annual_allowance``); all other years
+    start with ``annual_allowance``.
+    Returns a dict of arrays: tax, loss_carryforward and tax_allowance after each
+    row, plus the per-row start indices of the tax years.
+    """
+    g = np.asarray(gross_gain, dtype=float)
+    year = np.asarray(year)
+    n = len(g)
+    if opening_allowance is None:
+        opening_allowance = annual_allowance
+    if n == 0:
+        empty = np.empty(0)
+        return {"tax": empty, "loss_carryforward": empty, "tax_allowance": empty,
+                "year_start": np.empty(0, dtype=int)}
+
+    # Loss carryforward: walk reflected at zero
+    walk = opening_loss_carryforward - np.cumsum(g)
+    loss_after = walk - np.minimum(np.minimum.accumulate(walk), 0.0)
+    loss_before = np.r_[opening_loss_carryforward, loss_after[:-1]]
+
+    # Gain left after the loss carryforward
+    excess = np.where(g > 0, g - np.minimum(loss_before, g), 0.0)
+
+    # Allowance per tax year
+    is_start = np.r_[True, year[1:] != year[:-1]]
+    year_start = np.maximum.accumulate(np.where(is_start, np.arange(n), 0))
+    cum_excess = np.cumsum(excess)
+    within_year = cum_excess - np.r_[0.0, cum_excess[:-1]][year_start]
+    first_year = year[0] if first_year is None else first_year
+    allowance_start = np.where(year == first_year, opening_allowance, annual_allowance)
+    used_cum = np.minimum(allowance_start, within_year)
+    used_before = np.where(is_start, 0.0, np.r_[0.0, used_cum[:-1]])
+
+    taxable = excess - (used_cum - used_before)
+    tax = np.where(g > 0, np.round(taxable * tax_rate, 2), 0.0)
+
+    return {
+        "tax": tax,
+        "loss_carryforward": loss_after,
+        "tax_allowance": allowance_start - used_cum,
+        "year_start": year_start,
+    }
+
+
+def _load_checkpoint(conn, year, tax_rate, annual_allowance):
+    row = conn.execute("""
+        SELECT loss_carryforward, tax_allowance
+        FROM tax_checkpoints
+        WHERE year = ? AND tax_rate = ? AND annual_allowance = ?
+    """, (year, tax_rate, annual_allowance)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def replay_taxes(from_date=None, annual_allowance=DEFAULT_ANNUAL_ALLOWANCE, tax_rate=None,
+                 opening_loss_carryforward=0.0, as_of=None, user_id=None, conn=None):
+    """
+    Replays the realised transactions and returns ``(frame, state)``.
+
+    ``frame`` has one row per realised transaction with the replayed tax, gain
+    after tax, loss carryforward and remaining allowance. ``state`` is the
+    resulting settings state (loss_carryforward, tax_allowance) as of ``as_of``
+    (default: today). With ``from_date`` the replay starts at the checkpoint of
+    that year if one exists for the same tax rate and allowance, otherwise the
+    full history is replayed.
+    """
+    conn = conn or get_db()
+    tax_rate = get_settings(user_id).tax_rate if tax_rate is None else tax_rate
+    as_of = as_of or date.today()
+
+    start = "0000-00-00"
+    first_year = None
+    opening_allowance = annual_allowance
+    if from_date is not None:
+        checkpoint = _load_checkpoint(conn, from_date.year, tax_rate, annual_allowance)
+        if checkpoint is not None:
+            start = f"{from_date.year:04d}-01-01"
+            first_year = from_date.year
+            opening_loss_carryforward, opening_allowance = checkpoint
+
+    df = pd.read_sql_query(REALISED_SQL, conn, params=(start,))
+    result = replay_gains(df["gross_gain"].to_numpy(), df["year"].to_numpy(), tax_rate, annual_allowance,
+                          opening_loss_carryforward, opening_allowance, first_year)
+
+    df["old_tax"] = df["tax"]
+    df["tax"] = result["tax"]
+    df["gain"] = df["gross_gain"] - df["tax"]
+    df["total_price"] = df["total_price"] + df["old_tax"] - df["tax"]
+    df["loss_carryforward"] = result["loss_carryforward"]
+    df["tax_allowance"] = result["tax_allowance"]
+
+    # Start state of every replayed year
+    years = df["year"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]]) if len(df) else np.empty(0, dtype=int)
+    first_year = first_year if first_year is not None else (int(years[0]) if len(df) else None)
+    checkpoints = []
+    for i in starts:
+        loss_before = opening_loss_carryforward if i == 0 else df["loss_carryforward"].iat[i - 1]
+        allowance = opening_allowance if years[i] == first_year else annual_allowance
+        checkpoints.append((int(years[i]), float(loss_before), float(allowance), annual_allowance, tax_rate))
+
+    if len(df):
+        loss_carryforward = float(df["loss_carryforward"].iat[-1])
+        tax_allowance = float(df["tax_allowance"].iat[-1])
+        last_year = int(years[-1])
+    else:
+        loss_carryforward = opening_loss_carryforward
+        tax_allowance = opening_allowance
+        last_year = first_year
+    # A new tax year has started since the last realised transaction
+    if last_year is None or as_of.year > last_year:
+        tax_allowance = annual_allowance
+
+    state = {
+        "loss_carryforward": round(loss_carryforward, 2),
+        "tax_allowance": round(tax_allowance, 2),
+        "tax_rate": tax_rate,
+        "checkpoints": checkpoints,
+    }
+    return df, state
+
+
+def apply_replay(df, state, user_id=None, update_transactions=True, conn=None):
+    """
+    Writes a replay result: changed taxes (with gain and total price) of the
+    realised transactions, the yearly checkpoints and the settings state, all in
+    one transaction. Returns the number of updated transactions.
+    """
+    user_id = user_id or get_current_user()
+    conn = conn or get_db()
+    changed = df[(df["tax"] - df["old_tax"]).abs() > 0.005] if update_transactions else df.iloc[0:0]
+    try:
+        if len(changed):
+            conn.executemany(
+                "UPDATE transactions SET tax = ?, gain = ?, total_price = ? WHERE id = ?",
+                zip(changed["tax"].round(2).tolist(), changed["gain"].round(2).tolist(),
+                    changed["total_price"].round(2).tolist(), changed["transaction_id"].tolist())
+            )
+            refresh_daily_pnl(conn, *changed["date"].tolist())
+        conn.executemany("""
+            INSERT INTO tax_checkpoints (year, loss_carryforward, tax_allowance, annual_allowance, tax_rate)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(year) DO UPDATE SET
+                loss_carryforward=excluded.loss_carryforward,
+                tax_allowance=excluded.tax_allowance,
+                annual_allowance=excluded.annual_allowance,
+                tax_rate=excluded.tax_rate
+        """, state["checkpoints"])
+        update_tax_state(state["loss_carryforward"], state["tax_allowance"], user_id, conn=conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    invalidate_settings(user_id)
+    mark_data_changed()
+    return len(changed)
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Replay loss carryforward and tax allowance over the trade history")
+    parser.add_argument("--from", dest="from_date", type=date.fromisoformat,
+                        help="replay from the checkpoint of this date's year (YYYY-MM-DD)")
+    parser.add_argument("--annual-allowance", type=float, default=DEFAULT_ANNUAL_ALLOWANCE)
+    parser.add_argument("--tax-rate", type=float, help="default: tax rate from the settings")
+    parser.add_argument("--opening-loss", type=float, default=0.0, help="loss carryforward before the first trade")
+    parser.add_argument("--apply", action="store_true", help="write taxes, checkpoints and settings state")
+    parser.add_argument("--user", default="default", help="user whose database is replayed")
+    args = parser.parse_args()
+    set_current_user(args.user)
+
+    started = time.perf_counter()
+    df, state = replay_taxes(args.from_date, args.annual_allowance, args.tax_rate, args.opening_loss,
+                             user_id=args.user)
+    elapsed = time.perf_counter() - started
+
+    changed = int(((df["tax"] - df["old_tax"]).abs() > 0.005).sum())
+    print(f"Replayed {len(df):,} realised transactions in {elapsed:.2f}s ({changed:,} with a different tax)")
+    print(f"Loss carryforward: {state['loss_carryforward']:,.2f}")
+    print(f"Tax allowance:     {state['tax_allowance']:,.2f}")
+
+    if args.apply:
+        updated = apply_replay(df, state, user_id=args.user)
+        print(f"Applied: {updated:,} transactions updated, {len(state['checkpoints'])} checkpoints stored")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Mark-to-market valuation of the open positions.
+
+Quotes are read by WKN from a local quote source, selected with
+``QUOTE_SOURCE``:
+
+* ``table`` (default) - the ``quotes`` table of the current user's database
+  (migration 008), filled with ``python -m utils.valuation load <file>``,
+* ``directory`` - CSV / JSON files dropped into ``QUOTE_DIR`` (default
+  ``data/quotes``), e.g. by a scheduled download script.
+
+Further sources are plugged in by adding a factory to ``QUOTE_SOURCES``. A
+source provides ``key()`` (what it reads), ``token()`` (a cheap value that
+changes whenever its quotes change), ``read()`` (the latest quote per WKN
+as a frame with ``wkn, ts, price, previous_close``) and ``read_spots()`` (the
+latest spot price per underlying, ``underlying, ts, price, previous_close``,
+used by ``utils.pricing``). Spot prices are kept apart from the product
+quotes (``spot_quotes`` table, migration 011), so an underlying never
+collides with a product whose WKN happens to be its name.
+
+``value_open_positions`` joins the latest quotes onto the open positions of an
+analytics snapshot and computes market value, unrealised P&L (against the cost
+of the still open lots), exposure and day change for all positions in one
+vectorized pass. The result is cached per database, quote token and snapshot,
+so reruns without new quotes or trades cost a dictionary lookup.
+
+Quote files have a header row with the columns ``wkn`` (or ``underlying`` for
+spot prices of the underlyings) and ``price`` and optionally
+``previous_close`` and ``ts`` (ISO date or timestamp; the file's
+modification time if missing). Without ``previous_close`` the day change
+compares with the last quote of an earlier day.
+
+    python -m utils.valuation load quotes.csv
+    python -m utils.valuation show --user alice
+"""
+import argparse
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.db_helper import get_db, get_db_path, set_current_user
+
+QUOTE_SOURCE = os.environ.get("QUOTE_SOURCE", "table")
+QUOTE_DIR = os.environ.get("QUOTE_DIR", os.path.join("data", "quotes"))
+QUOTE_FILE_SUFFIXES = (".csv", ".json")
+
+BUY_ACTIONS = ("buy", "rebuy")
+QUOTE_COLUMNS = ["wkn", "ts", "price", "previous_close"]
+SPOT_COLUMNS = ["underlying", "ts", "price", "previous_close"]
+
+_LATEST_SQL = """
+    SELECT q.{key},
+           q.ts,
+           q.price,
+           COALESCE(q.previous_close,
+                    (SELECT p.price FROM {table} p
+                     WHERE p.{key} = q.{key} AND p.ts < substr(q.ts, 1, 10)
+                     ORDER BY p.ts DESC LIMIT 1)) AS previous_close
+    FROM (SELECT {key}, MAX(ts) AS ts FROM {table} GROUP BY {key}) latest
+    JOIN {table} q ON q.{key} = latest.{key} AND q.ts = latest.ts
+"""
+LATEST_QUOTES_SQL = _LATEST_SQL.format(table="quotes", key="wkn")
+LATEST_SPOTS_SQL = _LATEST_SQL.format(table="spot_quotes", key="underlying")
+
+STORE_QUOTE_SQL = "INSERT OR REPLACE INTO quotes (wkn, ts, price, previous_close) VALUES (?, ?, ?, ?)"
+STORE_SPOT_SQL = "INSERT OR REPLACE INTO spot_quotes (underlying, ts, price, previous_close) VALUES (?, ?, ?, ?)"
+
+_lock = threading.Lock()
+_cache = {}
+_stats = {"hits": 0, "misses": 0}
+_source = None
+
+
+# ----- quote files -----
+
+def _normalize_ts(values):
+    return pd.to_datetime(values, format="mixed").dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _numbers(values):
+    """Numeric column; text uses the importer's rules (the last of ``,`` and ``.`` is the decimal separator)."""
+    if values.dtype.kind in "biuf":
+        return values.astype(float)
+    text = values.astype(str).str.strip()
+    decimal_comma = text.str.rfind(",") > text.str.rfind(".")
+    text = text.where(~decimal_comma, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    text = text.str.replace(",", "", regex=False)
+    return pd.to_numeric(text, errors="coerce")
+
+
+def is_spot_frame(quotes):
+    """True for spot prices of underlyings (``underlying`` column), False for product quotes (``wkn``)."""
+    return "underlying" in quotes.columns
+
+
+def read_quote_file(path):
+    """
+    Quotes of a CSV or JSON file as a frame with ``wkn, ts, price,
+    previous_close``, or spot prices with ``underlying`` instead of ``wkn``
+    when the file has an ``underlying`` column.
+    """
+    if path.endswith(".json"):
+        frame = pd.read_json(path, orient="records", dtype={"wkn": str, "underlying": str})
+    else:
+        frame = pd.read_csv(path, sep=None, engine="python", dtype={"wkn": str, "underlying": str})
+    frame.columns = [str(column).strip().lower() for column in frame.columns]
+    key = "underlying" if "underlying" in frame.columns and "wkn" not in frame.columns else "wkn"
+    missing = {key, "price"} - set(frame.columns)
+    if missing:
+        raise ValueError(f"{path}: missing column(s) {', '.join(sorted(missing))}")
+    if "ts" not in frame.columns:
+        frame["ts"] = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+    if "previous_close" not in frame.columns:
+        frame["previous_close"] = np.nan
+    frame = frame[[key, "ts", "price", "previous_close"]].dropna(subset=[key, "price"])
+    frame[key] = frame[key].str.strip().str.upper()
+    frame["ts"] = _normalize_ts(frame["ts"].astype(str))
+    frame["price"] = _numbers(frame["price"])
+    frame["previous_close"] = _numbers(frame["previous_close"])
+    return frame.dropna(subset=["price"])
+
+
+def latest_quotes(quotes, key="wkn"):
+    """
+    Latest quote per WKN (or per ``key``, e.g. ``underlying``) of a quote
+    history. A missing ``previous_close`` is filled with the last price of an
+    earlier day.
+    """
+    quotes = quotes.sort_values([key, "ts"], kind="stable")
+    latest = quotes.drop_duplicates(key, keep="last").set_index(key)
+    daily = quotes.assign(day=quotes["ts"].str[:10]).drop_duplicates([key, "day"], keep="last")
+    latest_day = latest["ts"].str[:10].reindex(daily[key].to_numpy()).to_numpy()
+    earlier = daily[daily["day"].to_numpy() < latest_day]
+    previous = earlier.drop_duplicates(key, keep="last").set_index(key)["price"]
+    latest["previous_close"] = latest["previous_close"].fillna(previous.reindex(latest.index))
+    return latest.reset_index()[[key, "ts", "price", "previous_close"]]
+
+
+# ----- quote sources -----
+
+class TableQuoteSource:
+    """The ``quotes`` table of the current user's database."""
+
+    def key(self):
+        return ("table", get_db_path())
+
+    def token(self):
+        # Counter of migration 008, increased by a trigger on every change of the quotes
+        row = get_db().execute("SELECT version FROM data_version WHERE name = 'quotes'").fetchone()
+        return row[0] if row else None
+
+    def read(self):
+        return pd.read_sql_query(LATEST_QUOTES_SQL, get_db())
+
+    def read_spots(self):
+        return pd.read_sql_query(LATEST_SPOTS_SQL, get_db())
+
+
+class DirectoryQuoteSource:
+    """CSV / JSON quote files in ``directory``; later quotes of a WKN win."""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def _files(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and entry.name.lower().endswith(QUOTE_FILE_SUFFIXES)]
+        except FileNotFoundError:
+            return []
+        return sorted(entries, key=lambda entry: entry.name)
+
+    def key(self):
+        return ("directory", self.directory)
+
+    def token(self):
+        return tuple((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in self._files())
+
+    def _read(self, spots):
+        frames = [frame for frame in (read_quote_file(entry.path) for entry in self._files())
+                  if is_spot_frame(frame) == spots]
+        columns = SPOT_COLUMNS if spots else QUOTE_COLUMNS
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return latest_quotes(pd.concat(frames, ignore_index=True), columns[0])
+
+    def read(self):
+        return self._read(spots=False)
+
+    def read_spots(self):
+        return self._read(spots=True)
+
+
+QUOTE_SOURCES = {
+    "table": TableQuoteSource,
+    "directory": lambda: DirectoryQuoteSource(QUOTE_DIR),
+}
+
+
+def get_quote_source():
+    """The configured quote source (``QUOTE_SOURCE``), created once per process."""
+    global _source
+    if _source is None:
+        if QUOTE_SOURCE not in QUOTE_SOURCES:
+            raise ValueError(f"Unknown QUOTE_SOURCE {QUOTE_SOURCE!r}, expected one of {', '.join(QUOTE_SOURCES)}")
+        _source = QUOTE_SOURCES[QUOTE_SOURCE]()
+    return _source
+
+
+def store_quotes(quotes, conn=None):
+    """
+    Writes a quote frame (``wkn, ts, price[, previous_close]``) into the
+    ``quotes`` table, or spot prices (``underlying`` instead of ``wkn``) into
+    ``spot_quotes``; returns the row count.
+    """
+    conn = conn or get_db()
+    spots = is_spot_frame(quotes)
+    quotes = quotes.reindex(columns=SPOT_COLUMNS if spots else QUOTE_COLUMNS)
+    rows = list(zip(quotes.iloc[:, 0], quotes["ts"], quotes["price"].astype(float),
+                    quotes["previous_close"].astype(float).replace({np.nan: None})))
+    conn.executemany(STORE_SPOT_SQL if spots else STORE_QUOTE_SQL, rows)
+    conn.commit()
+    return len(rows)
+
+
+# ----- valuation -----
+
+class Valuation:
+    __slots__ = ("positions", "totals")
+
+    def __init__(self, positions, totals):
+        self.positions = positions
+        self.totals = totals
+
+
+def value_positions(open_positions, df, quotes):
+    """
+    Values ``open_positions`` (``calculate_open_positions`` of the transaction
+    frame ``df``) with the latest ``quotes``. Returns a ``Valuation`` whose
+    positions frame adds ``wkn, cost, price, quote_ts, market_value,
+    unrealised, unrealised_pct, day_change`` (NaN without a quote).
+    Exposure is the market value of the quoted and the cost of the unquoted
+    positions.
+    """
+    if open_positions.empty:
+        positions = open_positions.copy()
+        return Valuation(positions, {"positions": 0, "quoted": 0, "market_value": 0.0, "cost": 0.0,
+                                     "unrealised": 0.0, "day_change": 0.0, "exposure": 0.0, "as_of": None})
+
+    trades = open_positions.index.to_numpy()
+    trade_ids = df["Trade ID"].to_numpy()
+
+    # WKN of each trade and cost of its open lots (pro rata of every buy)
+    first = ~pd.Series(trade_ids).duplicated().to_numpy()
+    wkn = pd.Series(df["wkn"].to_numpy()[first], index=trade_ids[first]).reindex(trades)
+    buys = df["action"].isin(BUY_ACTIONS).to_numpy()
+    qty = df["qty"].to_numpy(dtype=float)[buys]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        remaining = np.where(qty > 0, df["total_price"].to_numpy(dtype=float)[buys]
+                             * np.nan_to_num(df["open_qty"].to_numpy(dtype=float)[buys]) / qty, 0.0)
+    cost = pd.Series(remaining).groupby(trade_ids[buys]).sum().reindex(trades, fill_value=0.0).to_numpy()
+
+    quoted = quotes.drop_duplicates("wkn", keep="last").set_index("wkn")
+    matched = quoted.reindex(wkn.str.upper().to_numpy())
+    price = matched["price"].to_numpy(dtype=float)
+    open_qty = open_positions["open_qty"].to_numpy(dtype=float)
+    market_value = open_qty * price
+    unrealised = market_value - cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unrealised_pct = np.where(cost > 0, unrealised / cost * 100, np.nan)
+    day_change = open_qty * (price - matched["previous_close"].to_numpy(dtype=float))
+
+    positions = open_positions.assign(
+        wkn=wkn.to_numpy(), cost=cost, price=price, quote_ts=matched["ts"].to_numpy(), market_value=market_value,
+        unrealised=unrealised, unrealised_pct=unrealised_pct, day_change=day_change,
+    )
+    has_quote = ~np.isnan(price)
+    totals = {
+        "positions": len(positions),
+        "quoted": int(has_quote.sum()),
+        "market_value": float(market_value[has_quote].sum()),
+        "cost": float(cost[has_quote].sum()),
+        "unrealised": float(unrealised[has_quote].sum()),
+        "day_change": float(np.nansum(day_change)),
+        "exposure": float(np.where(has_quote, market_value, cost).sum()),
+        "as_of": matched["ts"][has_quote].max() if has_quote.any() else None,
+    }
+    return Valuation(positions, totals)
+
+
+def value_open_positions(snapshot, source=None):
+    """Valuation of the open positions of an analytics snapshot, cached per quote token and snapshot."""
+    source = source or get_quote_source()
+    key = (get_db_path(), source.key())
+    state = (source.token(), snapshot.created)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == state:
+            _stats["hits"] += 1
+            return cached[1]
+        _stats["misses"] += 1
+
+    valuation = value_positions(snapshot.open_positions, snapshot.df, source.read())
+    with _lock:
+        _cache[key] = (state, valuation)
+    return valuation
+
+
+def invalidate_valuations():
+    with _lock:
+        _cache.clear()
+
+
+def get_valuation_stats():
+    with _lock:
+        return dict(_stats, entries=len(_cache))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quotes and mark-to-market valuation of the open positions")
+    user = argparse.ArgumentParser(add_help=False)
+    user.add_argument("--user", help="user whose database is used (default: the default user)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", parents=[user], help="store quote and spot price files in the database")
+    load.add_argument("files", nargs="+")
+    commands.add_parser("show", parents=[user], help="print the valuation totals")
+    args = parser.parse_args()
+
+    if args.user:
+        set_current_user(args.user)
+    if args.command == "load":
+        for path in args.files:
+            print(f"{path}: {store_quotes(read_quote_file(path)):,} quotes")
+        return
+
+    from utils.analytics_worker import build_snapshot
+    totals = value_open_positions(build_snapshot()).totals
+    for name, value in totals.items():
+        print(f"{name:>13}: {value:,.2f}" if isinstance(value, float) else f"{name:>13}: {value}")
+
+
+if __name__ == "__main__":
+    main()